@@ -0,0 +1,119 @@
+# Aggregates synthetic result days through the aggregator's streaming read and
+# compares peak memory with loading the day into a list first. Peak memory of
+# the streamed read should stay flat as the number of items grows.
+#
+# It then reads one scan run's results (all stamped with the same timestamp,
+# as ResultsWriter does) with simulated per-page latency, sequentially and
+# through the parallel read-shard mode, and checks both give the same totals.
+#
+#   python benchmarks/bench_aggregation.py [--items 20000 100000 400000]
+#       [--parallel-items 100000] [--workers 1 4 8 16] [--latency-ms 10]
+import argparse
+import threading
+import time
+from harness import load_lambda, measure, print_table
+
+aggregator = load_lambda('compliance-report-agregator')
+
+REGULATIONS = ['GDPR', 'HIPAA', 'PCI DSS', 'SOX', 'ISO 27001']
+RESOURCE_TYPES = ['AWS::S3::Bucket', 'AWS::EC2::Instance', 'AWS::RDS::DBInstance', 'AWS::KMS::Key']
+
+def synthetic_item(index):
+    return {
+        'ComplianceType': 'NON_COMPLIANT' if index % 3 == 0 else 'COMPLIANT',
+        'Regulation': REGULATIONS[index % len(REGULATIONS)],
+        'ResourceType': RESOURCE_TYPES[index % len(RESOURCE_TYPES)]
+    }
+
+def key_values(condition):
+    # {attribute: value(s)} of the equality and between conditions of a key condition
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        return {name: value for part in expression['values'] for name, value in key_values(part).items()}
+    key, *values = expression['values']
+    return {key.name: values[0] if len(values) == 1 else tuple(values)}
+
+class StubResultsTable:
+    # Serves `items` results dated scan_date, building each page on demand the
+    # way DynamoDB returns it, with an optional per-page latency
+    name = 'stub-results'
+
+    def __init__(self, items, scan_date, latency=0.0):
+        self.items = items
+        self.scan_date = scan_date
+        self.latency = latency
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def query(self, Limit=1000, ExclusiveStartKey=None, **kwargs):
+        time.sleep(self.latency)
+        keys = key_values(kwargs['KeyConditionExpression'])
+        if kwargs['IndexName'] == aggregator.READ_SHARD_INDEX:
+            # Item i belongs to read shard i % RESULT_READ_SHARDS of its day
+            scan_date, shard = keys['ReadShard'].split('#')
+            indexes = range(int(shard), self.items, aggregator.RESULT_READ_SHARDS)
+        else:
+            scan_date = keys['ScanDate']
+            indexes = range(self.items)
+        if scan_date != self.scan_date:
+            indexes = range(0)
+        start = ExclusiveStartKey['position'] if ExclusiveStartKey else 0
+        end = min(start + Limit, len(indexes))
+        response = {'Items': [synthetic_item(index) for index in indexes[start:end]]}
+        with self.lock:
+            self.pages += 1
+        if end < len(indexes):
+            response['LastEvaluatedKey'] = {'position': end}
+        return response
+
+def aggregate_streamed(table, start_time, end_time):
+    return aggregator.aggregate_results(aggregator.query_with_pagination(table, start_time, end_time))
+
+def aggregate_materialised(table, start_time, end_time):
+    return aggregator.aggregate_results(list(aggregator.query_with_pagination(table, start_time, end_time)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, nargs='+', default=[20000, 100000, 400000])
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--parallel-items', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--latency-ms', type=float, default=10.0, help='simulated DynamoDB latency per page')
+    args = parser.parse_args()
+    aggregator.QUERY_PAGE_SIZE = args.page_size
+    end_time = aggregator.datetime(2026, 10, 18, 12)
+    start_time = end_time - aggregator.timedelta(days=1)
+
+    rows = []
+    for items in args.items:
+        for label, func in (('materialised list', aggregate_materialised), ('streamed', aggregate_streamed)):
+            table = StubResultsTable(items, start_time.date().isoformat())
+            aggregated, elapsed, peak = measure(func, table, start_time, end_time)
+            assert aggregated['total_resources_scanned'] == items
+            rows.append([label, items, table.pages, f"{elapsed:.2f}", f"{peak:.2f}"])
+
+    print(f"{args.page_size} items per page")
+    print_table(['read', 'items', 'pages', 'seconds', 'peak MiB'], rows)
+    print()
+
+    rows = []
+    expected = None
+    for workers in args.workers:
+        table = StubResultsTable(args.parallel_items, start_time.date().isoformat(), args.latency_ms / 1000)
+        start = time.perf_counter()
+        if workers == 1:
+            label = 'sequential'
+            aggregated = aggregate_streamed(table, start_time, end_time)
+        else:
+            label = 'read shards'
+            aggregated = aggregator.aggregate_in_parallel(table, start_time, end_time, workers)
+        elapsed = time.perf_counter() - start
+        expected = expected or aggregated
+        assert aggregated == expected, 'parallel aggregate differs from the sequential one'
+        rows.append([label, workers, table.pages, f"{elapsed:.2f}", f"{args.parallel_items / elapsed:,.0f}"])
+
+    print(f"{args.parallel_items} results from one scan run, {args.latency_ms} ms per page")
+    print_table(['read', 'workers', 'pages', 'seconds', 'items/s'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Streams a stubbed non-compliant-index holding 100k findings over two scan
+# dates through the PDF generator's findings appendix. Compares peak memory of
+# the streamed read with loading every finding into a sorted list, and renders
+# the streamed appendix to show render time per row and memory stay flat.
+#
+#   python benchmarks/bench_findings_appendix.py [--findings 100000] [--resources-per-result 10]
+import argparse
+import time
+from datetime import datetime
+from harness import load_lambda, measure, print_table
+
+PAGE_SIZE = 500
+
+class StubNonCompliantIndex:
+    # Serves the non-compliant-index of two scan dates. The previous day holds
+    # every result, the report day re-scans every other one, so half of the
+    # results appear on both dates and must be listed once. A quarter of the
+    # results became compliant on the report day; they are only in the base
+    # table and must not be listed. Pages are built on demand like query
+    # responses.
+    name = 'compliance-results'
+
+    def __init__(self, results, resources_per_result, scan_dates, latency):
+        self.meta = self
+        self.client = self
+        self.results = results
+        self.resources_per_result = resources_per_result
+        self.scan_dates = scan_dates
+        self.latency = latency
+        self.queries = 0
+
+    def result_indexes(self, scan_date):
+        step = 1 if scan_date == self.scan_dates[0] else 2
+        return range(0, self.results, step)
+
+    def listed_results(self):
+        return sum(1 for index in range(self.results) if index % 4 != 1)
+
+    def result_id(self, index):
+        return f"primary-scanner#{111122220000 + index // 1000:012d}#us-east-1#CIS#RULE-{index:06d}"
+
+    def batch_get_item(self, RequestItems):
+        time.sleep(self.latency)
+        request = RequestItems[self.name]
+        found = []
+        for key in request['Keys']:
+            index = int(key['ResultId'].rsplit('-', 1)[1])
+            if key['ScanDate'] == self.scan_dates[1] and index % 4 in (0, 1, 2):
+                found.append({'ResultId': key['ResultId']})
+        return {'Responses': {self.name: found}}
+
+    def item(self, index, scan_date):
+        account = f"{111122220000 + index // 1000:012d}"
+        rule = f"RULE-{index:06d}"
+        return {
+            'ResultId': self.result_id(index),
+            'ScanDate': scan_date,
+            'NonCompliantScanDate': scan_date,
+            'AccountId': account,
+            'Region': 'us-east-1',
+            'Regulation': 'CIS',
+            'RuleId': rule,
+            'ResourceType': 'AWS::S3::Bucket',
+            'NonCompliantResources': [f"bucket-{index:06d}-{resource:03d}" for resource in range(self.resources_per_result)]
+        }
+
+    def query(self, IndexName, KeyConditionExpression, ExclusiveStartKey=None, Limit=None, **kwargs):
+        assert IndexName == 'non-compliant-index'
+        self.queries += 1
+        time.sleep(self.latency)
+        scan_date = KeyConditionExpression.get_expression()['values'][1]
+        indexes = self.result_indexes(scan_date)
+        start = ExclusiveStartKey['position'] if ExclusiveStartKey else 0
+        end = min(start + PAGE_SIZE, len(indexes))
+        response = {'Items': [self.item(indexes[position], scan_date) for position in range(start, end)]}
+        if end < len(indexes):
+            response['LastEvaluatedKey'] = {'position': end}
+        return response
+
+class CountingOutput:
+    # Discards the rendered PDF, keeping only its size
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+def load_sorted_list(report_lambda, table, start, end):
+    # The previous approach: every finding in one list, sorted before rendering
+    return len(sorted(report_lambda.load_findings(table, start, end)))
+
+def stream(report_lambda, table, start, end):
+    return sum(1 for _ in report_lambda.load_findings(table, start, end))
+
+def render(report_lambda, table, start, end, data):
+    output = CountingOutput()
+    report_lambda.generate_pdf_report(data, end, output, report_lambda.load_findings(table, start, end))
+    return output.size
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--findings', type=int, default=100000)
+    parser.add_argument('--resources-per-result', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='simulated query latency per page')
+    args = parser.parse_args()
+
+    report_lambda = load_lambda('pdf-compliance-report-generation')
+    start, end = datetime(2024, 1, 1, 6), datetime(2024, 1, 2, 6)
+    results = args.findings // args.resources_per_result
+    table = StubNonCompliantIndex(results, args.resources_per_result, ['2024-01-01', '2024-01-02'], args.latency_ms / 1000)
+    data = {
+        'total_resources_scanned': results * 2,
+        'compliant_resources': results,
+        'non_compliant_resources': results,
+        'compliance_by_regulation': {'CIS': {'compliant': results, 'non_compliant': results}},
+        'compliance_by_resource_type': {}
+    }
+
+    rows = []
+    count, elapsed, peak = measure(load_sorted_list, report_lambda, table, start, end)
+    rows.append(['sorted list', count, f"{elapsed:.2f}", '', f"{peak:.1f}"])
+    count, elapsed, peak = measure(stream, report_lambda, table, start, end)
+    rows.append(['streamed', count, f"{elapsed:.2f}", '', f"{peak:.1f}"])
+    assert count == table.listed_results() * args.resources_per_result, count
+    size, elapsed, peak = measure(render, report_lambda, table, start, end, data)
+    rows.append(['streamed + PDF', count, f"{elapsed:.2f}", f"{elapsed / count * 1000:.2f}", f"{peak:.1f}"])
+
+    print(f"{count} findings from {results} results over 2 scan dates, {PAGE_SIZE} results per page, PDF {size / (1024 * 1024):.1f} MiB")
+    print_table(['mode', 'rows', 'seconds', 'ms per row', 'peak MiB'], rows)
+
+if __name__ == '__main__':
+    main()
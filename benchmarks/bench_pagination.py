@@ -0,0 +1,70 @@
+# Streams a stubbed listing of N resources through compliance_common.pagination
+# and compares peak memory with materialising the listing, and elapsed time
+# with and without prefetching the next page.
+#
+#   python benchmarks/bench_pagination.py [--resources 100000] [--page-size 1000]
+import argparse
+import time
+from harness import measure, print_table
+from compliance_common.pagination import paginate
+
+class StubPaginator:
+    def __init__(self, resources, latency):
+        self.resources = resources
+        self.latency = latency
+
+    def paginate(self, PaginationConfig=None, **kwargs):
+        page_size = (PaginationConfig or {}).get('PageSize', 1000)
+        for start in range(0, self.resources, page_size):
+            time.sleep(self.latency)
+            # Pages are built on demand like API responses, so only pages the
+            # consumer holds on to count towards peak memory
+            yield {'Keys': [
+                {'KeyId': f"key-{index:08d}", 'KeyArn': f"arn:aws:kms:us-east-1:111122223333:key/key-{index:08d}"}
+                for index in range(start, min(start + page_size, self.resources))
+            ]}
+
+class StubKmsClient:
+    def __init__(self, resources, latency=0.0):
+        self.resources = resources
+        self.latency = latency
+
+    def can_paginate(self, operation):
+        return operation == 'list_keys'
+
+    def get_paginator(self, operation):
+        return StubPaginator(self.resources, self.latency)
+
+def consume(items, work):
+    count = 0
+    for item in items:
+        count += 1
+        if work and count % 1000 == 0:
+            time.sleep(work)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resources', type=int, default=100000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated API latency per page')
+    parser.add_argument('--work-ms', type=float, default=5.0, help='simulated processing per 1000 items')
+    args = parser.parse_args()
+    latency, work = args.latency_ms / 1000, args.work_ms / 1000
+
+    rows = []
+    def run(label, func):
+        count, elapsed, peak = measure(func)
+        assert count == args.resources, (label, count)
+        rows.append([label, count, f"{elapsed:.2f}", f"{peak:.1f}"])
+
+    client = StubKmsClient(args.resources, latency)
+    run('materialised list', lambda: consume(list(paginate(client, 'list_keys', 'Keys', page_size=args.page_size)), work))
+    run('streamed', lambda: consume(paginate(client, 'list_keys', 'Keys', page_size=args.page_size), work))
+    run('streamed + prefetch', lambda: consume(paginate(client, 'list_keys', 'Keys', page_size=args.page_size, prefetch=True), work))
+
+    print(f"{args.resources} resources, {args.page_size} per page, {args.latency_ms} ms per page, {args.work_ms} ms work per 1000 items")
+    print_table(['mode', 'items', 'seconds', 'peak MiB'], rows)
+
+if __name__ == '__main__':
+    main()
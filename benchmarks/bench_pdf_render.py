@@ -0,0 +1,61 @@
+# Renders the compliance PDF for synthetic reports with 10 to 10,000 table rows
+# in the findings appendix and prints render time and peak memory, along with
+# the cost of the content-hash check that lets an unchanged report skip
+# rendering.
+#
+#   python benchmarks/bench_pdf_render.py [--rows 10 100 1000 10000]
+import argparse
+import io
+from datetime import datetime
+from harness import load_lambda, measure, print_table
+
+REGULATIONS = ['CIS', 'GDPR', 'HIPAA', 'ISO27001', 'NIST', 'PCI-DSS', 'SOC2']
+
+def synthetic_report():
+    regulations = {
+        regulation: {'compliant': 400 + index * 37, 'non_compliant': 20 + index * 11}
+        for index, regulation in enumerate(REGULATIONS)
+    }
+    compliant = sum(values['compliant'] for values in regulations.values())
+    non_compliant = sum(values['non_compliant'] for values in regulations.values())
+    return {
+        'total_resources_scanned': compliant + non_compliant,
+        'compliant_resources': compliant,
+        'non_compliant_resources': non_compliant,
+        'compliance_by_regulation': regulations,
+        'compliance_by_resource_type': {}
+    }
+
+def synthetic_findings(rows):
+    return [
+        (f"{111122220000 + index // 1000:012d}", 'us-east-1', REGULATIONS[index % len(REGULATIONS)], f"RULE-{index % 40:03d}", 'AWS::S3::Bucket', f"bucket-{index:08d}")
+        for index in range(rows)
+    ]
+
+def render(report_lambda, data, report_time, findings):
+    output = io.BytesIO()
+    report_lambda.generate_pdf_report(data, report_time, output, findings)
+    return len(output.getbuffer())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    report_lambda = load_lambda('pdf-compliance-report-generation')
+    report_time = datetime(2024, 1, 1)
+    # The first render pays for font and style setup that every later render in the container reuses
+    data = synthetic_report()
+    render(report_lambda, data, report_time, synthetic_findings(1))
+
+    rows = []
+    for count in args.rows:
+        findings = synthetic_findings(count)
+        size, elapsed, peak = measure(render, report_lambda, data, report_time, findings)
+        _, hash_elapsed, _ = measure(report_lambda.report_content_hash, report_time, data, findings)
+        rows.append([count, f"{size / 1024:.0f}", f"{elapsed:.3f}", f"{elapsed / count * 1000:.3f}", f"{peak:.1f}", f"{hash_elapsed * 1000:.2f}"])
+
+    print_table(['rows', 'PDF KiB', 'render s', 'ms per row', 'peak MiB', 'hash check ms'], rows)
+
+if __name__ == '__main__':
+    main()
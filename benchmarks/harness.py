@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_PATH = os.path.join(ROOT, 'src', 'layers', 'compliance-common', 'python')
+LAMBDA_ROOT = os.path.join(ROOT, 'src', 'lambda')
+
+if LAYER_PATH not in sys.path:
+    sys.path.insert(0, LAYER_PATH)
+
+# Lambda modules create boto3 clients at import; no request is ever sent
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+def load_lambda(name):
+    path = os.path.join(LAMBDA_ROOT, name, f"{name}-function-lambda.py")
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def measure(func, *args, **kwargs):
+    # Returns (result, seconds, peak traced memory in MiB)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers] + rows:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
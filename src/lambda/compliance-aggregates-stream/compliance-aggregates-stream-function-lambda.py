@@ -0,0 +1,81 @@
+import boto3
+import json
+import os
+import logging
+import argparse
+import threading
+from functools import lru_cache
+from botocore.exceptions import ClientError
+from compliance_common.rolling_aggregates import apply_deltas, batch_token, compute_deltas
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+@lru_cache(maxsize=None)
+def dynamodb_client():
+    # Created on first use, so the offline replay harness can be imported and
+    # run without any AWS region or credentials configured
+    return boto3.client('dynamodb')
+
+def lambda_handler(event, context):
+    try:
+        records = event.get('Records', [])
+        deltas = compute_deltas(records)
+        applied = apply_deltas(dynamodb_client(), os.environ['ROLLING_AGGREGATES_TABLE'], deltas, batch_token(records))
+
+        logger.info(f"Applied {applied} of {len(deltas)} counter updates from {len(records)} stream records, "
+                    f"{len(deltas) - applied} already applied by an earlier attempt")
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f'Applied {len(deltas)} counter updates')
+        }
+    except Exception as e:
+        logger.error(f"Error updating rolling aggregates: {str(e)}")
+        raise
+
+class LocalAggregatesClient:
+    # Stands in for the DynamoDB client when replaying recorded stream batches,
+    # including the batch markers that stop a retried batch from adding twice
+    def __init__(self):
+        self.counters = {}
+        self.markers = {}
+        self._lock = threading.Lock()
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        key = (Key['Period']['S'], Key['Dimension']['S'])
+        marker = (key, ExpressionAttributeNames['#batch'])
+        token = ExpressionAttributeValues[':token']['S']
+        with self._lock:
+            if self.markers.get(marker) == token:
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'already applied'}}, 'UpdateItem')
+            self.markers[marker] = token
+            counters = self.counters.setdefault(key, {'compliant': 0, 'non_compliant': 0})
+            counters['compliant'] += int(ExpressionAttributeValues[':compliant']['N'])
+            counters['non_compliant'] += int(ExpressionAttributeValues[':non_compliant']['N'])
+        return {}
+
+def replay_batches(paths, client, table_name):
+    # Each file holds a recorded Lambda stream event ({'Records': [...]}) or a list of them
+    for path in paths:
+        with open(path) as f:
+            recorded = json.load(f)
+        for event in recorded if isinstance(recorded, list) else [recorded]:
+            records = event.get('Records', [])
+            apply_deltas(client, table_name, compute_deltas(records), batch_token(records))
+
+def main():
+    # Command line entry point of the replay harness; prints the replayed counters
+    parser = argparse.ArgumentParser(description='Replay recorded compliance results stream batches')
+    parser.add_argument('batches', nargs='+', help='JSON files with recorded stream events')
+    parser.add_argument('--table', help='Apply to this aggregates table instead of in memory')
+    args = parser.parse_args()
+
+    if args.table:
+        replay_batches(args.batches, dynamodb_client(), args.table)
+    else:
+        client = LocalAggregatesClient()
+        replay_batches(args.batches, client, None)
+        print(json.dumps({f"{period} {dimension}": counters for (period, dimension), counters in sorted(client.counters.items())}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,15 @@ import json
 import os
 import logging
 from datetime import datetime, timedelta
+from functools import partial, reduce
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from compliance_common.concurrency import ConcurrentExecutor
+from compliance_common.metrics import build_compliance_metrics, emit_embedded_metrics, publish_metric_batches
+from compliance_common.pagination import query_table
+from compliance_common.reports import DAILY_REPORT_TYPE, backfill_report_types
+from compliance_common.results_writer import RESULT_READ_SHARDS, read_shard_key
+from compliance_common.rolling_aggregates import CELL_FIELDS, query_rollup, query_rollup_series, read_rolling_aggregate
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -12,17 +19,55 @@ logger.setLevel(logging.INFO)
 dynamodb = boto3.resource('dynamodb')
 cloudwatch = boto3.client('cloudwatch')
 
+# Items read per query page; the aggregation holds at most two pages in memory
+QUERY_PAGE_SIZE = int(os.environ.get('QUERY_PAGE_SIZE', '1000'))
+
+# Only the attributes the aggregation reads are fetched
+AGGREGATION_ATTRIBUTES = 'ComplianceType, Regulation, ResourceType'
+
+# With more than one worker the read shards of each day in the window are
+# queried and aggregated concurrently and then merged
+READ_WORKERS = int(os.environ.get('READ_WORKERS', '1'))
+READ_SHARD_INDEX = 'read-shard-index'
+
+# When set, the report is read from the rolled-up counters maintained from the
+# results table stream instead of re-reading every result of the day
+ROLLING_AGGREGATES_TABLE = os.environ.get('ROLLING_AGGREGATES_TABLE')
+
+METRICS_NAMESPACE = 'ComplianceReports'
+
+# 'api' publishes through PutMetricData, 'emf' writes Embedded Metric Format log lines
+METRICS_MODE = os.environ.get('METRICS_MODE', 'api').lower()
+METRICS_PUBLISH_WORKERS = int(os.environ.get('METRICS_PUBLISH_WORKERS', '4'))
+
 def lambda_handler(event, context):
     try:
+        if 'rollup_query' in event:
+            return run_rollup_query(event['rollup_query'])
+
+        # One-off migration that adds stored reports to the report lookup index
+        if event.get('backfill_report_index'):
+            updated = backfill_report_types(dynamodb.Table(os.environ['COMPLIANCE_REPORT_TABLE']))
+            logger.info(f"Added report_type to {updated} stored reports")
+            return {
+                'statusCode': 200,
+                'body': json.dumps(f'Added report_type to {updated} stored reports')
+            }
+
         source_table = dynamodb.Table(os.environ['COMPLIANCE_RESULTS_TABLE'])
         report_table = dynamodb.Table(os.environ['COMPLIANCE_REPORT_TABLE'])
 
         end_time = datetime.now()
         start_time = end_time - timedelta(days=1)
 
-        results = query_with_pagination(source_table, start_time, end_time)
-
-        aggregated_data = aggregate_results(results)
+        if ROLLING_AGGREGATES_TABLE:
+            aggregated_data = read_rolling_aggregate(dynamodb.Table(ROLLING_AGGREGATES_TABLE), start_time, end_time)
+        elif READ_WORKERS > 1:
+            aggregated_data = aggregate_in_parallel(source_table, start_time, end_time, READ_WORKERS)
+        else:
+            # Results are streamed page by page into the counters rather than loaded into a list
+            results = query_with_pagination(source_table, start_time, end_time)
+            aggregated_data = aggregate_results(results)
 
         report_id = f"daily_report_{end_time.strftime('%Y%m%d')}"
         store_report(report_table, report_id, end_time, aggregated_data)
@@ -38,33 +83,97 @@ def lambda_handler(event, context):
         logger.error(f"Error generating report: {str(e)}")
         raise
 
-def query_with_pagination(table, start_time, end_time):
-    results = []
-    last_evaluated_key = None
-    while True:
-        if last_evaluated_key:
-            response = table.query(
-                IndexName='timestamp-index',
-                KeyConditionExpression=Key('timestamp').between(start_time.isoformat(), end_time.isoformat()),
-                ExclusiveStartKey=last_evaluated_key
-            )
-        else:
-            response = table.query(
-                IndexName='timestamp-index',
-                KeyConditionExpression=Key('timestamp').between(start_time.isoformat(), end_time.isoformat())
-            )
-        
-        results.extend(response['Items'])
-        last_evaluated_key = response.get('LastEvaluatedKey')
-        
-        if not last_evaluated_key:
-            break
-    
-    return results
+def run_rollup_query(query):
+    # {'start': ISO time, 'end': ISO time, 'granularity': optional 'hour' | 'day' |
+    #  'week' | 'month', 'regulation': optional, 'group_by': optional subset of CELL_FIELDS}
+    if not ROLLING_AGGREGATES_TABLE:
+        raise ValueError("ROLLING_AGGREGATES_TABLE is not configured")
+    table = dynamodb.Table(ROLLING_AGGREGATES_TABLE)
+    start_time = datetime.fromisoformat(query['start'])
+    end_time = datetime.fromisoformat(query['end'])
+    group_by = tuple(query.get('group_by', CELL_FIELDS))
+
+    if query.get('granularity'):
+        series = query_rollup_series(table, start_time, end_time, query['granularity'], query.get('regulation'), group_by)
+    else:
+        series = [(None, query_rollup(table, start_time, end_time, query.get('regulation'), group_by))]
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps([
+            {'period': period, **dict(zip(group_by, key)), **counters}
+            for period, rollup in series
+            for key, counters in sorted(rollup.items())
+        ])
+    }
+
+def query_with_pagination(table, start_time, end_time, page_size=QUERY_PAGE_SIZE):
+    # timestamp-index is partitioned by ScanDate, so query each day in the window.
+    # The next page is fetched while the current one is being aggregated.
+    scan_date = start_time.date()
+    while scan_date <= end_time.date():
+        key_condition = Key('ScanDate').eq(scan_date.isoformat()) & \
+            Key('timestamp').between(start_time.isoformat(), end_time.isoformat())
+        yield from query_table(
+            table, page_size=page_size, prefetch=True,
+            IndexName='timestamp-index',
+            KeyConditionExpression=key_condition,
+            ProjectionExpression=AGGREGATION_ATTRIBUTES
+        )
+        scan_date += timedelta(days=1)
+
+def window_read_shards(start_time, end_time):
+    # A scan run stamps all its results with one timestamp, so splitting the
+    # window by time would leave every result in one sub-range. Results are
+    # spread over read shards by ResultId instead.
+    shard_keys = []
+    scan_date = start_time.date()
+    while scan_date <= end_time.date():
+        shard_keys.extend(read_shard_key(scan_date.isoformat(), shard) for shard in range(RESULT_READ_SHARDS))
+        scan_date += timedelta(days=1)
+    return shard_keys
+
+def query_read_shard(table, start_time, end_time, shard_key, page_size=QUERY_PAGE_SIZE):
+    return query_table(
+        table, page_size=page_size,
+        IndexName=READ_SHARD_INDEX,
+        KeyConditionExpression=Key('ReadShard').eq(shard_key) &
+            Key('timestamp').between(start_time.isoformat(), end_time.isoformat()),
+        ProjectionExpression=AGGREGATION_ATTRIBUTES
+    )
+
+def aggregate_read_shard(table, start_time, end_time, shard_key):
+    return aggregate_results(query_read_shard(table, start_time, end_time, shard_key))
+
+def aggregate_in_parallel(table, start_time, end_time, workers):
+    partial_aggregates = ConcurrentExecutor(workers).map(
+        partial(aggregate_read_shard, table, start_time, end_time),
+        window_read_shards(start_time, end_time),
+        'result read shards'
+    )
+    return reduce(merge_aggregations, partial_aggregates, aggregate_results([]))
+
+def merge_aggregations(left, right):
+    return {
+        'total_resources_scanned': left['total_resources_scanned'] + right['total_resources_scanned'],
+        'compliant_resources': left['compliant_resources'] + right['compliant_resources'],
+        'non_compliant_resources': left['non_compliant_resources'] + right['non_compliant_resources'],
+        'compliance_by_regulation': merge_category_aggregations(left['compliance_by_regulation'], right['compliance_by_regulation']),
+        'compliance_by_resource_type': merge_category_aggregations(left['compliance_by_resource_type'], right['compliance_by_resource_type'])
+    }
+
+def merge_category_aggregations(left, right):
+    merged = {key: dict(counts) for key, counts in left.items()}
+    for key, counts in right.items():
+        if key not in merged:
+            merged[key] = {'compliant': 0, 'non_compliant': 0}
+        merged[key]['compliant'] += counts['compliant']
+        merged[key]['non_compliant'] += counts['non_compliant']
+    return merged
 
 def aggregate_results(results):
     aggregated_data = {
-        'total_resources_scanned': len(results),
+        'total_resources_scanned': 0,
         'compliant_resources': 0,
         'non_compliant_resources': 0,
         'compliance_by_regulation': {},
@@ -72,6 +181,7 @@ def aggregate_results(results):
     }
 
     for item in results:
+        aggregated_data['total_resources_scanned'] += 1
         update_aggregation(aggregated_data, item)
 
     return aggregated_data
@@ -101,6 +211,7 @@ def store_report(table, report_id, timestamp, data):
         table.put_item(
             Item={
                 'report_id': report_id,
+                'report_type': DAILY_REPORT_TYPE,
                 'timestamp': timestamp.isoformat(),
                 'data': json.dumps(data)
             }
@@ -110,22 +221,14 @@ def store_report(table, report_id, timestamp, data):
         raise
 
 def publish_metrics(data):
+    metric_data = build_compliance_metrics(data)
+    if METRICS_MODE == 'emf':
+        lines = emit_embedded_metrics(METRICS_NAMESPACE, metric_data)
+        logger.info(f"Emitted {len(metric_data)} metrics as {lines} embedded metric log lines")
+        return
     try:
-        cloudwatch.put_metric_data(
-            Namespace='ComplianceReports',
-            MetricData=[
-                {
-                    'MetricName': 'TotalResourcesScanned',
-                    'Value': data['total_resources_scanned'],
-                    'Unit': 'Count'
-                },
-                {
-                    'MetricName': 'ComplianceRate',
-                    'Value': (data['compliant_resources'] / data['total_resources_scanned']) * 100 if data['total_resources_scanned'] > 0 else 0,
-                    'Unit': 'Percent'
-                }
-            ]
-        )
+        calls = publish_metric_batches(cloudwatch, METRICS_NAMESPACE, metric_data, METRICS_PUBLISH_WORKERS)
+        logger.info(f"Published {len(metric_data)} metrics in {calls} PutMetricData calls")
     except ClientError as e:
         logger.error(f"Error publishing CloudWatch metrics: {str(e)}")
         # Don't raise here, as this is not critical for report generation
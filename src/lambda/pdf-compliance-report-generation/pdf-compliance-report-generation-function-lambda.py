@@ -1,45 +1,156 @@
 import boto3
 import json
+import csv
+import hashlib
+import heapq
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import groupby, islice
+from operator import itemgetter
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
+from compliance_common.concurrency import ConcurrentExecutor
+from compliance_common.pagination import query_table
+from compliance_common.reports import get_latest_report
+from compliance_common.s3_upload import MultipartUploadSink
 import io
 import os
 import logging
 
+# pyarrow is only needed for the Parquet export; without it that format is skipped
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 dynamodb = boto3.resource('dynamodb')
 s3 = boto3.client('s3')
 
+# Styles are built once per container and shared by every report it renders
+styles = getSampleStyleSheet()
+styles.add(ParagraphStyle(name='Justify', alignment=1))
+
+def build_table_style(header_font_size, font_size):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, 0), font_size),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('BOTTOMPADDING', (0, -1), (-1, -1), 6),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+SUMMARY_TABLE_STYLE = build_table_style(14, 12)
+REGULATION_TABLE_STYLE = build_table_style(12, 10)
+FINDINGS_TABLE_STYLE = build_table_style(8, 8)
+FINDINGS_TABLE_STYLE.add('FONTSIZE', (0, 1), (-1, -1), 7)
+FINDINGS_TABLE_STYLE.add('TOPPADDING', (0, 1), (-1, -1), 2)
+FINDINGS_TABLE_STYLE.add('BOTTOMPADDING', (0, 1), (-1, -1), 2)
+
+# The findings appendix is split into tables of this many rows, each with its
+# own header. Fixed column widths spare reportlab from measuring every cell,
+# so rendering time grows linearly with the number of findings.
+FINDINGS_ROWS_PER_TABLE = int(os.environ.get('FINDINGS_ROWS_PER_TABLE', '250'))
+FINDINGS_HEADER = ["Account", "Region", "Regulation", "Rule", "Resource Type", "Resource ID"]
+FINDINGS_COLUMN_WIDTHS = [62, 52, 56, 50, 88, 160]
+
+# Sparse index of the results table holding only non-compliant results, keyed
+# by scan date and ordered by ResultId
+NON_COMPLIANT_INDEX = 'non-compliant-index'
+
+# Results read from the index before checking the results table for newer scans
+# of them, each check a single BatchGetItem call of at most 100 keys
+LATEST_CHECK_RESULTS = 100
+
+# Object metadata key holding the hash of the content a report was rendered from
+CONTENT_HASH_METADATA_KEY = 'content-hash'
+
+# Written to <REPORT_PREFIX><date>/ once every format of the date is stored. It
+# records the content hash and the stored formats, so a run with unchanged
+# content can skip rendering whichever formats are configured.
+MANIFEST_NAME = 'manifest.json'
+
+# Size of each multipart upload part, which bounds the upload buffer
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE_MB', '8')) * 1024 * 1024
+
+# Every format is rendered from the same loaded data, concurrently, and stored
+# as <REPORT_PREFIX><date>/compliance_report_<date>.<format>
+REPORT_FORMATS = [fmt.strip() for fmt in os.environ.get('REPORT_FORMATS', 'pdf,csv,json,parquet').split(',') if fmt.strip()]
+REPORT_PREFIX = os.environ.get('REPORT_PREFIX', 'reports/')
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+EXPORT_COLUMNS = ['report_date', 'dimension', 'name', 'compliant', 'non_compliant', 'compliance_rate']
+
 def lambda_handler(event, context):
     try:
         # Fetch the latest compliance data
         compliance_data = get_latest_compliance_data()
-        
-        # Generate the PDF
-        pdf_buffer = generate_pdf_report(compliance_data)
-        
-        # Save the PDF to S3
-        report_date = datetime.now().strftime("%Y%m%d")
-        filename = f"compliance_report_{report_date}.pdf"
-        s3.put_object(
-            Bucket=os.environ['REPORT_BUCKET'],
-            Key=filename,
-            Body=pdf_buffer.getvalue(),
-            ContentType='application/pdf',
-            ServerSideEncryption='AES256'
+
+        report_time = datetime.now()
+        report_date = report_time.strftime("%Y%m%d")
+        manifest_key = f"{REPORT_PREFIX}{report_date}/{MANIFEST_NAME}"
+        bucket = os.environ['REPORT_BUCKET']
+
+        formats = [fmt for fmt in REPORT_FORMATS if fmt != 'parquet' or pyarrow is not None]
+        if len(formats) < len(REPORT_FORMATS):
+            logger.warning("pyarrow is not available, skipping the Parquet export")
+
+        # Every non-compliant resource of the report window is listed in an appendix
+        # when the results table is configured. The findings are never held in
+        # memory; they are streamed from the results table each time they are
+        # read, once for the content hash and once for the PDF.
+        findings = None
+        if os.environ.get('COMPLIANCE_RESULTS_TABLE'):
+            results_table = dynamodb.Table(os.environ['COMPLIANCE_RESULTS_TABLE'])
+            findings = partial(load_findings, results_table, report_time - timedelta(days=1), report_time)
+
+        # The same date and data render the same reports, so reports that are
+        # already stored for unchanged content are not rendered again
+        content_hash = report_content_hash(report_time, compliance_data, findings() if findings else None)
+        manifest = get_report_manifest(bucket, manifest_key)
+        if manifest and manifest.get('content_hash') == content_hash and set(formats) <= set(manifest.get('reports', {})):
+            logger.info(f"Reports for {report_date} are unchanged, skipping rendering")
+            return {
+                'statusCode': 200,
+                'body': json.dumps(f'Reports for {report_date} are unchanged')
+            }
+
+        # Every format, the PDF included, is rendered and uploaded by its own worker
+        report = {'data': compliance_data, 'findings': findings, 'report_time': report_time}
+        keys = ConcurrentExecutor(len(formats)).map(
+            lambda fmt: upload_report(bucket, report_key(report_date, fmt), fmt, report, content_hash),
+            formats,
+            'report formats'
         )
+        put_report_manifest(bucket, manifest_key, report_time, content_hash, dict(zip(formats, keys)))
         
-        logger.info(f"Report generated and saved as {filename}")
+        logger.info(f"Report generated and saved as {', '.join(keys)}")
         return {
             'statusCode': 200,
-            'body': json.dumps(f'Report generated and saved as {filename}')
+            'body': json.dumps(f'Report generated and saved as {", ".join(keys)}')
         }
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
@@ -48,38 +159,194 @@ def lambda_handler(event, context):
 def get_latest_compliance_data():
     try:
         table = dynamodb.Table(os.environ['COMPLIANCE_REPORT_TABLE'])
-        response = table.query(
-            IndexName='TimestampIndex',
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('timestamp').lte(datetime.now().isoformat()),
-            ScanIndexForward=False,
-            Limit=1
-        )
-        if not response['Items']:
+        report = get_latest_report(table)
+        if not report:
             raise ValueError("No compliance data found")
-        return json.loads(response['Items'][0]['data'])
+        return json.loads(report['data'])
     except ClientError as e:
         logger.error(f"Error fetching compliance data: {str(e)}")
         raise
 
-def generate_pdf_report(data):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+def report_key(report_date, extension):
+    return f"{REPORT_PREFIX}{report_date}/compliance_report_{report_date}.{extension}"
+
+def upload_report(bucket, key, fmt, report, content_hash):
+    # Each format is written straight into an S3 upload, which sends parts as they fill
+    with MultipartUploadSink(
+        s3, bucket, key,
+        part_size=UPLOAD_PART_SIZE,
+        ContentType=CONTENT_TYPES[fmt],
+        ServerSideEncryption='AES256',
+        Metadata={CONTENT_HASH_METADATA_KEY: content_hash}
+    ) as report_file:
+        REPORT_WRITERS[fmt](report, report_file)
+    return key
+
+def export_rows(data, report_time):
+    report_date = report_time.strftime('%Y-%m-%d')
+    rows = [(report_date, 'total', '', data['compliant_resources'], data['non_compliant_resources'])]
+    for dimension, category in (('regulation', 'compliance_by_regulation'), ('resource_type', 'compliance_by_resource_type')):
+        for name, values in sorted(data.get(category, {}).items()):
+            rows.append((report_date, dimension, name, values['compliant'], values['non_compliant']))
+    return [
+        dict(zip(EXPORT_COLUMNS, (*row, round((row[3] / (row[3] + row[4])) * 100, 2) if row[3] + row[4] > 0 else 0)))
+        for row in rows
+    ]
+
+def write_pdf_report(report, output):
+    findings = report['findings']() if report['findings'] else None
+    generate_pdf_report(report['data'], report['report_time'], output, findings)
+
+def write_csv_report(report, output):
+    text = io.StringIO()
+    writer = csv.DictWriter(text, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(export_rows(report['data'], report['report_time']))
+    output.write(text.getvalue().encode('utf-8'))
+
+def write_json_report(report, output):
+    output.write(json.dumps({
+        'report_date': report['report_time'].strftime('%Y-%m-%d'),
+        'data': report['data']
+    }).encode('utf-8'))
+
+def write_parquet_report(report, output):
+    rows = export_rows(report['data'], report['report_time'])
+    table = pyarrow.Table.from_pylist(rows, schema=pyarrow.schema([
+        ('report_date', pyarrow.string()),
+        ('dimension', pyarrow.string()),
+        ('name', pyarrow.string()),
+        ('compliant', pyarrow.int64()),
+        ('non_compliant', pyarrow.int64()),
+        ('compliance_rate', pyarrow.float64())
+    ]))
+    pyarrow.parquet.write_table(table, output)
+
+def report_content_hash(report_time, data, findings=None):
+    content = json.dumps({'report_date': report_time.strftime('%Y-%m-%d'), 'data': data}, sort_keys=True)
+    digest = hashlib.sha256(content.encode('utf-8'))
+    for finding in findings or []:
+        digest.update('\0'.join(finding).encode('utf-8'))
+    return digest.hexdigest()
+
+def load_findings(table, start_time, end_time):
+    # Yields one row per non-compliant resource, streamed page by page from the
+    # non-compliant-index of every scan date in the window. Each date's results
+    # are ordered by ResultId, so merging the dates brings the results of a rule
+    # in one account and region together, and only the latest of them is listed.
+    # A later compliant result is not in the index, so a result from an earlier
+    # date is dropped when the results table holds a newer scan of it.
+    scan_dates = []
+    scan_date = start_time.date()
+    while scan_date <= end_time.date():
+        scan_dates.append(scan_date.isoformat())
+        scan_date += timedelta(days=1)
+    results = heapq.merge(*[
+        query_table(
+            table, prefetch=True,
+            IndexName=NON_COMPLIANT_INDEX,
+            KeyConditionExpression=Key('NonCompliantScanDate').eq(date)
+        )
+        for date in scan_dates
+    ], key=itemgetter('ResultId'))
+    latest = (max(versions, key=itemgetter('ScanDate')) for _, versions in groupby(results, key=itemgetter('ResultId')))
+    while True:
+        chunk = list(islice(latest, LATEST_CHECK_RESULTS))
+        if not chunk:
+            return
+        superseded = rescanned_result_ids(table, [
+            (result['ResultId'], date) for result in chunk for date in scan_dates if date > result['ScanDate']
+        ])
+        for result in chunk:
+            if result['ResultId'] in superseded:
+                continue
+            for resource_id in sorted({str(resource_id) for resource_id in result.get('NonCompliantResources') or []}):
+                yield (
+                    result.get('AccountId', ''),
+                    result.get('Region', ''),
+                    result['Regulation'],
+                    result['RuleId'],
+                    result['ResourceType'],
+                    resource_id
+                )
+
+def rescanned_result_ids(table, keys):
+    # ResultIds of the (ResultId, ScanDate) keys that exist in the results table
+    found = set()
+    for start in range(0, len(keys), LATEST_CHECK_RESULTS):
+        request = {table.name: {
+            'Keys': [{'ResultId': result_id, 'ScanDate': scan_date} for result_id, scan_date in keys[start:start + LATEST_CHECK_RESULTS]],
+            'ProjectionExpression': 'ResultId'
+        }}
+        while request:
+            response = table.meta.client.batch_get_item(RequestItems=request)
+            found.update(item['ResultId'] for item in response['Responses'].get(table.name, []))
+            request = response.get('UnprocessedKeys')
+    return found
+
+def build_findings_tables(findings):
+    findings = iter(findings)
+    while True:
+        rows = [list(finding) for finding in islice(findings, FINDINGS_ROWS_PER_TABLE)]
+        if not rows:
+            return
+        table = Table([FINDINGS_HEADER] + rows, colWidths=FINDINGS_COLUMN_WIDTHS, repeatRows=1)
+        table.setStyle(FINDINGS_TABLE_STYLE)
+        yield table
+
+class PendingFlowables:
+    # Placeholder in a flowable list for flowables built only once the layout reaches them
+    def __init__(self, flowables):
+        self.flowables = flowables
+
+class StreamingDocTemplate(SimpleDocTemplate):
+    # Expands PendingFlowables one flowable at a time, so a long findings
+    # appendix holds only the table being laid out rather than every table
+    def filterFlowables(self, flowables):
+        if isinstance(flowables[0], PendingFlowables):
+            flowable = next(flowables[0].flowables, None)
+            if flowable is None:
+                flowables[0] = None
+            else:
+                flowables.insert(0, flowable)
+
+def get_report_manifest(bucket, key):
+    try:
+        return json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        logger.error(f"Error reading report manifest: {str(e)}")
+        raise
+
+def put_report_manifest(bucket, key, report_time, content_hash, reports):
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps({
+            'report_date': report_time.strftime('%Y-%m-%d'),
+            'content_hash': content_hash,
+            'reports': reports
+        }).encode('utf-8'),
+        ContentType='application/json',
+        ServerSideEncryption='AES256'
+    )
+
+def generate_pdf_report(data, report_time, output, findings=None):
+    doc = StreamingDocTemplate(output, pagesize=letter, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
     elements = []
     
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Justify', alignment=1))
-    
     # Title
     elements.append(Paragraph("Compliance Report", styles['Title']))
     elements.append(Spacer(1, 12))
     
     # Date
-    elements.append(Paragraph(f"Report Date: {datetime.now().strftime('%Y-%m-%d')}", styles['Normal']))
+    elements.append(Paragraph(f"Report Date: {report_time.strftime('%Y-%m-%d')}", styles['Normal']))
     elements.append(Spacer(1, 12))
     
     # Summary
     elements.append(Paragraph("Executive Summary", styles['Heading2']))
-    summary_text = f"This report provides an overview of our compliance status as of {datetime.now().strftime('%Y-%m-%d')}. "
+    summary_text = f"This report provides an overview of our compliance status as of {report_time.strftime('%Y-%m-%d')}. "
     summary_text += f"Out of {data['total_resources_scanned']} resources scanned, {data['compliant_resources']} are compliant "
     summary_text += f"and {data['non_compliant_resources']} are non-compliant with our security policies."
     elements.append(Paragraph(summary_text, styles['Justify']))
@@ -93,22 +360,7 @@ def generate_pdf_report(data):
         ["Non-Compliant Resources", data['non_compliant_resources']]
     ]
     summary_table = Table(summary_data)
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, -1), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    summary_table.setStyle(SUMMARY_TABLE_STYLE)
     elements.append(summary_table)
     elements.append(Spacer(1, 12))
     
@@ -120,25 +372,27 @@ def generate_pdf_report(data):
         rate = (values['compliant'] / total) * 100 if total > 0 else 0
         reg_data.append([reg, values['compliant'], values['non_compliant'], f"{rate:.2f}%"])
     reg_table = Table(reg_data)
-    reg_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('TOPPADDING', (0, 1), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, -1), (-1, -1), 6),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    reg_table.setStyle(REGULATION_TABLE_STYLE)
     elements.append(reg_table)
     
+    # Appendix: Non-Compliant Resources
+    if findings is not None:
+        elements.append(PageBreak())
+        elements.append(Paragraph("Appendix: Non-Compliant Resources", styles['Heading2']))
+        tables = build_findings_tables(findings)
+        first_table = next(tables, None)
+        if first_table is not None:
+            elements.extend([first_table, PendingFlowables(tables)])
+        else:
+            elements.append(Paragraph("No non-compliant resources were found.", styles['Normal']))
+    
     # Generate the PDF
     doc.build(elements)
-    buffer.seek(0)
-    return buffer
+
+# Every report format is rendered by one of these from the same loaded data
+REPORT_WRITERS = {
+    'pdf': write_pdf_report,
+    'csv': write_csv_report,
+    'json': write_json_report,
+    'parquet': write_parquet_report
+}
@@ -1,64 +1,251 @@
 import boto3
 import json
 import logging
+import os
+import time
+from functools import partial
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from compliance_common.check_registry import CheckRegistry, create_result
+from compliance_common.clients import ServiceClients
+from compliance_common.concurrency import ConcurrentExecutor, is_throttling_error
+from compliance_common.incremental import group_changes_by_scope, load_last_result, merge_resource_changes, parse_change_events
+from compliance_common.inventory_cache import InventoryCache, cache_scope
+from compliance_common.pagination import paginate
+from compliance_common.results_writer import ResultsWriter, build_result_id
+from compliance_common.rule_registry import load_rule_registry
+from compliance_common.sharding import create_shard_clients, select_shard_rules, summarize_shard_results, tag_shard_result
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Maximum number of concurrent per-resource API calls
+SCAN_CONCURRENCY = int(os.environ.get('SCAN_CONCURRENCY', '16'))
+
+# Role assumed in member accounts when scanning a shard for another account
+SCAN_ROLE_NAME = os.environ.get('SCAN_ROLE_NAME')
+
+# Size the connection pool so concurrent per-resource calls don't queue on it
+client_config = Config(max_pool_connections=SCAN_CONCURRENCY)
+
+SCANNED_SERVICES = {
+    'config': 'config',
+    'ec2': 'ec2',
+    'rds': 'rds',
+    's3': 's3',
+    'cloudtrail': 'cloudtrail',
+    'kms': 'kms',
+    'iam': 'iam',
+    'elb': 'elbv2',
+    'redshift': 'redshift',
+    'ssm': 'ssm',
+    'guardduty': 'guardduty',
+    'shield': 'shield',
+    'wafv2': 'wafv2',
+    'macie': 'macie2',
+    'secrets_manager': 'secretsmanager',
+    'inspector': 'inspector2'
+}
+
+SCANNER_SOURCE = 'primary-compliance-scanner'
+
 dynamodb = boto3.resource('dynamodb')
-config = boto3.client('config')
-ec2 = boto3.client('ec2')
-rds = boto3.client('rds')
-s3 = boto3.client('s3')
-cloudtrail = boto3.client('cloudtrail')
-kms = boto3.client('kms')
-iam = boto3.client('iam')
-elb = boto3.client('elbv2')
+default_clients = ServiceClients(SCANNED_SERVICES, client_config=client_config)
+
+# Full inventories are shared between scanner containers through the optional
+# INVENTORY_CACHE_TABLE and kept in-process between warm invocations
+shared_inventory_cache = InventoryCache(
+    dynamodb.Table(os.environ['INVENTORY_CACHE_TABLE']) if os.environ.get('INVENTORY_CACHE_TABLE') else None
+)
+
+# Inventory name for AWS Config rule compliance; it is keyed by configRuleName
+# and loaded for the rules' Config rule names rather than through the cache.
+CONFIG_COMPLIANCE_INVENTORY = 'config_rule_compliance'
+
+# DescribeComplianceByConfigRule accepts at most 25 rule names per call
+CONFIG_RULE_NAMES_PER_CALL = 25
+
+# When enabled, the batched Config lookup is also run rule by rule and both
+# timings are logged. This doubles the Config calls, so it is for diagnostics only.
+COMPARE_CONFIG_LOOKUP = os.environ.get('COMPARE_CONFIG_LOOKUP', 'false').lower() == 'true'
 
 def lambda_handler(event, context):
     try:
-        # Get all rules from DynamoDB
+        # Get all rules from DynamoDB, compiled once per warm container. Rules
+        # without a check plugin are left out when compiling.
         rules_table = dynamodb.Table('regulation-dynamo-compliance-rules')
-        response = rules_table.scan()
-        rules = response['Items']
+        registry = load_rule_registry(rules_table, check_registry.bind)
+        rules = registry.evaluable
+        results_table = dynamodb.Table(os.environ['COMPLIANCE_RESULTS_TABLE'])
         
-        compliance_results = []
+        # Configuration change events only re-evaluate the resources that changed
+        changes = parse_change_events(event)
+        if changes:
+            return run_incremental_scan(registry, changes, results_table)
+        
+        # A shard from the scan coordinator limits the scan to one account,
+        # region and rule group
+        shard = event.get('shard')
+        if shard:
+            rules = select_shard_rules(rules, shard)
+            clients = create_shard_clients(shard, SCANNED_SERVICES, SCAN_ROLE_NAME, client_config)
+        else:
+            clients = default_clients
+        
+        # Load every inventory the rules need exactly once for this invocation
+        fetch_plan = build_fetch_plan(rules)
+        snapshot = load_inventory_snapshot(fetch_plan, clients, cache_scope(shard.get('account_id') if shard else None, clients.region))
+        shared_inventory_cache.log_stats()
         
-        for rule in rules:
-            result = check_compliance(rule)
-            compliance_results.append(result)
+        compliance_results = []
         
-        # TODO: Store compliance results
+        with ResultsWriter(results_table, SCANNER_SOURCE) as results_writer:
+            for rule in rules:
+                result = tag_shard_result(check_compliance(rule, snapshot), shard)
+                compliance_results.append(result)
+                if result:
+                    results_writer.write(result)
         
-        return {
+        response = {
             'statusCode': 200,
             'body': json.dumps(f'Scanned {len(compliance_results)} rules across multiple regulations')
         }
+        if shard:
+            # Results are already in the results table; the coordinator only
+            # needs their counts and keys
+            response['shard_summary'] = summarize_shard_results([result for result in compliance_results if result], SCANNER_SOURCE)
+        return response
     except Exception as e:
         logger.error(f"Error in resource scanner: {str(e)}")
         raise
 
-def check_compliance(rule):
-    resource_type = rule['ResourceType']
-    compliance_check = json.loads(rule['ComplianceCheck'])
-    
-    if compliance_check['type'] == 'AWSConfig':
-        return check_aws_config(rule)
-    elif compliance_check['type'] == 'CustomCheck':
-        return check_custom(rule)
-    else:
-        logger.warning(f"Unknown compliance check type: {compliance_check['type']}")
+def run_incremental_scan(registry, changes, results_table):
+    compliance_results = []
+    with ResultsWriter(results_table, SCANNER_SOURCE) as results_writer:
+        for work_unit, scoped_changes in group_changes_by_scope(changes, SCAN_ROLE_NAME):
+            if work_unit:
+                clients = create_shard_clients(work_unit, SCANNED_SERVICES, SCAN_ROLE_NAME, client_config)
+            else:
+                clients = default_clients
+            changed_types = {change['ruleResourceType'] for change in scoped_changes}
+            inventory_cache = {}
+            affected_rules = [
+                rule for resource_type in changed_types
+                for rule in registry.by_resource_type.get(resource_type, []) if rule.handler
+            ]
+            scope = cache_scope(work_unit.get('account_id') if work_unit else None, clients.region)
+            # Cached full inventories of the changed resource types are stale now
+            for inventory in {rule.handler.inventory for rule in affected_rules}:
+                if inventory.name != CONFIG_COMPLIANCE_INVENTORY:
+                    shared_inventory_cache.invalidate(scope, inventory.service, inventory.name)
+            for rule in affected_rules:
+                result = tag_shard_result(
+                    rescan_rule(rule, scoped_changes, clients, results_table, work_unit, inventory_cache, scope),
+                    work_unit
+                )
+                if result:
+                    compliance_results.append(result)
+                    results_writer.write(result)
+
+    logger.info(f"Incremental scan of {len(changes)} changed resources re-evaluated {len(compliance_results)} rules")
+    shared_inventory_cache.log_stats()
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f'Re-evaluated {len(compliance_results)} rules for {len(changes)} changed resources')
+    }
+
+def rescan_rule(rule, changes, clients, results_table, work_unit, inventory_cache, scope):
+    inventory = get_required_inventory(rule)
+    id_field = rule.handler.inventory.resource_id_field
+
+    previous_id = build_result_id(tag_shard_result(create_result(rule, []), work_unit), SCANNER_SOURCE)
+    previous = load_last_result(results_table, previous_id)
+    if previous is None or id_field is None:
+        # Nothing to merge into, or an account-wide check: evaluate the rule in full
+        if inventory not in inventory_cache:
+            inventory_cache.update(load_inventory_snapshot({inventory: [rule]}, clients, scope))
+        elif inventory == CONFIG_COMPLIANCE_INVENTORY:
+            config_rule_name = rule.compliance_check['configRuleName']
+            if config_rule_name not in inventory_cache[inventory]:
+                inventory_cache[inventory].update(load_config_compliance(clients, [config_rule_name]))
+        return check_compliance(rule, inventory_cache)
+
+    rule_changes = [change for change in changes if change['ruleResourceType'] == rule['ResourceType']]
+    live_changes = [change for change in rule_changes if not change['deleted']]
+    non_compliant_ids = []
+    if live_changes and inventory == CONFIG_COMPLIANCE_INVENTORY:
+        config_rule_name = rule.compliance_check['configRuleName']
+        non_compliant_ids = [
+            change[id_field] for change in live_changes
+            if config_rule_name in get_non_compliant_config_rules(clients, change, inventory_cache)
+        ]
+    elif live_changes:
+        resource_ids = sorted({change[id_field] for change in live_changes})
+        cache_key = (inventory, tuple(resource_ids))
+        if cache_key not in inventory_cache:
+            inventory_cache[cache_key] = rule.handler.inventory.loader(clients, resource_ids)
+        non_compliant_ids = check_compliance(rule, {inventory: inventory_cache[cache_key]})['NonCompliantResources']
+
+    return create_result(rule, merge_resource_changes(
+        previous['NonCompliantResources'],
+        [change[id_field] for change in rule_changes],
+        non_compliant_ids
+    ))
+
+def get_non_compliant_config_rules(clients, change, inventory_cache):
+    cache_key = ('config_resource', change['resourceType'], change['resourceId'])
+    if cache_key not in inventory_cache:
+        evaluation_results = paginate(
+            clients.config, 'get_compliance_details_by_resource', 'EvaluationResults',
+            ResourceType=change['resourceType'],
+            ResourceId=change['resourceId'],
+            ComplianceTypes=['NON_COMPLIANT']
+        )
+        inventory_cache[cache_key] = {
+            eval_result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ConfigRuleName']
+            for eval_result in evaluation_results
+        }
+    return inventory_cache[cache_key]
+
+def build_fetch_plan(rules):
+    fetch_plan = {}
+    for rule in rules:
+        inventory = get_required_inventory(rule)
+        if inventory:
+            fetch_plan.setdefault(inventory, []).append(rule)
+    return fetch_plan
+
+def get_required_inventory(rule):
+    return rule.handler.inventory.name
+
+def load_inventory_snapshot(fetch_plan, clients, scope):
+    snapshot = {}
+    for inventory, rules in fetch_plan.items():
+        logger.info(f"Loading inventory {inventory} shared by {len(rules)} rules")
+        try:
+            if inventory == CONFIG_COMPLIANCE_INVENTORY:
+                config_rule_names = {rule.compliance_check['configRuleName'] for rule in rules}
+                snapshot[inventory] = load_config_compliance(clients, config_rule_names)
+                if COMPARE_CONFIG_LOOKUP:
+                    compare_config_lookup(clients, config_rule_names)
+            else:
+                dependency = check_registry.inventories[inventory]
+                snapshot[inventory] = shared_inventory_cache.get(
+                    scope, dependency.service, inventory, partial(dependency.loader, clients)
+                )
+        except ClientError as e:
+            # Only the rules depending on an unreadable inventory are skipped
+            logger.error(f"Error loading inventory {inventory} for {len(rules)} rules: {str(e)}")
+    return snapshot
+
+def check_compliance(rule, snapshot):
+    inventory = get_required_inventory(rule)
+    if inventory not in snapshot:
         return None
+    return rule.handler.check(rule, snapshot[inventory])
 
-def check_aws_config(rule):
-    config_rule_name = json.loads(rule['ComplianceCheck'])['configRuleName']
-    response = config.describe_compliance_by_config_rule(
-        ConfigRuleNames=[config_rule_name]
-    )
-    compliance_type = response['ComplianceByConfigRules'][0]['Compliance']['ComplianceType']
-    non_compliant_resources = []
-    if compliance_type == 'NON_COMPLIANT':
-        non_compliant_resources = get_non_compliant_resources(config_rule_name)
+def check_aws_config(rule, config_compliance):
+    compliance_type, non_compliant_resources = config_compliance[rule.compliance_check['configRuleName']]
     
     return {
         'RuleId': rule['RuleId'],
@@ -68,121 +255,378 @@ def check_aws_config(rule):
         'NonCompliantResources': non_compliant_resources
     }
 
-def check_custom(rule):
-    check_function = json.loads(rule['ComplianceCheck'])['checkFunction']
-    check_functions = {
-        'checkEC2PublicAccess': check_ec2_public_access,
-        'checkRDSEncryption': check_rds_encryption,
-        'checkS3BucketEncryption': check_s3_bucket_encryption,
-        'checkCloudTrailEnabled': check_cloudtrail_enabled,
-        'checkKMSKeyRotation': check_kms_key_rotation,
-        'checkIAMPasswordPolicy': check_iam_password_policy,
-        'checkVPCFlowLogs': check_vpc_flow_logs,
-        'checkELBHttpsOnly': check_elb_https_only
+def load_config_compliance(clients, config_rule_names):
+    config_rule_names = sorted(config_rule_names)
+    compliance_types = {}
+    for start in range(0, len(config_rule_names), CONFIG_RULE_NAMES_PER_CALL):
+        compliance_by_rules = paginate(
+            clients.config, 'describe_compliance_by_config_rule', 'ComplianceByConfigRules',
+            ConfigRuleNames=config_rule_names[start:start + CONFIG_RULE_NAMES_PER_CALL]
+        )
+        for compliance in compliance_by_rules:
+            compliance_types[compliance['ConfigRuleName']] = compliance['Compliance']['ComplianceType']
+
+    # Rules without any evaluation yet are not returned by Config
+    compliance_types = {name: compliance_types.get(name, 'INSUFFICIENT_DATA') for name in config_rule_names}
+
+    non_compliant_rule_names = [name for name, compliance_type in compliance_types.items() if compliance_type == 'NON_COMPLIANT']
+    non_compliant_resources = ConcurrentExecutor(SCAN_CONCURRENCY).map(
+        partial(get_non_compliant_resources, clients.config), non_compliant_rule_names, 'Config rule compliance details'
+    )
+    non_compliant_resources = dict(zip(non_compliant_rule_names, non_compliant_resources))
+
+    return {
+        name: (compliance_type, non_compliant_resources.get(name, []))
+        for name, compliance_type in compliance_types.items()
     }
-    if check_function in check_functions:
-        return check_functions[check_function](rule)
+
+def load_config_compliance_per_rule(clients, config_rule_names):
+    config_compliance = {}
+    for config_rule_name in config_rule_names:
+        response = clients.config.describe_compliance_by_config_rule(
+            ConfigRuleNames=[config_rule_name]
+        )
+        compliance_by_rules = response['ComplianceByConfigRules']
+        compliance_type = compliance_by_rules[0]['Compliance']['ComplianceType'] if compliance_by_rules else 'INSUFFICIENT_DATA'
+        non_compliant_resources = []
+        if compliance_type == 'NON_COMPLIANT':
+            non_compliant_resources = get_non_compliant_resources(clients.config, config_rule_name)
+        config_compliance[config_rule_name] = (compliance_type, non_compliant_resources)
+    return config_compliance
+
+def compare_config_lookup(clients, config_rule_names):
+    start = time.monotonic()
+    batched_compliance = load_config_compliance(clients, config_rule_names)
+    batched_elapsed = time.monotonic() - start
+
+    start = time.monotonic()
+    per_rule_compliance = load_config_compliance_per_rule(clients, config_rule_names)
+    per_rule_elapsed = time.monotonic() - start
+
+    matches = all(
+        batched_compliance[name][0] == per_rule_compliance[name][0]
+        and sorted(batched_compliance[name][1]) == sorted(per_rule_compliance[name][1])
+        for name in per_rule_compliance
+    )
+    logger.info(
+        f"Config compliance for {len(per_rule_compliance)} rules: batched {batched_elapsed:.2f}s, "
+        f"per-rule {per_rule_elapsed:.2f}s, speedup {per_rule_elapsed / max(batched_elapsed, 0.001):.1f}x, "
+        f"results match: {matches}"
+    )
+
+# Inventory loaders take an optional list of resource ids, which limits the
+# inventory to those resources during an incremental scan. Filters are used
+# rather than id parameters so resources deleted in the meantime are skipped.
+
+def load_ec2_instances(clients, resource_ids=None):
+    filters = [{'Name': 'instance-id', 'Values': resource_ids}] if resource_ids is not None else []
+    # Only the fields the checks read are kept in the snapshot
+    return [
+        {'InstanceId': instance['InstanceId'], 'NetworkInterfaces': instance['NetworkInterfaces']}
+        for instance in paginate(clients.ec2, 'describe_instances', 'Reservations[].Instances[]', prefetch=True, Filters=filters)
+    ]
+
+def load_rds_instances(clients, resource_ids=None):
+    filters = [{'Name': 'db-instance-id', 'Values': resource_ids}] if resource_ids is not None else []
+    return [
+        {'DBInstanceIdentifier': instance['DBInstanceIdentifier'], 'StorageEncrypted': instance['StorageEncrypted']}
+        for instance in paginate(clients.rds, 'describe_db_instances', 'DBInstances', prefetch=True, Filters=filters)
+    ]
+
+def load_s3_bucket_encryption(clients, resource_ids=None):
+    if resource_ids is not None:
+        bucket_names = list(resource_ids)
     else:
-        logger.warning(f"Custom check not implemented: {check_function}")
+        bucket_names = [bucket['Name'] for bucket in paginate(clients.s3, 'list_buckets', 'Buckets')]
+    encrypted = ConcurrentExecutor(SCAN_CONCURRENCY).map(
+        partial(is_bucket_encrypted, clients.s3), bucket_names, 's3:GetBucketEncryption calls'
+    )
+    return dict(zip(bucket_names, encrypted))
+
+def is_bucket_encrypted(s3, bucket_name):
+    try:
+        s3.get_bucket_encryption(Bucket=bucket_name)
+        return True
+    except ClientError as e:
+        if is_throttling_error(e):
+            raise
+        return False
+
+def load_cloudtrail_trails(clients, resource_ids=None):
+    return list(paginate(clients.cloudtrail, 'describe_trails', 'trailList'))
+
+def load_kms_key_rotation(clients, resource_ids=None):
+    if resource_ids is not None:
+        key_ids = list(resource_ids)
+    else:
+        key_ids = [key['KeyId'] for key in paginate(clients.kms, 'list_keys', 'Keys', prefetch=True)]
+    rotation_enabled = ConcurrentExecutor(SCAN_CONCURRENCY).map(
+        partial(get_key_rotation_enabled, clients.kms), key_ids, 'kms:GetKeyRotationStatus calls'
+    )
+    return {
+        key_id: enabled
+        for key_id, enabled in zip(key_ids, rotation_enabled)
+        if enabled is not None
+    }
+
+def get_key_rotation_enabled(kms, key_id):
+    try:
+        return kms.get_key_rotation_status(KeyId=key_id)['KeyRotationEnabled']
+    except ClientError as e:
+        if is_throttling_error(e):
+            raise
+        # Skip keys that we don't have permission to check
+        return None
+
+def load_iam_password_policy(clients, resource_ids=None):
+    try:
+        return clients.iam.get_account_password_policy()['PasswordPolicy']
+    except clients.iam.exceptions.NoSuchEntityException:
         return None
 
-def check_ec2_public_access(rule):
-    instances = ec2.describe_instances()
+def load_vpc_flow_logs(clients, resource_ids=None):
+    filters = [{'Name': 'vpc-id', 'Values': resource_ids}] if resource_ids is not None else []
+    vpc_ids = [vpc['VpcId'] for vpc in paginate(clients.ec2, 'describe_vpcs', 'Vpcs', Filters=filters)]
+    has_flow_logs = ConcurrentExecutor(SCAN_CONCURRENCY).map(
+        partial(vpc_has_flow_logs, clients.ec2), vpc_ids, 'ec2:DescribeFlowLogs calls'
+    )
+    return dict(zip(vpc_ids, has_flow_logs))
+
+def vpc_has_flow_logs(ec2, vpc_id):
+    # Filtered EC2 pages can be empty, so stop at the first flow log rather than the first page
+    flow_logs = paginate(
+        ec2, 'describe_flow_logs', 'FlowLogs',
+        Filter=[{'Name': 'resource-id', 'Values': [vpc_id]}]
+    )
+    return any(True for _ in flow_logs)
+
+def load_elb_listeners(clients, resource_ids=None):
+    if resource_ids is not None:
+        load_balancers = [lb for name in resource_ids for lb in describe_load_balancer(clients.elb, name)]
+    else:
+        load_balancers = paginate(clients.elb, 'describe_load_balancers', 'LoadBalancers')
+    load_balancers = [
+        {'LoadBalancerArn': lb['LoadBalancerArn'], 'LoadBalancerName': lb['LoadBalancerName']}
+        for lb in load_balancers
+    ]
+    protocols = ConcurrentExecutor(SCAN_CONCURRENCY).map(
+        partial(get_listener_protocols, clients.elb), [lb['LoadBalancerArn'] for lb in load_balancers], 'elbv2:DescribeListeners calls'
+    )
+    return {lb['LoadBalancerName']: lb_protocols for lb, lb_protocols in zip(load_balancers, protocols)}
+
+def describe_load_balancer(elb, name):
+    try:
+        return elb.describe_load_balancers(Names=[name])['LoadBalancers']
+    except elb.exceptions.LoadBalancerNotFoundException:
+        return []
+
+def get_listener_protocols(elb, load_balancer_arn):
+    listeners = paginate(elb, 'describe_listeners', 'Listeners', LoadBalancerArn=load_balancer_arn)
+    return [listener['Protocol'] for listener in listeners]
+
+def load_ebs_volumes(clients, resource_ids=None):
+    return [
+        {'VolumeId': vol['VolumeId'], 'Encrypted': vol['Encrypted']}
+        for vol in paginate(clients.ec2, 'describe_volumes', 'Volumes', prefetch=True)
+    ]
+
+def load_redshift_clusters(clients, resource_ids=None):
+    return [
+        {'ClusterIdentifier': cluster['ClusterIdentifier'], 'Encrypted': cluster['Encrypted']}
+        for cluster in paginate(clients.redshift, 'describe_clusters', 'Clusters')
+    ]
+
+def load_config_rules(clients, resource_ids=None):
+    return [
+        {'ConfigRuleName': config_rule['ConfigRuleName'], 'ConfigRuleState': config_rule['ConfigRuleState']}
+        for config_rule in paginate(clients.config, 'describe_config_rules', 'ConfigRules')
+    ]
+
+def load_ssm_parameters(clients, resource_ids=None):
+    return [
+        {key: param[key] for key in ('Name', 'Type') if key in param}
+        for param in paginate(clients.ssm, 'describe_parameters', 'Parameters', prefetch=True)
+    ]
+
+def load_guardduty_detectors(clients, resource_ids=None):
+    return list(paginate(clients.guardduty, 'list_detectors', 'DetectorIds'))
+
+def load_shield_subscription_active(clients, resource_ids=None):
+    return clients.shield.describe_subscription()['Subscription']['ActiveStatus']
+
+def load_waf_web_acls(clients, resource_ids=None):
+    return [web_acl['Name'] for web_acl in paginate(clients.wafv2, 'list_web_acls', 'WebACLs', Scope='REGIONAL')]
+
+def load_macie_status(clients, resource_ids=None):
+    return clients.macie.get_macie_session()['status']
+
+def load_secrets(clients, resource_ids=None):
+    return [
+        {key: secret[key] for key in ('Name', 'RotationEnabled') if key in secret}
+        for secret in paginate(clients.secrets_manager, 'list_secrets', 'SecretList', prefetch=True)
+    ]
+
+def load_inspector_findings_exist(clients, resource_ids=None):
+    # A single finding is enough to fail the check
+    findings = paginate(clients.inspector, 'list_findings', 'findings', page_size=1)
+    return next(findings, None) is not None
+
+def check_ec2_public_access(rule, instances):
     non_compliant_instances = []
 
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            for interface in instance['NetworkInterfaces']:
-                if interface.get('Association', {}).get('PublicIp'):
-                    non_compliant_instances.append(instance['InstanceId'])
-                    break
+    for instance in instances:
+        for interface in instance['NetworkInterfaces']:
+            if interface.get('Association', {}).get('PublicIp'):
+                non_compliant_instances.append(instance['InstanceId'])
+                break
 
     return create_result(rule, non_compliant_instances)
 
-def check_rds_encryption(rule):
-    rds_instances = rds.describe_db_instances()
+def check_rds_encryption(rule, rds_instances):
     non_compliant_instances = [
         instance['DBInstanceIdentifier']
-        for instance in rds_instances['DBInstances']
+        for instance in rds_instances
         if not instance['StorageEncrypted']
     ]
     return create_result(rule, non_compliant_instances)
 
-def check_s3_bucket_encryption(rule):
-    buckets = s3.list_buckets()
-    non_compliant_buckets = []
-    for bucket in buckets['Buckets']:
-        try:
-            encryption = s3.get_bucket_encryption(Bucket=bucket['Name'])
-        except s3.exceptions.ClientError:
-            non_compliant_buckets.append(bucket['Name'])
+def check_s3_bucket_encryption(rule, bucket_encryption):
+    non_compliant_buckets = [name for name, encrypted in bucket_encryption.items() if not encrypted]
     return create_result(rule, non_compliant_buckets)
 
-def check_cloudtrail_enabled(rule):
-    trails = cloudtrail.describe_trails()
-    if not trails['trailList']:
+def check_cloudtrail_enabled(rule, trails):
+    if not trails:
         return create_result(rule, ['No CloudTrail configured'])
     return create_result(rule, [])
 
-def check_kms_key_rotation(rule):
-    keys = kms.list_keys()
-    non_compliant_keys = []
-    for key in keys['Keys']:
-        try:
-            rotation_status = kms.get_key_rotation_status(KeyId=key['KeyId'])
-            if not rotation_status['KeyRotationEnabled']:
-                non_compliant_keys.append(key['KeyId'])
-        except kms.exceptions.ClientError:
-            # Skip keys that we don't have permission to check
-            pass
+def check_kms_key_rotation(rule, key_rotation):
+    non_compliant_keys = [key_id for key_id, enabled in key_rotation.items() if not enabled]
     return create_result(rule, non_compliant_keys)
 
-def check_iam_password_policy(rule):
-    try:
-        policy = iam.get_account_password_policy()
-        # Check if policy meets your specific requirements
-        # This is a simple check, adjust as needed
-        if policy['PasswordPolicy']['MinimumPasswordLength'] < 14:
-            return create_result(rule, ['IAM password policy'])
-    except iam.exceptions.NoSuchEntityException:
+def check_iam_password_policy(rule, password_policy):
+    if password_policy is None:
         return create_result(rule, ['No IAM password policy set'])
+    # Check if policy meets your specific requirements
+    # This is a simple check, adjust as needed
+    if password_policy['MinimumPasswordLength'] < 14:
+        return create_result(rule, ['IAM password policy'])
     return create_result(rule, [])
 
-def check_vpc_flow_logs(rule):
-    vpcs = ec2.describe_vpcs()
-    non_compliant_vpcs = []
-    for vpc in vpcs['Vpcs']:
-        flow_logs = ec2.describe_flow_logs(
-            Filter=[{'Name': 'resource-id', 'Values': [vpc['VpcId']]}]
-        )
-        if not flow_logs['FlowLogs']:
-            non_compliant_vpcs.append(vpc['VpcId'])
+def check_vpc_flow_logs(rule, vpc_flow_logs):
+    non_compliant_vpcs = [vpc_id for vpc_id, enabled in vpc_flow_logs.items() if not enabled]
     return create_result(rule, non_compliant_vpcs)
 
-def check_elb_https_only(rule):
-    load_balancers = elb.describe_load_balancers()
-    non_compliant_elbs = []
-    for lb in load_balancers['LoadBalancers']:
-        listeners = elb.describe_listeners(LoadBalancerArn=lb['LoadBalancerArn'])
-        for listener in listeners['Listeners']:
-            if listener['Protocol'] != 'HTTPS':
-                non_compliant_elbs.append(lb['LoadBalancerName'])
-                break
+def check_elb_https_only(rule, elb_listeners):
+    non_compliant_elbs = [
+        lb_name for lb_name, protocols in elb_listeners.items()
+        if any(protocol != 'HTTPS' for protocol in protocols)
+    ]
     return create_result(rule, non_compliant_elbs)
 
-def create_result(rule, non_compliant_resources):
-    return {
-        'RuleId': rule['RuleId'],
-        'Regulation': rule['Regulation'],
-        'ResourceType': rule['ResourceType'],
-        'ComplianceType': 'NON_COMPLIANT' if non_compliant_resources else 'COMPLIANT',
-        'NonCompliantResources': non_compliant_resources
-    }
+def check_ebs_encryption(rule, volumes):
+    non_compliant_volumes = [vol['VolumeId'] for vol in volumes if not vol['Encrypted']]
+    return create_result(rule, non_compliant_volumes)
+
+def check_redshift_encryption(rule, clusters):
+    non_compliant_clusters = [cluster['ClusterIdentifier'] for cluster in clusters if not cluster['Encrypted']]
+    return create_result(rule, non_compliant_clusters)
+
+def check_config_rules(rule, config_rules):
+    non_compliant_rules = [
+        config_rule['ConfigRuleName'] for config_rule in config_rules
+        if config_rule['ConfigRuleState'] != 'ACTIVE'
+    ]
+    return create_result(rule, non_compliant_rules)
+
+def check_ssm_parameters(rule, parameters):
+    non_compliant_params = [
+        param['Name'] for param in parameters
+        if 'Type' in param and not param['Type'].startswith('SecureString')
+    ]
+    return create_result(rule, non_compliant_params)
 
-def get_non_compliant_resources(config_rule_name):
-    response = config.get_compliance_details_by_config_rule(
+def check_guardduty_enabled(rule, detector_ids):
+    if not detector_ids:
+        return create_result(rule, ['GuardDuty not enabled'])
+    return create_result(rule, [])
+
+def check_shield_protection(rule, subscription_active):
+    if not subscription_active:
+        return create_result(rule, ['Shield Advanced not active'])
+    return create_result(rule, [])
+
+def check_waf_rules(rule, web_acls):
+    if not web_acls:
+        return create_result(rule, ['No WAF Web ACLs configured'])
+    return create_result(rule, [])
+
+def check_macie_enabled(rule, macie_status):
+    if macie_status != 'ENABLED':
+        return create_result(rule, ['Macie not enabled'])
+    return create_result(rule, [])
+
+def check_secrets_rotation(rule, secrets):
+    non_compliant_secrets = [secret['Name'] for secret in secrets if not secret.get('RotationEnabled')]
+    return create_result(rule, non_compliant_secrets)
+
+def check_inspector_findings(rule, findings_exist):
+    if findings_exist:
+        return create_result(rule, ['Active Inspector findings exist'])
+    return create_result(rule, [])
+
+def get_non_compliant_resources(config, config_rule_name):
+    evaluation_results = paginate(
+        config, 'get_compliance_details_by_config_rule', 'EvaluationResults', prefetch=True,
         ConfigRuleName=config_rule_name,
         ComplianceTypes=['NON_COMPLIANT']
     )
     return [eval_result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId'] 
-            for eval_result in response['EvaluationResults']]
+            for eval_result in evaluation_results]
+
+# Every check the scanner runs and the inventory it is evaluated against.
+# Inventories are fetched once per invocation and shared by every rule that needs them.
+check_registry = CheckRegistry()
+
+check_registry.add_inventory(CONFIG_COMPLIANCE_INVENTORY, 'config', load_config_compliance, 'resourceId')
+check_registry.add_inventory('ec2_instances', 'ec2', load_ec2_instances, 'resourceId')
+check_registry.add_inventory('rds_instances', 'rds', load_rds_instances, 'resourceName')
+check_registry.add_inventory('s3_bucket_encryption', 's3', load_s3_bucket_encryption, 'resourceId')
+check_registry.add_inventory('cloudtrail_trails', 'cloudtrail', load_cloudtrail_trails)
+check_registry.add_inventory('kms_key_rotation', 'kms', load_kms_key_rotation, 'resourceId')
+check_registry.add_inventory('iam_password_policy', 'iam', load_iam_password_policy)
+check_registry.add_inventory('vpc_flow_logs', 'ec2', load_vpc_flow_logs, 'resourceId')
+check_registry.add_inventory('elb_listeners', 'elb', load_elb_listeners, 'resourceName')
+check_registry.add_inventory('ebs_volumes', 'ec2', load_ebs_volumes)
+check_registry.add_inventory('redshift_clusters', 'redshift', load_redshift_clusters)
+check_registry.add_inventory('config_rules', 'config', load_config_rules)
+check_registry.add_inventory('ssm_parameters', 'ssm', load_ssm_parameters)
+check_registry.add_inventory('guardduty_detectors', 'guardduty', load_guardduty_detectors)
+check_registry.add_inventory('shield_subscription', 'shield', load_shield_subscription_active)
+check_registry.add_inventory('waf_web_acls', 'wafv2', load_waf_web_acls)
+check_registry.add_inventory('macie_session', 'macie', load_macie_status)
+check_registry.add_inventory('secrets', 'secrets_manager', load_secrets)
+check_registry.add_inventory('inspector_findings', 'inspector', load_inspector_findings_exist)
+
+check_registry.add_plugin('aws_config', CONFIG_COMPLIANCE_INVENTORY, check_aws_config, check_types=['AWSConfig'])
+
+# CustomCheck rules are matched on their checkFunction
+check_registry.add_plugin('ec2_public_access', 'ec2_instances', check_ec2_public_access, check_functions=['checkEC2PublicAccess'])
+check_registry.add_plugin('rds_encryption', 'rds_instances', check_rds_encryption, check_functions=['checkRDSEncryption'])
+check_registry.add_plugin('s3_bucket_encryption', 's3_bucket_encryption', check_s3_bucket_encryption, check_functions=['checkS3BucketEncryption'])
+check_registry.add_plugin('cloudtrail_enabled', 'cloudtrail_trails', check_cloudtrail_enabled, check_functions=['checkCloudTrailEnabled'])
+check_registry.add_plugin('kms_key_rotation', 'kms_key_rotation', check_kms_key_rotation, check_functions=['checkKMSKeyRotation'])
+check_registry.add_plugin('iam_password_policy', 'iam_password_policy', check_iam_password_policy, check_functions=['checkIAMPasswordPolicy'])
+check_registry.add_plugin('vpc_flow_logs', 'vpc_flow_logs', check_vpc_flow_logs, check_functions=['checkVPCFlowLogs'])
+check_registry.add_plugin('elb_https_only', 'elb_listeners', check_elb_https_only, check_functions=['checkELBHttpsOnly'])
+
+# Rules whose checkFunction has no plugin fall back to one for their ResourceType
+check_registry.add_plugin('ebs_encryption', 'ebs_volumes', check_ebs_encryption, resource_types=['AWS::EBS::Volume'])
+check_registry.add_plugin('redshift_encryption', 'redshift_clusters', check_redshift_encryption, resource_types=['AWS::Redshift::Cluster'])
+check_registry.add_plugin('config_rules_active', 'config_rules', check_config_rules, resource_types=['AWS::Config::ConfigRule'])
+check_registry.add_plugin('ssm_secure_parameters', 'ssm_parameters', check_ssm_parameters, resource_types=['AWS::SSM::Parameter'])
+check_registry.add_plugin('guardduty_enabled', 'guardduty_detectors', check_guardduty_enabled, resource_types=['AWS::GuardDuty::Detector'])
+check_registry.add_plugin('shield_protection', 'shield_subscription', check_shield_protection, resource_types=['AWS::Shield::Protection'])
+check_registry.add_plugin('waf_web_acls', 'waf_web_acls', check_waf_rules, resource_types=['AWS::WAFv2::WebACL'])
+check_registry.add_plugin('macie_enabled', 'macie_session', check_macie_enabled, resource_types=['AWS::Macie::Session'])
+check_registry.add_plugin('secrets_rotation', 'secrets', check_secrets_rotation, resource_types=['AWS::SecretsManager::Secret'])
+check_registry.add_plugin('inspector_findings', 'inspector_findings', check_inspector_findings, resource_types=['AWS::Inspector::AssessmentTemplate'])
@@ -1,7 +1,16 @@
 import json
 import boto3
+import hashlib
 import os
 import logging
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import unquote_plus
+from boto3.dynamodb.conditions import Key
+from compliance_common.concurrency import ConcurrentExecutor
+from compliance_common.pagination import query_table
+from compliance_common.rule_registry import REGULATION_MANIFEST_RULE_ID, RULESET_VERSION_KEY, regulation_manifest_key
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -9,20 +18,19 @@ logger.setLevel(logging.INFO)
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 
+# Maximum number of regulation files fetched and parsed at the same time
+PARSE_CONCURRENCY = int(os.environ.get('PARSE_CONCURRENCY', '8'))
+
+# Index listing the RuleIds and content hashes stored for a regulation
+REGULATION_INDEX = 'RegulationIndex'
+
 def lambda_handler(event, context):
     try:
-        # Get the S3 bucket and key from the event
-        bucket = event['Records'][0]['s3']['bucket']['name']
-        key = event['Records'][0]['s3']['object']['key']
-        
-        logger.info(f"Processing file {key} from bucket {bucket}")
-        
-        # Read the file from S3
-        response = s3.get_object(Bucket=bucket, Key=key)
-        file_content = response['Body'].read().decode('utf-8')
-        
-        # Parse the JSON content
-        regulation_data = json.loads(file_content)
+        # Get the S3 bucket and key of every uploaded file in the event
+        objects = [
+            (record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key']))
+            for record in event['Records']
+        ]
         
         # Get the DynamoDB table name from environment variables
         table_name = os.environ.get('DYNAMODB_TABLE')
@@ -32,23 +40,106 @@ def lambda_handler(event, context):
         table = dynamodb.Table(table_name)
         logger.info(f"Using DynamoDB table: {table_name}")
         
-        # Insert each rule into DynamoDB
-        for rule in regulation_data['rules']:
-            item = {
-                'RuleId': rule['ruleId'],
-                'Regulation': regulation_data['regulation'],
-                'ResourceType': rule['resourceType'],
-                'Description': rule['description'],
-                'ComplianceCheck': json.dumps(rule['complianceCheck']),
-                'RemediationAction': rule['remediationAction']
-            }
-            table.put_item(Item=item)
-            logger.info(f"Inserted rule {rule['ruleId']} into DynamoDB")
+        start = time.monotonic()
+        
+        # Read, parse and diff the files against the stored rules concurrently
+        changes = ConcurrentExecutor(PARSE_CONCURRENCY).map(
+            lambda s3_object: plan_regulation_changes(table, s3_object), objects, 'regulation files'
+        )
+        
+        # Write only added or changed rules and delete removed ones through one
+        # batch writer, which sends up to 25 requests at a time and resends
+        # unprocessed items
+        rule_count = sum(change['rule_count'] for change in changes)
+        written = sum(len(change['puts']) for change in changes)
+        deleted = sum(len(change['deletes']) for change in changes)
+        with table.batch_writer(overwrite_by_pkeys=['RuleId', 'Regulation']) as batch:
+            for change in changes:
+                for item in change['puts']:
+                    batch.put_item(Item=item)
+                for key in change['deletes']:
+                    batch.delete_item(Key=key)
+        
+        # Tell the scanners' cached rule registries that the rules changed
+        if written or deleted:
+            table.put_item(Item={**RULESET_VERSION_KEY, 'Version': uuid.uuid4().hex})
         
+        # A manifest makes later uploads of the same file skip the regulation, so
+        # it is written only once every rule write above has been flushed
+        manifests = [change['manifest'] for change in changes if change['manifest']]
+        if manifests:
+            with table.batch_writer(overwrite_by_pkeys=['RuleId', 'Regulation']) as batch:
+                for manifest in manifests:
+                    batch.put_item(Item=manifest)
+        
+        elapsed = time.monotonic() - start
+        logger.info(f"Processed {rule_count} rules from {len(objects)} files in {elapsed:.2f}s "
+                    f"({rule_count / elapsed if elapsed > 0 else 0:.1f} rules/s): "
+                    f"{written} written, {deleted} deleted, {rule_count - written} unchanged")
         return {
             'statusCode': 200,
-            'body': json.dumps(f'Successfully processed {len(regulation_data["rules"])} rules')
+            'body': json.dumps(f'Successfully processed {rule_count} rules ({written} written, {deleted} deleted)')
         }
     except Exception as e:
         logger.error(f"Error processing file: {str(e)}")
         raise
+
+def load_regulation_file(s3_object):
+    bucket, key = s3_object
+    logger.info(f"Processing file {key} from bucket {bucket}")
+    
+    # Read the file from S3
+    response = s3.get_object(Bucket=bucket, Key=key)
+    file_content = response['Body'].read().decode('utf-8')
+    
+    # Parse the JSON content
+    return json.loads(file_content)
+
+def plan_regulation_changes(table, s3_object):
+    regulation_data = load_regulation_file(s3_object)
+    regulation = regulation_data['regulation']
+    items = {rule['ruleId']: build_rule_item(regulation_data, rule) for rule in regulation_data['rules']}
+    regulation_hash = hash_content(sorted((rule_id, item['ContentHash']) for rule_id, item in items.items()))
+    change = {'rule_count': len(items), 'puts': [], 'deletes': [], 'manifest': None}
+
+    # An unchanged manifest hash means no rule of the regulation changed
+    manifest = table.get_item(Key=regulation_manifest_key(regulation)).get('Item')
+    if manifest and manifest.get('ContentHash') == regulation_hash:
+        logger.info(f"Rules of {regulation} are unchanged")
+        return change
+
+    stored_hashes = {
+        item['RuleId']: item.get('ContentHash')
+        for item in query_table(table, IndexName=REGULATION_INDEX, KeyConditionExpression=Key('Regulation').eq(regulation))
+        if item['RuleId'] != REGULATION_MANIFEST_RULE_ID
+    }
+    change['puts'] = [item for rule_id, item in items.items() if stored_hashes.get(rule_id) != item['ContentHash']]
+    change['deletes'] = [{'RuleId': rule_id, 'Regulation': regulation} for rule_id in stored_hashes if rule_id not in items]
+    change['manifest'] = {
+        **regulation_manifest_key(regulation),
+        'Version': str(regulation_data.get('version', '')),
+        'LastUpdated': str(regulation_data.get('lastUpdated', '')),
+        'RuleCount': len(items),
+        'ContentHash': regulation_hash,
+        'UpdatedAt': datetime.now().isoformat()
+    }
+    logger.info(f"{regulation}: {len(change['puts'])} rules added or changed, {len(change['deletes'])} removed")
+    return change
+
+def hash_content(content):
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+def build_rule_item(regulation_data, rule):
+    item = {
+        'RuleId': rule['ruleId'],
+        'Regulation': regulation_data['regulation'],
+        'ResourceType': rule['resourceType'],
+        'Description': rule['description'],
+        'ComplianceCheck': json.dumps(rule['complianceCheck']),
+        'RemediationAction': rule['remediationAction']
+    }
+    # Optional; orders the remediation queue, rules without it count as medium
+    if 'severity' in rule:
+        item['Severity'] = rule['severity']
+    item['ContentHash'] = hash_content(item)
+    return item
@@ -0,0 +1,171 @@
+import boto3
+import json
+import os
+import logging
+import random
+from botocore.exceptions import ClientError
+from compliance_common.concurrency import ConcurrentExecutor, is_throttling_error
+from compliance_common.idempotency import IdempotencyStore
+from compliance_common.rate_limit import TokenBucket, rate_limited
+from compliance_common.remediation_queue import SqsPriorityQueue, retry_execution_name
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+sqs = boto3.client('sqs')
+stepfunctions = boto3.client('stepfunctions')
+
+# Remediation queues, most urgent first, and their dead-letter queue
+REMEDIATION_QUEUE_URLS = [url for url in os.environ.get('REMEDIATION_QUEUE_URLS', '').split(',') if url]
+REMEDIATION_DLQ_URL = os.environ.get('REMEDIATION_DLQ_URL')
+
+# Upper bound on queued batches being remediated at the same time
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT_REMEDIATIONS', '50'))
+
+# A batch stays invisible for this long after its execution starts, and is sent
+# back with this delay while the execution runs; its status is checked each time
+EXECUTION_CHECK_SECONDS = int(os.environ.get('EXECUTION_CHECK_SECONDS', '300'))
+
+# Failed executions are retried under a new name this many times in total
+MAX_ATTEMPTS = int(os.environ.get('MAX_REMEDIATION_ATTEMPTS', '3'))
+
+# How long a batch waits before it is offered again when Step Functions is saturated
+DEFER_SECONDS = 60
+
+START_EXECUTION_RATE = float(os.environ.get('START_EXECUTION_RATE', '25'))
+DISPATCH_CONCURRENCY = int(os.environ.get('DISPATCH_CONCURRENCY', '8'))
+
+SATURATION_ERROR_CODES = {'ExecutionLimitExceeded'}
+
+def lambda_handler(event, context):
+    try:
+        if not REMEDIATION_QUEUE_URLS:
+            raise ValueError("REMEDIATION_QUEUE_URLS environment variable is not set")
+        if not REMEDIATION_DLQ_URL:
+            raise ValueError("REMEDIATION_DLQ_URL environment variable is not set")
+        queue = SqsPriorityQueue(sqs, REMEDIATION_QUEUE_URLS, REMEDIATION_DLQ_URL)
+        
+        # Claims queued Express batches by execution name, shared with the orchestrator
+        idempotency = IdempotencyStore(dynamodb.Table(os.environ['REMEDIATION_IDEMPOTENCY_TABLE']))
+        outcomes = dispatch(queue, idempotency)
+
+        logger.info(f"Remediation dispatch outcomes: {json.dumps(outcomes, sort_keys=True)}")
+        return {
+            'statusCode': 200,
+            'body': json.dumps(outcomes)
+        }
+    except Exception as e:
+        logger.error(f"Error dispatching remediation queue: {str(e)}")
+        raise
+
+def dispatch(queue, idempotency, max_in_flight=MAX_IN_FLIGHT):
+    # Received messages count towards in flight until they are deleted, so
+    # batches whose executions are still running hold their slot
+    capacity = max_in_flight - queue.in_flight_count()
+    if capacity <= 0:
+        logger.info(f"{max_in_flight} remediations in flight, not receiving more")
+        return {}
+    messages = queue.receive(capacity, EXECUTION_CHECK_SECONDS)
+    start = rate_limited(TokenBucket(START_EXECUTION_RATE), start_execution)
+    results = ConcurrentExecutor(DISPATCH_CONCURRENCY).map(
+        lambda message: handle_message(queue, message, start, idempotency), messages, 'queued remediations'
+    )
+    outcomes = {}
+    for outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+def handle_message(queue, message, start, idempotency):
+    try:
+        return advance_remediation(queue, message, start, idempotency)
+    except Exception as e:
+        if is_throttling_error(e):
+            raise
+        # The message reappears after its visibility timeout; the queue's
+        # redrive policy dead-letters it if it keeps failing
+        logger.error(f"Failed to process remediation {message.body.get('executionName')}: {str(e)}")
+        return 'error'
+
+def advance_remediation(queue, message, start, idempotency):
+    work = message.body
+    name = retry_execution_name(work['executionName'], work['attempt'])
+
+    if work.get('express'):
+        # Express executions neither enforce unique names nor can be described,
+        # so only the run that claims the name starts the batch, and it is not
+        # tracked once started. A claimed name means the batch was a duplicate.
+        if not idempotency.claim(name):
+            logger.info(f"Remediation {name} already started, dropping the duplicate")
+            queue.delete(message)
+            return 'skipped'
+        try:
+            outcome = start(work, name)
+        except Exception:
+            idempotency.release(name)
+            raise
+        if outcome == 'deferred':
+            idempotency.release(name)
+            return defer(queue, message)
+        queue.delete(message)
+        return 'started'
+
+    status = get_execution_status(execution_arn(work['stateMachineArn'], name))
+    if status is None:
+        if start(work, name) == 'deferred':
+            return defer(queue, message)
+        return 'started'
+    if status == 'RUNNING':
+        requeue(queue, message, EXECUTION_CHECK_SECONDS)
+        return 'running'
+    if status == 'SUCCEEDED':
+        queue.delete(message)
+        return 'succeeded'
+
+    # FAILED, TIMED_OUT or ABORTED
+    if work['attempt'] + 1 >= MAX_ATTEMPTS:
+        logger.error(f"Remediation {name} ended {status} after {MAX_ATTEMPTS} attempts, dead-lettering")
+        queue.dead_letter(message, f"{status} after {MAX_ATTEMPTS} attempts")
+        return 'dead_lettered'
+    queue.send([(dict(work, attempt=work['attempt'] + 1), work['priority'])])
+    queue.delete(message)
+    return 'retried'
+
+def defer(queue, message):
+    # Backpressure: the batch is offered again after a jittered delay
+    requeue(queue, message, int(DEFER_SECONDS * random.uniform(1, 2)))
+    return 'deferred'
+
+def requeue(queue, message, delay_seconds):
+    # Sending the batch again instead of letting it reappear keeps its receive
+    # count low, so only batches that cannot be processed reach the redrive limit
+    queue.send([(message.body, message.body['priority'])], delay_seconds)
+    queue.delete(message)
+
+def execution_arn(state_machine_arn, name):
+    return f"{state_machine_arn.replace(':stateMachine:', ':execution:')}:{name}"
+
+def get_execution_status(arn):
+    try:
+        return stepfunctions.describe_execution(executionArn=arn)['status']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ExecutionDoesNotExist':
+            return None
+        raise
+
+def start_execution(work, name):
+    try:
+        stepfunctions.start_execution(
+            stateMachineArn=work['stateMachineArn'],
+            name=name,
+            input=json.dumps(work['input'])
+        )
+        logger.info(f"Started remediation {name} for {work['input']['resourceType']} {work['input']['resourceIds']}")
+        return 'started'
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ExecutionAlreadyExists':
+            return 'started'
+        if is_throttling_error(e) or e.response['Error']['Code'] in SATURATION_ERROR_CODES:
+            logger.warning(f"Step Functions saturated, deferring {name}: {str(e)}")
+            return 'deferred'
+        raise
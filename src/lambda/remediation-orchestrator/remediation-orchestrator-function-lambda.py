@@ -2,8 +2,20 @@ import boto3
 import json
 import os
 import logging
+import hashlib
+import re
+from datetime import datetime, timedelta
 from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Key
+from compliance_common.concurrency import ConcurrentExecutor, is_throttling_error
+from compliance_common.idempotency import IdempotencyStore
+from compliance_common.inventory_cache import InventoryCache, cache_scope
+from compliance_common.pagination import query_table
+from compliance_common.rate_limit import TokenBucket, rate_limited
+from compliance_common.remediation_actions import REMEDIATED_SERVICES, REMEDIATION_SERVICES, is_in_process_remediation, remediate_resources
+from compliance_common.remediation_queue import SqsPriorityQueue, remediation_priority
+from compliance_common.rule_registry import load_rule_registry
+from compliance_common.sharding import create_shard_clients
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -11,74 +23,275 @@ logger.setLevel(logging.INFO)
 dynamodb = boto3.resource('dynamodb')
 stepfunctions = boto3.client('stepfunctions')
 sns = boto3.client('sns')
+sqs = boto3.client('sqs')
 
-MAX_RETRIES = 3
-BATCH_SIZE = 25  # Number of items to process in each batch
+# Shared with the scanners, which would otherwise see the pre-remediation
+# state of the resources fixed in-process until their cached inventories expire
+shared_inventory_cache = InventoryCache(
+    dynamodb.Table(os.environ['INVENTORY_CACHE_TABLE']) if os.environ.get('INVENTORY_CACHE_TABLE') else None
+)
+
+BATCH_SIZE = int(os.environ.get('REMEDIATION_BATCH_SIZE', '25'))  # Number of resources remediated by each execution
+
+# Sparse index holding only non-compliant results, keyed by their scan date
+NON_COMPLIANT_INDEX = 'non-compliant-index'
+
+# Earlier days searched for the latest scan when no scan_date is given, so a
+# run shortly after midnight still finds the scan of the day before
+SCAN_DATE_LOOKBACK_DAYS = int(os.environ.get('SCAN_DATE_LOOKBACK_DAYS', '1'))
+
+# StartExecution calls per second and the number of calls in flight
+START_EXECUTION_RATE = float(os.environ.get('START_EXECUTION_RATE', '25'))
+DISPATCH_CONCURRENCY = int(os.environ.get('DISPATCH_CONCURRENCY', '8'))
+
+# Step Functions execution names are at most 80 characters of this set
+EXECUTION_NAME_INVALID_CHARACTERS = re.compile(r'[^A-Za-z0-9_-]')
+
+# standard: every batch starts the Standard remediation workflow
+# express: batches of in-process eligible rules start the Express automatic workflow
+# in-process: eligible fixes are applied by this function; what fails goes to the Standard workflow
+# Everything else, including manual approvals, always uses the Standard workflow.
+REMEDIATION_MODES = ('standard', 'express', 'in-process')
+REMEDIATION_MODE = os.environ.get('REMEDIATION_MODE', 'standard')
+REMEDIATION_ROLE_NAME = os.environ.get('REMEDIATION_ROLE_NAME')
+IN_PROCESS_CONCURRENCY = int(os.environ.get('IN_PROCESS_CONCURRENCY', '16'))
+
+# When set, batches go to the priority remediation queues, most urgent first,
+# and the remediation dispatcher starts them under its in-flight limit
+REMEDIATION_QUEUE_URLS = [url for url in os.environ.get('REMEDIATION_QUEUE_URLS', '').split(',') if url]
 
 def lambda_handler(event, context):
     try:
         compliance_table = dynamodb.Table(os.environ['COMPLIANCE_RESULTS_TABLE'])
         state_machine_arn = os.environ['REMEDIATION_STATE_MACHINE_ARN']
         sns_topic_arn = os.environ['SNS_TOPIC_ARN']
+        remediation_mode = event.get('remediation_mode', REMEDIATION_MODE)
+        if remediation_mode not in REMEDIATION_MODES:
+            raise ValueError(f"Unknown remediation mode: {remediation_mode}")
+
+        # Only the latest scan reflects the current state of each resource
+        scan_date = event.get('scan_date') or latest_scan_date(compliance_table)
+        non_compliant_items = query_table(
+            compliance_table, prefetch=True,
+            IndexName=NON_COMPLIANT_INDEX,
+            KeyConditionExpression=Key('NonCompliantScanDate').eq(scan_date)
+        )
 
         total_processed = 0
-        total_remediation_started = 0
-        last_evaluated_key = None
+        groups = {}
+        for item in non_compliant_items:
+            total_processed += 1
+            add_to_group(groups, item)
 
-        while True:
-            scan_kwargs = {
-                'FilterExpression': Attr('ComplianceType').eq('NON_COMPLIANT'),
-                'Limit': BATCH_SIZE
+        if total_processed == 0:
+            logger.warning(f"No non-compliant results found for scan date {scan_date}, nothing to remediate")
+            return {
+                'statusCode': 404,
+                'body': json.dumps(f'No non-compliant results found for scan date {scan_date}')
             }
-            if last_evaluated_key:
-                scan_kwargs['ExclusiveStartKey'] = last_evaluated_key
 
-            response = compliance_table.scan(**scan_kwargs)
-            non_compliant_items = response.get('Items', [])
+        # Work this function starts or applies itself is claimed by idempotency key
+        # first, so concurrent or repeated runs do not remediate the same resources
+        idempotency = None
+        if not REMEDIATION_QUEUE_URLS or remediation_mode == 'in-process':
+            idempotency = IdempotencyStore(dynamodb.Table(os.environ['REMEDIATION_IDEMPOTENCY_TABLE']))
+
+        rules = load_rules() if groups and (remediation_mode != 'standard' or REMEDIATION_QUEUE_URLS) else {}
+        remediation_actions = in_process_actions(rules)
+        total_remediated_in_process = 0
+        if remediation_mode == 'in-process':
+            total_remediated_in_process = remediate_in_process(groups, remediation_actions, idempotency, scan_date)
 
-            for item in non_compliant_items:
-                total_processed += 1
-                if start_remediation(item, state_machine_arn):
-                    total_remediation_started += 1
+        batches = build_remediation_batches(groups, scan_date)
+        express_state_machine_arn = None
+        if remediation_mode == 'express':
+            express_state_machine_arn = os.environ['EXPRESS_REMEDIATION_STATE_MACHINE_ARN']
+            mark_automatic_batches(batches, remediation_actions)
 
-            last_evaluated_key = response.get('LastEvaluatedKey')
-            if not last_evaluated_key:
-                break
+        if REMEDIATION_QUEUE_URLS:
+            total_remediation_started = enqueue_batches(batches, rules, scan_date, state_machine_arn, express_state_machine_arn)
+            total_skipped = 0
+        else:
+            start = rate_limited(TokenBucket(START_EXECUTION_RATE), start_remediation)
+            outcomes = ConcurrentExecutor(DISPATCH_CONCURRENCY).map(
+                lambda batch: start(batch, express_state_machine_arn if 'remediationAction' in batch else state_machine_arn, idempotency),
+                batches, 'remediation executions'
+            )
+            total_remediation_started = outcomes.count('started')
+            total_skipped = outcomes.count('skipped')
 
-        logger.info(f"Processed {total_processed} non-compliant items. Started remediation for {total_remediation_started}.")
+        logger.info(f"Processed {total_processed} non-compliant items in {len(batches)} batches ({remediation_mode} mode). "
+                    f"{'Queued' if REMEDIATION_QUEUE_URLS else 'Started'} remediation for {total_remediation_started}, skipped {total_skipped} already started, "
+                    f"remediated {total_remediated_in_process} resources in-process.")
         
         if total_processed > 0:
-            send_summary_notification(sns_topic_arn, total_processed, total_remediation_started)
+            send_summary_notification(sns_topic_arn, total_processed, total_remediation_started + total_remediated_in_process)
 
         return {
             'statusCode': 200,
-            'body': json.dumps(f'Processed {total_processed} items, initiated remediation for {total_remediation_started}')
+            'body': json.dumps(f'Processed {total_processed} items, initiated remediation for {total_remediation_started + total_remediated_in_process}')
         }
     except Exception as e:
         logger.error(f"Error in Remediation Orchestrator: {str(e)}")
         send_error_notification(sns_topic_arn, str(e))
         raise
 
-def start_remediation(item, state_machine_arn):
-    for attempt in range(MAX_RETRIES):
+def latest_scan_date(compliance_table):
+    # Today, or the most recent earlier day within the lookback that has
+    # non-compliant results
+    today = datetime.now()
+    for days_back in range(SCAN_DATE_LOOKBACK_DAYS + 1):
+        scan_date = (today - timedelta(days=days_back)).strftime('%Y-%m-%d')
+        response = compliance_table.query(
+            IndexName=NON_COMPLIANT_INDEX,
+            KeyConditionExpression=Key('NonCompliantScanDate').eq(scan_date),
+            Limit=1
+        )
+        if response['Items']:
+            if days_back:
+                logger.info(f"No non-compliant results for today, using the scan of {scan_date}")
+            return scan_date
+    return today.strftime('%Y-%m-%d')
+
+def add_to_group(groups, item):
+    # Findings of the same rule and resource type in the same account and region
+    # are remediated together; resources reported by both scanners appear once
+    key = (item['RuleId'], item['ResourceType'], item['Regulation'], item.get('AccountId', ''), item.get('Region', ''))
+    groups.setdefault(key, set()).update(item.get('NonCompliantResources') or [])
+
+def new_batch(group_key, resource_ids):
+    rule_id, resource_type, regulation, account_id, region = group_key
+    batch = {
+        'ruleId': rule_id,
+        'resourceType': resource_type,
+        'resourceIds': resource_ids,
+        'regulation': regulation
+    }
+    if account_id:
+        batch['accountId'] = account_id
+    if region:
+        batch['region'] = region
+    return batch
+
+def build_remediation_batches(groups, scan_date):
+    batches = []
+    for key, resource_ids in sorted(groups.items()):
+        resource_ids = sorted(resource_ids)
+        for start in range(0, len(resource_ids), BATCH_SIZE):
+            batch = new_batch(key, resource_ids[start:start + BATCH_SIZE])
+            batch['executionName'] = execution_name(batch, scan_date)
+            batches.append(batch)
+    return batches
+
+def load_rules():
+    rules_table = dynamodb.Table('regulation-dynamo-compliance-rules')
+    registry = load_rule_registry(rules_table, lambda rule, compliance_check: None)
+    return {(rule['RuleId'], rule['Regulation']): rule for rule in registry.rules}
+
+def in_process_actions(rules):
+    # Rules whose remediation is a single idempotent call are always automatic,
+    # so they never need the approval steps of the Standard workflow
+    return {
+        key: rule['RemediationAction']
+        for key, rule in rules.items()
+        if is_in_process_remediation(rule.get('RemediationAction'))
+    }
+
+def remediate_in_process(groups, remediation_actions, idempotency, scan_date):
+    # Resources that could not be remediated and verified stay in their group
+    # and are dispatched to the Standard workflow with everything else. A group
+    # claimed by another run is left to that run entirely.
+    total_remediated = 0
+    scope_clients = {}
+    for key, resource_ids in groups.items():
+        rule_id, resource_type, regulation, account_id, region = key
+        remediation_action = remediation_actions.get((rule_id, regulation))
+        if not remediation_action or not resource_ids:
+            continue
+        claim_key = f"in-process-{execution_name(new_batch(key, sorted(resource_ids)), scan_date)}"
+        if not idempotency.claim(claim_key):
+            logger.info(f"In-process remediation of {len(resource_ids)} {resource_type} resources for {rule_id} already claimed, skipping")
+            groups[key] = set()
+            continue
+        if (account_id, region) not in scope_clients:
+            work_unit = {'account_id': account_id or None, 'region': region or None}
+            scope_clients[(account_id, region)] = create_shard_clients(work_unit, REMEDIATION_SERVICES, REMEDIATION_ROLE_NAME)
         try:
-            stepfunctions.start_execution(
-                stateMachineArn=state_machine_arn,
-                input=json.dumps({
-                    'ruleId': item['RuleId'],
-                    'resourceType': item['ResourceType'],
-                    'resourceIds': item['NonCompliantResources'],
-                    'regulation': item['Regulation']
-                })
+            remediated, failed = remediate_resources(
+                scope_clients[(account_id, region)], remediation_action, sorted(resource_ids), IN_PROCESS_CONCURRENCY
             )
-            logger.info(f"Started remediation for {item['ResourceType']} {item['NonCompliantResources']}")
-            return True
-        except ClientError as e:
-            logger.warning(f"Attempt {attempt + 1} failed to start remediation for {item['ResourceType']} {item['NonCompliantResources']}: {str(e)}")
-            if attempt == MAX_RETRIES - 1:
-                logger.error(f"Failed to start remediation after {MAX_RETRIES} attempts for {item['ResourceType']} {item['NonCompliantResources']}")
-                return False
-    return False
+        except Exception:
+            idempotency.release(claim_key)
+            raise
+        logger.info(f"Remediated {len(remediated)} {resource_type} resources in-process for {rule_id}, {len(failed)} left to the workflow")
+        groups[key] = set(failed)
+        total_remediated += len(remediated)
+        if remediated:
+            shared_inventory_cache.invalidate(cache_scope(account_id or None, region or None), REMEDIATED_SERVICES[remediation_action])
+    return total_remediated
+
+def mark_automatic_batches(batches, remediation_actions):
+    # The Express workflow starts at the automatic remediation step, so its
+    # input already carries what DetermineRemediationType would have added
+    for batch in batches:
+        remediation_action = remediation_actions.get((batch['ruleId'], batch['regulation']))
+        if remediation_action:
+            batch['remediationType'] = 'Automatic'
+            batch['remediationAction'] = remediation_action
+
+def execution_name(batch, scan_date):
+    # The same resources of the same rule get the same name on the same day; the
+    # name is also the batch's idempotency key
+    digest = hashlib.sha256(json.dumps([scan_date, batch], sort_keys=True).encode('utf-8')).hexdigest()[:24]
+    prefix = EXECUTION_NAME_INVALID_CHARACTERS.sub('-', f"{batch['ruleId']}-{scan_date}")[:55]
+    return f"{prefix}-{digest}"
+
+def enqueue_batches(batches, rules, scan_date, state_machine_arn, express_state_machine_arn):
+    # Batches are ordered by the severity of their rule, then by regulation
+    messages = []
+    for batch in batches:
+        rule = rules.get((batch['ruleId'], batch['regulation']))
+        priority = remediation_priority(batch['regulation'], rule.get('Severity') if rule else None)
+        express = 'remediationAction' in batch
+        messages.append(({
+            'input': execution_input(batch),
+            'executionName': batch['executionName'],
+            'stateMachineArn': express_state_machine_arn if express else state_machine_arn,
+            'express': express,
+            'scanDate': scan_date,
+            'attempt': 0,
+            'priority': priority
+        }, priority))
+    return SqsPriorityQueue(sqs, REMEDIATION_QUEUE_URLS).send(messages)
+
+def execution_input(batch):
+    return {key: value for key, value in batch.items() if key != 'executionName'}
+
+def start_remediation(batch, state_machine_arn, idempotency):
+    # Express workflows do not enforce unique execution names, and Standard ones
+    # accept a repeated start of a running execution as a success, so only the
+    # run that claims the execution name starts it
+    if not idempotency.claim(batch['executionName']):
+        logger.info(f"Remediation already started for {batch['resourceType']} {batch['resourceIds']}")
+        return 'skipped'
+    try:
+        stepfunctions.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=batch['executionName'],
+            input=json.dumps(execution_input(batch))
+        )
+        logger.info(f"Started remediation for {batch['resourceType']} {batch['resourceIds']}")
+        return 'started'
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ExecutionAlreadyExists':
+            logger.info(f"Remediation already started for {batch['resourceType']} {batch['resourceIds']}")
+            return 'skipped'
+        # The batch can be claimed again; throttling is retried with backoff by the executor
+        idempotency.release(batch['executionName'])
+        if is_throttling_error(e):
+            raise
+        logger.error(f"Failed to start remediation for {batch['resourceType']} {batch['resourceIds']}: {str(e)}")
+        return 'failed'
 
 def send_summary_notification(topic_arn, total_processed, total_remediated):
     try:
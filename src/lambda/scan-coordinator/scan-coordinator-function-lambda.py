@@ -0,0 +1,61 @@
+import boto3
+import json
+import os
+import logging
+from compliance_common.pagination import scan_table
+from compliance_common.rule_registry import is_rule_item
+from compliance_common.sharding import LambdaExecutor, plan_work_units, run_sharded_scan
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+dynamodb = boto3.resource('dynamodb')
+
+MAX_PARALLEL_SHARDS = int(os.environ.get('MAX_PARALLEL_SHARDS', '10'))
+MAX_RULES_PER_SHARD = int(os.environ.get('MAX_RULES_PER_SHARD', '25'))
+
+def lambda_handler(event, context):
+    try:
+        # Accounts, regions and scanners can be overridden per invocation
+        accounts = event.get('accounts') or split_setting(os.environ['SCAN_ACCOUNTS'])
+        regions = event.get('regions') or split_setting(os.environ['SCAN_REGIONS'])
+        scanner_functions = event.get('scanner_functions') or split_setting(os.environ['SCANNER_FUNCTIONS'])
+
+        rules_table = dynamodb.Table('regulation-dynamo-compliance-rules')
+        rules = [rule for rule in scan_table(
+            rules_table,
+            prefetch=True,
+            ProjectionExpression='RuleId, Regulation, ResourceType'
+        ) if is_rule_item(rule)]
+
+        work_units = plan_work_units(accounts, regions, rules, MAX_RULES_PER_SHARD)
+        logger.info(f"Split {len(rules)} rules across {len(accounts)} accounts and {len(regions)} regions into {len(work_units)} shards")
+
+        # Shards are dispatched asynchronously and write their own results, so
+        # this returns as soon as every shard is queued
+        summary = {}
+        for function_name in scanner_functions:
+            merged = run_sharded_scan(LambdaExecutor(function_name, MAX_PARALLEL_SHARDS), work_units)
+            summary[function_name] = summarize_scan(merged)
+            for failed_shard in merged['failed_shards']:
+                logger.error(f"Shard dispatch failed for {function_name}: {json.dumps(failed_shard)}")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps(summary)
+        }
+    except Exception as e:
+        logger.error(f"Error in scan coordinator: {str(e)}")
+        raise
+
+def split_setting(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+def summarize_scan(merged):
+    return {
+        'shards': merged['shard_count'],
+        'dispatched_shards': merged['pending_shards'],
+        'failed_shards': len(merged['failed_shards']),
+        'rules_evaluated': merged['rules_evaluated'],
+        'non_compliant_rules': merged['non_compliant_rules']
+    }
@@ -0,0 +1,64 @@
+def create_result(rule, non_compliant_resources):
+    # Result schema shared by every check
+    return {
+        'RuleId': rule['RuleId'],
+        'Regulation': rule['Regulation'],
+        'ResourceType': rule['ResourceType'],
+        'ComplianceType': 'NON_COMPLIANT' if non_compliant_resources else 'COMPLIANT',
+        'NonCompliantResources': non_compliant_resources
+    }
+
+class Inventory:
+    # Resources a check is evaluated against, loaded once per scan with
+    # loader(clients, resource_ids=None) and cached under the service it is
+    # read from. Inventories with a resource_id_field can be loaded for
+    # individual resources during an incremental scan.
+    def __init__(self, name, service, loader, resource_id_field=None):
+        self.name = name
+        self.service = service
+        self.loader = loader
+        self.resource_id_field = resource_id_field
+
+class CheckPlugin:
+    # check(rule, inventory) returns a create_result dict
+    def __init__(self, name, inventory, check):
+        self.name = name
+        self.inventory = inventory
+        self.check = check
+
+class CheckRegistry:
+    # A rule is bound to at most one plugin, looked up by its check type,
+    # then its checkFunction, then its ResourceType, so each rule is evaluated
+    # once per scan and rules without a plugin are never run
+    def __init__(self):
+        self.inventories = {}
+        self.plugins = {}
+        self.by_check_type = {}
+        self.by_check_function = {}
+        self.by_resource_type = {}
+
+    def add_inventory(self, name, service, loader, resource_id_field=None):
+        self.inventories[name] = Inventory(name, service, loader, resource_id_field)
+        return self.inventories[name]
+
+    def add_plugin(self, name, inventory, check, check_types=(), check_functions=(), resource_types=()):
+        if name in self.plugins:
+            raise ValueError(f"Check plugin {name} is already registered")
+        plugin = CheckPlugin(name, self.inventories[inventory], check)
+        self.plugins[name] = plugin
+        for check_type in check_types:
+            self.by_check_type[check_type] = plugin
+        for check_function in check_functions:
+            self.by_check_function[check_function] = plugin
+        for resource_type in resource_types:
+            self.by_resource_type[resource_type] = plugin
+        return plugin
+
+    def bind(self, rule, compliance_check):
+        # Usable as the bind function of load_rule_registry
+        plugin = self.by_check_type.get(compliance_check.get('type'))
+        if plugin is None and 'checkFunction' in compliance_check:
+            plugin = self.by_check_function.get(compliance_check['checkFunction'])
+        if plugin is None:
+            plugin = self.by_resource_type.get(rule['ResourceType'])
+        return plugin
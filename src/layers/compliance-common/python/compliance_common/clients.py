@@ -0,0 +1,37 @@
+import threading
+import boto3
+
+class ServiceClients:
+    # Lazily created boto3 clients bound to one session, i.e. one account and
+    # region. Attribute names map to service names, e.g. {'elb': 'elbv2'}.
+    def __init__(self, services, session=None, client_config=None):
+        self._services = services
+        self._session = session or boto3.Session()
+        self._client_config = client_config
+        self._clients = {}
+        # boto3 sessions are not thread-safe, so clients are created under a lock
+        self._lock = threading.Lock()
+
+    @property
+    def region(self):
+        return self._session.region_name
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._services:
+            raise AttributeError(name)
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = self._session.client(self._services[name], config=self._client_config)
+            return self._clients[name]
+
+def assume_role_session(account_id, region, role_name, session_name='compliance-scanner'):
+    credentials = boto3.client('sts').assume_role(
+        RoleArn=f"arn:aws:iam::{account_id}:role/{role_name}",
+        RoleSessionName=session_name
+    )['Credentials']
+    return boto3.Session(
+        aws_access_key_id=credentials['AccessKeyId'],
+        aws_secret_access_key=credentials['SecretAccessKey'],
+        aws_session_token=credentials['SessionToken'],
+        region_name=region
+    )
@@ -0,0 +1,105 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+DEFAULT_MAX_WORKERS = 16
+MAX_THROTTLE_RETRIES = 8
+BASE_BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 20
+
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'SlowDown'
+}
+
+def is_throttling_error(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+class AdaptiveBackoff:
+    # Shared by all workers of a run, so throttling seen by one worker slows
+    # every worker down; the delay halves again on each successful call.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._delay = 0
+
+    def wait(self):
+        with self._lock:
+            delay = self._delay
+        if delay:
+            time.sleep(random.uniform(delay / 2, delay))
+
+    def on_throttle(self):
+        with self._lock:
+            self._delay = min(max(self._delay * 2, BASE_BACKOFF_SECONDS), MAX_BACKOFF_SECONDS)
+
+    def on_success(self):
+        with self._lock:
+            self._delay = self._delay / 2 if self._delay > BASE_BACKOFF_SECONDS else 0
+
+class ConcurrentExecutor:
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_retries=MAX_THROTTLE_RETRIES):
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._backoff = AdaptiveBackoff()
+        self.calls = 0
+        self.throttled = 0
+        self.elapsed = 0
+
+    @property
+    def calls_per_second(self):
+        return self.calls / self.elapsed if self.elapsed > 0 else 0
+
+    def map(self, func, items, description='calls'):
+        items = list(items)
+        self._backoff = AdaptiveBackoff()
+        self.calls = 0
+        self.throttled = 0
+        start = time.monotonic()
+        if not items:
+            results = []
+        elif self.max_workers == 1 or len(items) == 1:
+            results = [self._call_with_backoff(func, item) for item in items]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+                # map() yields results in input order, matching the serial loop
+                results = list(pool.map(lambda item: self._call_with_backoff(func, item), items))
+        self.elapsed = time.monotonic() - start
+        logger.info(f"Completed {self.calls} {description} in {self.elapsed:.2f}s "
+                    f"({self.calls_per_second:.1f} calls/s, {self.throttled} throttled, {self.max_workers} workers)")
+        return results
+
+    def _call_with_backoff(self, func, item):
+        attempt = 0
+        while True:
+            self._backoff.wait()
+            try:
+                result = func(item)
+            except ClientError as e:
+                if not is_throttling_error(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.throttled += 1
+                self._backoff.on_throttle()
+                time.sleep(random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt)))
+                continue
+            self._backoff.on_success()
+            with self._lock:
+                self.calls += 1
+            return result
+
+def run_concurrently(func, items, max_workers=DEFAULT_MAX_WORKERS, description='calls'):
+    return ConcurrentExecutor(max_workers=max_workers).map(func, items, description)
@@ -0,0 +1,33 @@
+import time
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Attr
+
+# A claimed key can be claimed again once it is this old
+DEFAULT_CLAIM_TTL_SECONDS = 24 * 3600
+
+class IdempotencyStore:
+    # Claims units of work by idempotency key with a conditional put, so only
+    # the first of several callers, concurrent or not, goes on to do the work.
+    # Claims expire through the table's ExpiresAt TTL; expired claims that
+    # DynamoDB has not deleted yet can be claimed again.
+    def __init__(self, table, ttl_seconds=DEFAULT_CLAIM_TTL_SECONDS, clock=time.time):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+    def claim(self, key, **attributes):
+        now = int(self.clock())
+        try:
+            self.table.put_item(
+                Item={**attributes, 'IdempotencyKey': key, 'ClaimedAt': now, 'ExpiresAt': now + self.ttl_seconds},
+                ConditionExpression=Attr('IdempotencyKey').not_exists() | Attr('ExpiresAt').lt(now)
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def release(self, key):
+        # Lets the work be claimed again after it failed to start
+        self.table.delete_item(Key={'IdempotencyKey': key})
@@ -0,0 +1,106 @@
+import json
+from boto3.dynamodb.conditions import Key
+
+CHANGE_MESSAGE_TYPES = {
+    'ConfigurationItemChangeNotification',
+    'OversizedConfigurationItemChangeNotification'
+}
+
+DELETED_STATUSES = {'ResourceDeleted', 'ResourceDeletedNotRecorded'}
+
+# AWS Config resource types that regulation files refer to by another name
+RESOURCE_TYPE_ALIASES = {
+    'AWS::EC2::Volume': 'AWS::EBS::Volume',
+    'AWS::ElasticLoadBalancingV2::LoadBalancer': 'AWS::ELB::LoadBalancer',
+    'AWS::ElasticLoadBalancing::LoadBalancer': 'AWS::ELB::LoadBalancer'
+}
+
+def is_change_event(event):
+    return bool(parse_change_events(event))
+
+def parse_change_events(event):
+    # Accepts an EventBridge Config change event, an SNS or SQS batch of Config
+    # notifications, or an inventory diff of the form {'changes': [...]}.
+    # Repeated changes to the same resource collapse into the latest one.
+    changes = {}
+    for change in _iter_changes(event):
+        key = (change['accountId'], change['region'], change['resourceType'], change['resourceId'])
+        changes[key] = change
+    return list(changes.values())
+
+def _iter_changes(event):
+    if not isinstance(event, dict):
+        return
+    if 'changes' in event:
+        for change in event['changes']:
+            yield _normalize_change(
+                change['resourceType'],
+                change['resourceId'],
+                change.get('resourceName'),
+                change.get('accountId'),
+                change.get('region'),
+                change.get('deleted', False)
+            )
+    elif 'detail' in event:
+        yield from _iter_changes(event['detail'])
+    elif event.get('messageType') in CHANGE_MESSAGE_TYPES:
+        item = event.get('configurationItem') or event.get('configurationItemSummary') or {}
+        if item.get('resourceType') and item.get('resourceId'):
+            yield _normalize_change(
+                item['resourceType'],
+                item['resourceId'],
+                item.get('resourceName'),
+                item.get('awsAccountId'),
+                item.get('awsRegion'),
+                item.get('configurationItemStatus') in DELETED_STATUSES
+            )
+    for record in event.get('Records', []):
+        if 'Sns' in record:
+            yield from _iter_changes(json.loads(record['Sns']['Message']))
+        elif 'body' in record:
+            yield from _iter_changes(json.loads(record['body']))
+
+def _normalize_change(resource_type, resource_id, resource_name, account_id, region, deleted):
+    return {
+        'resourceType': resource_type,
+        'ruleResourceType': RESOURCE_TYPE_ALIASES.get(resource_type, resource_type),
+        'resourceId': resource_id,
+        'resourceName': resource_name or resource_id,
+        'accountId': account_id,
+        'region': region,
+        'deleted': bool(deleted)
+    }
+
+def group_changes_by_scope(changes, role_name=None):
+    # Without a scan role every change is evaluated with the scanner's own
+    # clients, matching the unsharded full scan; otherwise each account and
+    # region becomes a shard work unit.
+    if not role_name:
+        return [(None, changes)]
+    groups = {}
+    for change in changes:
+        groups.setdefault((change['accountId'], change['region']), []).append(change)
+    return [
+        ({'account_id': account_id, 'region': region}, scoped_changes)
+        for (account_id, region), scoped_changes in groups.items()
+    ]
+
+def load_last_result(table, result_id):
+    response = table.query(
+        KeyConditionExpression=Key('ResultId').eq(result_id),
+        ScanIndexForward=False,
+        Limit=1
+    )
+    return response['Items'][0] if response['Items'] else None
+
+def merge_resource_changes(previous_non_compliant, changed_ids, non_compliant_ids):
+    # Resources that changed are dropped from the previous state and re-added
+    # only if they are still non-compliant; everything else is carried over.
+    changed_ids = set(changed_ids)
+    merged = [resource_id for resource_id in previous_non_compliant if resource_id not in changed_ids]
+    merged_ids = set(merged)
+    for resource_id in non_compliant_ids:
+        if resource_id not in merged_ids:
+            merged.append(resource_id)
+            merged_ids.add(resource_id)
+    return merged
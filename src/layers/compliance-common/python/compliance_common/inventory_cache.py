@@ -0,0 +1,163 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import zlib
+import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from compliance_common.pagination import query_table
+
+logger = logging.getLogger()
+
+# Seconds a cached inventory stays valid, by ServiceClients attribute name
+DEFAULT_TTL_SECONDS = 300
+SERVICE_TTL_SECONDS = {
+    'ec2': 300,
+    'rds': 600,
+    'elb': 600,
+    'redshift': 600,
+    'ssm': 600,
+    'secrets_manager': 600,
+    'config': 600,
+    's3': 900,
+    'kms': 900,
+    'cloudtrail': 1800,
+    'iam': 3600
+}
+
+# With a durable tier, in-process entries older than this are revalidated by
+# comparing their ETag with the durable item's, so invalidations made by other
+# functions are seen without transferring the inventory again
+MEMORY_REVALIDATE_SECONDS = 60
+
+# Leaves room for the other attributes within DynamoDB's 400 KB item limit
+MAX_DURABLE_VALUE_BYTES = 350 * 1024
+
+# Account part of the key for the function's own account
+SELF_ACCOUNT = 'self'
+
+def cache_scope(account_id=None, region=None):
+    return (account_id or SELF_ACCOUNT, region or boto3.Session().region_name)
+
+class InventoryCache:
+    # Read-through cache of resource inventories keyed by (account, region,
+    # service, call). The in-process tier survives between invocations of a warm
+    # container; the optional DynamoDB tier is shared by every function using
+    # the same table. Values must be JSON serialisable (datetimes become strings).
+    def __init__(self, table=None, ttls=None, clock=time.time):
+        self.table = table
+        self.ttls = dict(SERVICE_TTL_SECONDS, **(ttls or {}))
+        self.clock = clock
+        self._memory = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'memory_hits': 0, 'revalidated_hits': 0, 'durable_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def log_stats(self):
+        hits = self.stats['memory_hits'] + self.stats['revalidated_hits'] + self.stats['durable_hits']
+        logger.info(f"Inventory cache: {hits} hits ({self.stats['memory_hits']} in-process, "
+                    f"{self.stats['revalidated_hits']} revalidated, {self.stats['durable_hits']} durable), "
+                    f"{self.stats['misses']} misses, {self.stats['invalidations']} invalidations")
+        self.reset_stats()
+
+    def get(self, scope, service, call, loader):
+        key = (*scope, service, call)
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry and entry['expires_at'] > now:
+            if self.table is None or now - entry['checked_at'] < MEMORY_REVALIDATE_SECONDS:
+                self._count('memory_hits')
+                return entry['value']
+            if self._read_durable_etag(key, now) == entry['etag']:
+                entry['checked_at'] = now
+                self._count('revalidated_hits')
+                return entry['value']
+
+        item = self._read_durable(key, now) if self.table is not None else None
+        if item:
+            value = json.loads(zlib.decompress(item['Value'].value))
+            self._remember(key, value, item['ETag'], int(item['ExpiresAt']), now)
+            self._count('durable_hits')
+            return value
+
+        self._count('misses')
+        serialised = json.dumps(loader(), sort_keys=True, default=str).encode('utf-8')
+        value = json.loads(serialised)
+        etag = hashlib.sha256(serialised).hexdigest()[:32]
+        expires_at = now + self.ttls.get(service, DEFAULT_TTL_SECONDS)
+        self._remember(key, value, etag, expires_at, now)
+        if self.table is not None:
+            self._write_durable(key, zlib.compress(serialised), etag, expires_at)
+        return value
+
+    def invalidate(self, scope, service, call=None):
+        # Drops one cached call, or every call of the service, for the scope
+        with self._lock:
+            for key in [key for key in self._memory if key[:3] == (*scope, service) and call in (None, key[3])]:
+                del self._memory[key]
+        self._count('invalidations')
+        if self.table is None:
+            return
+        partition = durable_partition(scope, service)
+        try:
+            if call is not None:
+                self.table.delete_item(Key={'Scope': partition, 'Call': call})
+                return
+            items = query_table(self.table, KeyConditionExpression=Key('Scope').eq(partition), ProjectionExpression='#call', ExpressionAttributeNames={'#call': 'Call'})
+            with self.table.batch_writer() as batch:
+                for item in items:
+                    batch.delete_item(Key={'Scope': partition, 'Call': item['Call']})
+        except ClientError as e:
+            logger.warning(f"Failed to invalidate cached {service} inventory for {scope}: {str(e)}")
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _remember(self, key, value, etag, expires_at, now):
+        with self._lock:
+            self._memory[key] = {'value': value, 'etag': etag, 'expires_at': expires_at, 'checked_at': now}
+
+    # A cache that cannot be read or written only costs the API calls it would
+    # have saved, so DynamoDB errors are logged rather than raised
+
+    def _read_durable_etag(self, key, now):
+        item = self._get_durable_item(key, ProjectionExpression='ETag, ExpiresAt')
+        return item['ETag'] if item and int(item['ExpiresAt']) > now else None
+
+    def _read_durable(self, key, now):
+        item = self._get_durable_item(key)
+        return item if item and int(item['ExpiresAt']) > now else None
+
+    def _get_durable_item(self, key, **kwargs):
+        account_id, region, service, call = key
+        try:
+            return self.table.get_item(Key={'Scope': durable_partition((account_id, region), service), 'Call': call}, **kwargs).get('Item')
+        except ClientError as e:
+            logger.warning(f"Failed to read cached {service} {call} inventory: {str(e)}")
+            return None
+
+    def _write_durable(self, key, compressed, etag, expires_at):
+        account_id, region, service, call = key
+        if len(compressed) > MAX_DURABLE_VALUE_BYTES:
+            logger.info(f"{service} {call} inventory is {len(compressed)} bytes compressed, keeping it in-process only")
+            return
+        try:
+            self.table.put_item(Item={
+                'Scope': durable_partition((account_id, region), service),
+                'Call': call,
+                'Value': compressed,
+                'ETag': etag,
+                # Also the table's TTL attribute, so expired inventories are removed
+                'ExpiresAt': int(expires_at)
+            })
+        except ClientError as e:
+            logger.warning(f"Failed to write cached {service} {call} inventory: {str(e)}")
+
+def durable_partition(scope, service):
+    return '#'.join(str(part) for part in (*scope, service))
@@ -0,0 +1,72 @@
+import json
+import time
+from compliance_common.concurrency import ConcurrentExecutor
+
+# PutMetricData accepts up to 1000 metrics per request
+MAX_METRICS_PER_CALL = 1000
+
+DEFAULT_PUBLISH_WORKERS = 4
+
+CATEGORY_DIMENSIONS = {
+    'compliance_by_regulation': 'Regulation',
+    'compliance_by_resource_type': 'ResourceType'
+}
+
+def compliance_rate(compliant, non_compliant):
+    total = compliant + non_compliant
+    return (compliant / total) * 100 if total > 0 else 0
+
+def build_compliance_metrics(data):
+    # The undimensioned TotalResourcesScanned and ComplianceRate metrics keep
+    # their original names, so existing alarms and dashboards keep working
+    metric_data = [
+        {'MetricName': 'TotalResourcesScanned', 'Value': data['total_resources_scanned'], 'Unit': 'Count'},
+        {'MetricName': 'ComplianceRate', 'Value': compliance_rate(data['compliant_resources'], data['non_compliant_resources']), 'Unit': 'Percent'},
+        {'MetricName': 'NonCompliantResources', 'Value': data['non_compliant_resources'], 'Unit': 'Count'}
+    ]
+    for category, dimension_name in CATEGORY_DIMENSIONS.items():
+        for value, counts in sorted(data[category].items()):
+            dimensions = [{'Name': dimension_name, 'Value': value}]
+            metric_data.extend([
+                {'MetricName': 'ComplianceRate', 'Dimensions': dimensions, 'Value': compliance_rate(counts['compliant'], counts['non_compliant']), 'Unit': 'Percent'},
+                {'MetricName': 'CompliantResources', 'Dimensions': dimensions, 'Value': counts['compliant'], 'Unit': 'Count'},
+                {'MetricName': 'NonCompliantResources', 'Dimensions': dimensions, 'Value': counts['non_compliant'], 'Unit': 'Count'}
+            ])
+    return metric_data
+
+def batch_metrics(metric_data, batch_size=MAX_METRICS_PER_CALL):
+    return [metric_data[start:start + batch_size] for start in range(0, len(metric_data), batch_size)]
+
+def publish_metric_batches(cloudwatch, namespace, metric_data, max_workers=DEFAULT_PUBLISH_WORKERS):
+    # Sends the metrics in as few PutMetricData calls as possible, concurrently
+    batches = batch_metrics(metric_data)
+    ConcurrentExecutor(max_workers).map(
+        lambda batch: cloudwatch.put_metric_data(Namespace=namespace, MetricData=batch),
+        batches,
+        'PutMetricData calls'
+    )
+    return len(batches)
+
+def emit_embedded_metrics(namespace, metric_data, write=print):
+    # Embedded Metric Format: CloudWatch extracts the metrics from the function's
+    # log lines, so no API calls are made. One line is written per dimension set.
+    timestamp = int(time.time() * 1000)
+    lines = {}
+    for metric in metric_data:
+        dimensions = tuple((dimension['Name'], dimension['Value']) for dimension in metric.get('Dimensions', []))
+        line = lines.setdefault(dimensions, {
+            '_aws': {
+                'Timestamp': timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [[name for name, _ in dimensions]],
+                    'Metrics': []
+                }]
+            },
+            **dict(dimensions)
+        })
+        line['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': metric['MetricName'], 'Unit': metric['Unit']})
+        line[metric['MetricName']] = metric['Value']
+    for line in lines.values():
+        write(json.dumps(line))
+    return len(lines)
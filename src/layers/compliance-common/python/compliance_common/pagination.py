@@ -0,0 +1,95 @@
+import threading
+from queue import Queue, Empty, Full
+import jmespath
+
+# How long the prefetch thread waits before re-checking whether the consumer stopped
+PREFETCH_POLL_SECONDS = 0.5
+
+_DONE = object()
+
+class _PrefetchError:
+    def __init__(self, error):
+        self.error = error
+
+def paginate(client, operation, result_key, page_size=None, prefetch=False, **kwargs):
+    # Streams the items selected by result_key (a JMESPath expression such as
+    # 'Reservations[].Instances[]') page by page, so only the current page,
+    # plus the next one when prefetching, is held in memory.
+    for page in iterate_pages(client, operation, page_size=page_size, prefetch=prefetch, **kwargs):
+        yield from jmespath.search(result_key, page) or []
+
+def iterate_pages(client, operation, page_size=None, prefetch=False, **kwargs):
+    if client.can_paginate(operation):
+        if page_size:
+            kwargs['PaginationConfig'] = {'PageSize': page_size}
+        pages = client.get_paginator(operation).paginate(**kwargs)
+    else:
+        # Operations without a paginator return everything in one response
+        pages = iter([getattr(client, operation)(**kwargs)])
+    return prefetch_pages(pages) if prefetch else pages
+
+def scan_table(table, page_size=None, prefetch=False, **kwargs):
+    for page in iterate_table_pages(table.scan, page_size=page_size, prefetch=prefetch, **kwargs):
+        yield from page['Items']
+
+def query_table(table, page_size=None, prefetch=False, **kwargs):
+    for page in iterate_table_pages(table.query, page_size=page_size, prefetch=prefetch, **kwargs):
+        yield from page['Items']
+
+def iterate_table_pages(operation, page_size=None, prefetch=False, **kwargs):
+    pages = _table_pages(operation, page_size, **kwargs)
+    return prefetch_pages(pages) if prefetch else pages
+
+def _table_pages(operation, page_size, **kwargs):
+    if page_size:
+        kwargs['Limit'] = page_size
+    while True:
+        response = operation(**kwargs)
+        yield response
+        last_evaluated_key = response.get('LastEvaluatedKey')
+        if not last_evaluated_key:
+            break
+        kwargs['ExclusiveStartKey'] = last_evaluated_key
+
+def prefetch_pages(pages):
+    # Fetches the next page on a background thread while the caller processes
+    # the current one. The queue holds a single page to keep memory bounded.
+    queue = Queue(maxsize=1)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=PREFETCH_POLL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not put(page):
+                    return
+        except Exception as e:
+            put(_PrefetchError(e))
+            return
+        put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=PREFETCH_POLL_SECONDS)
+            except Empty:
+                if not thread.is_alive() and queue.empty():
+                    break
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _PrefetchError):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,32 @@
+import threading
+import time
+
+class TokenBucket:
+    # Allows bursts of up to capacity calls and a sustained rate of rate calls
+    # per second across all threads sharing the bucket
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+def rate_limited(bucket, func):
+    def call(*args, **kwargs):
+        bucket.acquire()
+        return func(*args, **kwargs)
+    return call
@@ -0,0 +1,64 @@
+import logging
+from botocore.exceptions import ClientError
+from compliance_common.concurrency import ConcurrentExecutor, is_throttling_error
+
+logger = logging.getLogger()
+
+# Services used by the in-process remediations, as ServiceClients attribute names
+REMEDIATION_SERVICES = {
+    's3': 's3',
+    'kms': 'kms'
+}
+
+DEFAULT_REMEDIATION_WORKERS = 16
+
+def enable_s3_bucket_encryption(clients, bucket_name):
+    clients.s3.put_bucket_encryption(
+        Bucket=bucket_name,
+        ServerSideEncryptionConfiguration={
+            'Rules': [{'ApplyServerSideEncryptionByDefault': {'SSEAlgorithm': 'AES256'}}]
+        }
+    )
+    rules = clients.s3.get_bucket_encryption(Bucket=bucket_name)['ServerSideEncryptionConfiguration']['Rules']
+    return bool(rules)
+
+def cancel_kms_key_deletion(clients, key_id):
+    # A key whose deletion is cancelled is left disabled
+    clients.kms.cancel_key_deletion(KeyId=key_id)
+    clients.kms.enable_key(KeyId=key_id)
+    return clients.kms.describe_key(KeyId=key_id)['KeyMetadata']['KeyState'] == 'Enabled'
+
+# Automatic remediations that are a single idempotent API call per resource,
+# keyed by the rules' RemediationAction. These are applied and verified by the
+# remediation orchestrator itself instead of one workflow execution per batch.
+IN_PROCESS_REMEDIATIONS = {
+    'EnableS3BucketEncryption': enable_s3_bucket_encryption,
+    'CancelKeyDeletion': cancel_kms_key_deletion
+}
+
+# Service whose cached inventories a remediation makes stale
+REMEDIATED_SERVICES = {
+    'EnableS3BucketEncryption': 's3',
+    'CancelKeyDeletion': 'kms'
+}
+
+def is_in_process_remediation(remediation_action):
+    return remediation_action in IN_PROCESS_REMEDIATIONS
+
+def remediate_resources(clients, remediation_action, resource_ids, max_workers=DEFAULT_REMEDIATION_WORKERS):
+    # Returns the resources that were remediated and verified, and those that were not
+    remediate = IN_PROCESS_REMEDIATIONS[remediation_action]
+
+    def remediate_resource(resource_id):
+        try:
+            return remediate(clients, resource_id)
+        except ClientError as e:
+            if is_throttling_error(e):
+                raise
+            logger.warning(f"{remediation_action} failed for {resource_id}: {str(e)}")
+            return False
+
+    verified = ConcurrentExecutor(max_workers).map(remediate_resource, resource_ids, f"{remediation_action} remediations")
+    remediated = [resource_id for resource_id, ok in zip(resource_ids, verified) if ok]
+    failed = [resource_id for resource_id, ok in zip(resource_ids, verified) if not ok]
+    return remediated, failed
@@ -0,0 +1,202 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+
+# Lower ranks are remediated first: severity decides, the regulation breaks ties
+SEVERITY_RANKS = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+DEFAULT_SEVERITY = 'medium'
+
+REGULATION_RANKS = {
+    'PCI DSS': 0,
+    'HIPAA': 1,
+    'GDPR': 2,
+    'CCPA': 3,
+    'GLBA': 4,
+    'FISMA': 5,
+    'NIST 800-53': 6,
+    'ISO 27001': 7,
+    'FERPA': 8,
+    'SOX': 9
+}
+
+PRIORITY_LEVELS = len(SEVERITY_RANKS) * (len(REGULATION_RANKS) + 1)
+
+# Messages received this many times without being deleted are dead-lettered
+DEFAULT_MAX_RECEIVE_COUNT = 5
+
+# SendMessageBatch accepts up to 10 messages per request
+MAX_MESSAGES_PER_CALL = 10
+
+# SQS delays messages by at most 15 minutes
+MAX_DELAY_SECONDS = 900
+
+# Long polling wait on every tier but the lowest. A short poll samples only
+# some SQS servers and can come back empty while a tier still holds messages,
+# which would hand its capacity to less urgent tiers.
+RECEIVE_WAIT_SECONDS = 1
+
+# Step Functions execution names are at most 80 characters
+MAX_EXECUTION_NAME_LENGTH = 80
+
+def remediation_priority(regulation, severity=None):
+    severity_rank = SEVERITY_RANKS.get((severity or DEFAULT_SEVERITY).lower(), SEVERITY_RANKS[DEFAULT_SEVERITY])
+    return severity_rank * (len(REGULATION_RANKS) + 1) + REGULATION_RANKS.get(regulation, len(REGULATION_RANKS))
+
+def retry_execution_name(execution_name, attempt):
+    # Standard execution names cannot be reused, so each retry gets its own
+    if attempt == 0:
+        return execution_name
+    suffix = f"-retry{attempt}"
+    return execution_name[:MAX_EXECUTION_NAME_LENGTH - len(suffix)] + suffix
+
+class QueueMessage:
+    def __init__(self, body, receipt_handle, receive_count, tier):
+        self.body = body
+        self.receipt_handle = receipt_handle
+        self.receive_count = receive_count
+        self.tier = tier
+
+class SqsPriorityQueue:
+    # One SQS queue per priority tier, most urgent first; priorities are
+    # spread evenly over the tiers. Receiving drains higher tiers before lower
+    # ones. A received message stays invisible, and so counts as in flight,
+    # until it is deleted or its visibility timeout expires; delayed messages
+    # count as in flight too. Each queue's redrive policy moves messages
+    # received too often to the dead-letter queue, so work that has to wait is
+    # sent again with a delay rather than received over and over.
+    def __init__(self, sqs, queue_urls, dead_letter_queue_url=None, wait_seconds=RECEIVE_WAIT_SECONDS):
+        self.sqs = sqs
+        self.queue_urls = list(queue_urls)
+        self.dead_letter_queue_url = dead_letter_queue_url
+        self.wait_seconds = wait_seconds
+
+    def tier(self, priority):
+        return min(max(priority, 0) * len(self.queue_urls) // PRIORITY_LEVELS, len(self.queue_urls) - 1)
+
+    def send(self, messages, delay_seconds=0):
+        # messages: (body, priority) pairs
+        by_tier = {}
+        for body, priority in messages:
+            by_tier.setdefault(self.tier(priority), []).append(json.dumps(body))
+        for tier, bodies in by_tier.items():
+            for start in range(0, len(bodies), MAX_MESSAGES_PER_CALL):
+                entries = [
+                    {'Id': str(index), 'MessageBody': body, 'DelaySeconds': min(delay_seconds, MAX_DELAY_SECONDS)}
+                    for index, body in enumerate(bodies[start:start + MAX_MESSAGES_PER_CALL])
+                ]
+                response = self.sqs.send_message_batch(QueueUrl=self.queue_urls[tier], Entries=entries)
+                if response.get('Failed'):
+                    raise RuntimeError(f"Failed to enqueue {len(response['Failed'])} remediation messages: {response['Failed'][0].get('Message')}")
+        return len(messages)
+
+    def receive(self, max_messages, visibility_timeout):
+        messages = []
+        for tier, queue_url in enumerate(self.queue_urls):
+            wait_seconds = self.wait_seconds if tier < len(self.queue_urls) - 1 else 0
+            while len(messages) < max_messages:
+                response = self.sqs.receive_message(
+                    QueueUrl=queue_url,
+                    MaxNumberOfMessages=min(MAX_MESSAGES_PER_CALL, max_messages - len(messages)),
+                    VisibilityTimeout=visibility_timeout,
+                    WaitTimeSeconds=wait_seconds,
+                    AttributeNames=['ApproximateReceiveCount']
+                )
+                received = response.get('Messages', [])
+                if not received:
+                    break
+                messages.extend(
+                    QueueMessage(json.loads(message['Body']), message['ReceiptHandle'],
+                                 int(message['Attributes']['ApproximateReceiveCount']), tier)
+                    for message in received
+                )
+        return messages
+
+    def delete(self, message):
+        self.sqs.delete_message(QueueUrl=self.queue_urls[message.tier], ReceiptHandle=message.receipt_handle)
+
+    def dead_letter(self, message, reason):
+        self.sqs.send_message(
+            QueueUrl=self.dead_letter_queue_url,
+            MessageBody=json.dumps(dict(message.body, deadLetterReason=reason))
+        )
+        self.delete(message)
+
+    def in_flight_count(self):
+        # Approximate: SQS updates these counters with a short delay
+        in_flight = 0
+        for queue_url in self.queue_urls:
+            attributes = self.sqs.get_queue_attributes(
+                QueueUrl=queue_url,
+                AttributeNames=['ApproximateNumberOfMessagesNotVisible', 'ApproximateNumberOfMessagesDelayed']
+            )['Attributes']
+            in_flight += int(attributes['ApproximateNumberOfMessagesNotVisible']) + int(attributes['ApproximateNumberOfMessagesDelayed'])
+        return in_flight
+
+class LocalPriorityQueue:
+    # In-memory stand-in for SqsPriorityQueue with exact priority order, the
+    # same visibility timeout and dead-letter behaviour, and an injectable clock
+    def __init__(self, max_receive_count=DEFAULT_MAX_RECEIVE_COUNT, clock=time.monotonic):
+        self.max_receive_count = max_receive_count
+        self.clock = clock
+        self.dead_letters = []
+        self._ready = []
+        self._delayed = []
+        self._in_flight = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def send(self, messages, delay_seconds=0):
+        with self._lock:
+            for body, priority in messages:
+                entry = (priority, next(self._sequence), json.loads(json.dumps(body)), 0)
+                if delay_seconds > 0:
+                    self._delayed.append((entry, self.clock() + delay_seconds))
+                else:
+                    heapq.heappush(self._ready, entry)
+        return len(messages)
+
+    def receive(self, max_messages, visibility_timeout):
+        with self._lock:
+            self._release_expired()
+            messages = []
+            while self._ready and len(messages) < max_messages:
+                priority, sequence, body, receive_count = heapq.heappop(self._ready)
+                receipt_handle = f"{sequence}-{receive_count + 1}"
+                self._in_flight[receipt_handle] = (priority, sequence, body, receive_count + 1, self.clock() + visibility_timeout)
+                messages.append(QueueMessage(body, receipt_handle, receive_count + 1, priority))
+            return messages
+
+    def delete(self, message):
+        with self._lock:
+            self._in_flight.pop(message.receipt_handle, None)
+
+    def dead_letter(self, message, reason):
+        with self._lock:
+            if self._in_flight.pop(message.receipt_handle, None):
+                self.dead_letters.append(dict(message.body, deadLetterReason=reason))
+
+    def in_flight_count(self):
+        with self._lock:
+            self._release_expired()
+            return len(self._in_flight) + len(self._delayed)
+
+    def ready_count(self):
+        with self._lock:
+            self._release_expired()
+            return len(self._ready)
+
+    def _release_expired(self):
+        now = self.clock()
+        for entry, visible_at in [delayed for delayed in self._delayed if delayed[1] <= now]:
+            self._delayed.remove((entry, visible_at))
+            heapq.heappush(self._ready, entry)
+        for receipt_handle, (priority, sequence, body, receive_count, visible_at) in list(self._in_flight.items()):
+            if visible_at > now:
+                continue
+            del self._in_flight[receipt_handle]
+            if receive_count >= self.max_receive_count:
+                self.dead_letters.append(dict(body, deadLetterReason=f"received {receive_count} times"))
+            else:
+                heapq.heappush(self._ready, (priority, sequence, body, receive_count))
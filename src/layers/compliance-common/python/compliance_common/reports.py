@@ -0,0 +1,42 @@
+from boto3.dynamodb.conditions import Attr, Key
+from compliance_common.pagination import query_table, scan_table
+
+# Reports are looked up through an index with a constant partition key per
+# report type and the report timestamp as sort key, so the newest report is the
+# first item of a descending query and a date range is a single range query
+REPORT_LOOKUP_INDEX = 'ReportTypeTimestampIndex'
+DAILY_REPORT_TYPE = 'daily'
+
+def get_latest_report(table, report_type=DAILY_REPORT_TYPE):
+    response = table.query(
+        IndexName=REPORT_LOOKUP_INDEX,
+        KeyConditionExpression=Key('report_type').eq(report_type),
+        ScanIndexForward=False,
+        Limit=1
+    )
+    return response['Items'][0] if response['Items'] else None
+
+def query_reports(table, start_time, end_time, report_type=DAILY_REPORT_TYPE):
+    return query_table(
+        table,
+        IndexName=REPORT_LOOKUP_INDEX,
+        KeyConditionExpression=Key('report_type').eq(report_type) &
+            Key('timestamp').between(start_time.isoformat(), end_time.isoformat())
+    )
+
+def report_type_from_id(report_id):
+    # Report ids have the form '<type>_report_<date>', e.g. 'daily_report_20261018'
+    return report_id.split('_report_')[0] if '_report_' in report_id else DAILY_REPORT_TYPE
+
+def backfill_report_types(table):
+    # Migration for reports stored before the lookup index existed: sets
+    # report_type on every report missing it so the index picks it up
+    updated = 0
+    for item in scan_table(table, FilterExpression=Attr('report_type').not_exists(), ProjectionExpression='report_id, #ts', ExpressionAttributeNames={'#ts': 'timestamp'}):
+        table.update_item(
+            Key={'report_id': item['report_id'], 'timestamp': item['timestamp']},
+            UpdateExpression='SET report_type = :report_type',
+            ExpressionAttributeValues={':report_type': report_type_from_id(item['report_id'])}
+        )
+        updated += 1
+    return updated
@@ -0,0 +1,95 @@
+import logging
+import threading
+import zlib
+from datetime import datetime
+from queue import Queue
+
+logger = logging.getLogger()
+
+# Key attributes of COMPLIANCE_RESULTS_TABLE
+RESULT_KEY_ATTRIBUTES = ['ResultId', 'ScanDate']
+
+# Each scan date's results are spread over this many read shards, keyed
+# '<ScanDate>#<shard>' in read-shard-index, so a day can be read by parallel
+# queries even though a scan run stamps all its results with one timestamp
+RESULT_READ_SHARDS = 16
+
+# Results waiting to be written; a full queue makes the scanner wait for DynamoDB
+MAX_PENDING_RESULTS = 1000
+
+_DONE = object()
+
+def build_result_id(result, source):
+    scope = [result[attribute] for attribute in ('AccountId', 'Region') if result.get(attribute)]
+    return '#'.join([source, *scope, result['Regulation'], result['RuleId']])
+
+def read_shard_key(scan_date, shard):
+    return f"{scan_date}#{shard:02d}"
+
+def result_read_shard(result_id):
+    # crc32 rather than hash() so every process assigns the same shard
+    return zlib.crc32(result_id.encode('utf-8')) % RESULT_READ_SHARDS
+
+def build_result_item(result, source, scan_time):
+    # The key depends only on the scanner, shard account/region, regulation,
+    # rule and scan date, so re-running a scan on the same day overwrites its
+    # earlier results.
+    item = dict(result)
+    item['ResultId'] = build_result_id(result, source)
+    item['ScanDate'] = scan_time.strftime('%Y-%m-%d')
+    item['timestamp'] = scan_time.isoformat()
+    item['Source'] = source
+    item['ReadShard'] = read_shard_key(item['ScanDate'], result_read_shard(item['ResultId']))
+    # Keys the sparse non-compliant index; a later compliant result for the same
+    # key replaces the whole item and so drops out of the index
+    if item.get('ComplianceType') == 'NON_COMPLIANT':
+        item['NonCompliantScanDate'] = item['ScanDate']
+    return item
+
+class ResultsWriter:
+    # Streams results into DynamoDB on a background thread while the scan is
+    # still running. batch_writer groups puts into BatchWriteItem calls of up
+    # to 25 items and re-sends any UnprocessedItems until they are written.
+    def __init__(self, table, source, scan_time=None):
+        self.table = table
+        self.source = source
+        self.scan_time = scan_time or datetime.now()
+        self.written = 0
+        self._queue = Queue(maxsize=MAX_PENDING_RESULTS)
+        self._error = None
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error and exc_type is None:
+            raise self._error
+        logger.info(f"Wrote {self.written} compliance results to {self.table.name}")
+        return False
+
+    def write(self, result):
+        if self._error:
+            raise self._error
+        self._queue.put(build_result_item(result, self.source, self.scan_time))
+
+    def _drain(self):
+        done = False
+        try:
+            with self.table.batch_writer(overwrite_by_pkeys=RESULT_KEY_ATTRIBUTES) as batch:
+                while not done:
+                    item = self._queue.get()
+                    if item is _DONE:
+                        done = True
+                        continue
+                    batch.put_item(Item=item)
+                    self.written += 1
+        except Exception as e:
+            logger.error(f"Error writing compliance results: {str(e)}")
+            self._error = e
+            # Keep draining so the scanner never blocks on a full queue
+            while not done:
+                done = self._queue.get() is _DONE
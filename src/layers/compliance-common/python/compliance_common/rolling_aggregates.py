@@ -0,0 +1,239 @@
+import hashlib
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from compliance_common.concurrency import ConcurrentExecutor
+from compliance_common.pagination import query_table
+
+# Counter items are partitioned by period and sorted by dimension, so one query
+# returns every counter of that period. Each result is counted once per
+# granularity: hour 'H#2026-10-18T10', day 'D#2026-10-18', ISO week
+# 'W#2026-W42' and month 'M#2026-10'.
+HOUR_PERIOD_PREFIX = 'H#'
+DAY_PERIOD_PREFIX = 'D#'
+WEEK_PERIOD_PREFIX = 'W#'
+MONTH_PERIOD_PREFIX = 'M#'
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+TOTAL_DIMENSION = 'ALL'
+REGULATION_DIMENSION_PREFIX = 'Regulation#'
+RESOURCE_TYPE_DIMENSION_PREFIX = 'ResourceType#'
+
+# Rollup cube cells, e.g. 'Slice#GDPR|AWS::S3::Bucket|123456789012'. Results
+# of unsharded scans carry no AccountId and are kept under an empty account.
+# The prefix sorts after the dimensions above, so those can be read without
+# reading the cells.
+CELL_DIMENSION_PREFIX = 'Slice#'
+CELL_SEPARATOR = '|'
+CELL_FIELDS = ('Regulation', 'ResourceType', 'AccountId')
+
+# Each counter item remembers the last batch applied to it in one of this many
+# marker attributes ('Batch000' to 'Batch255'), chosen by the batch token. A
+# retried batch skips the counters it already updated, while the markers keep
+# hot items such as the monthly 'ALL' counter at a fixed size.
+BATCH_MARKER_SLOTS = 256
+
+# Counter updates of a batch sent at the same time
+APPLY_CONCURRENCY = 16
+
+_deserializer = TypeDeserializer()
+
+def hour_period(timestamp):
+    # timestamp is an ISO string such as '2026-10-18T10:15:00'
+    return HOUR_PERIOD_PREFIX + timestamp[:13]
+
+def period_key(granularity, moment):
+    if granularity == 'hour':
+        return hour_period(moment.isoformat())
+    if granularity == 'day':
+        return DAY_PERIOD_PREFIX + moment.strftime('%Y-%m-%d')
+    if granularity == 'week':
+        year, week, _ = moment.isocalendar()
+        return f"{WEEK_PERIOD_PREFIX}{year}-W{week:02d}"
+    if granularity == 'month':
+        return MONTH_PERIOD_PREFIX + moment.strftime('%Y-%m')
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+def period_start(granularity, moment):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'hour':
+        return moment
+    moment = moment.replace(hour=0)
+    if granularity == 'day':
+        return moment
+    if granularity == 'week':
+        return moment - timedelta(days=moment.weekday())
+    if granularity == 'month':
+        return moment.replace(day=1)
+    raise ValueError(f"Unknown rollup granularity: {granularity}")
+
+def next_period_start(granularity, moment):
+    start = period_start(granularity, moment)
+    if granularity == 'hour':
+        return start + timedelta(hours=1)
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+def cell_dimension(result):
+    return CELL_DIMENSION_PREFIX + CELL_SEPARATOR.join(str(result.get(field, '')) for field in CELL_FIELDS)
+
+def parse_cell_dimension(dimension):
+    return tuple(dimension[len(CELL_DIMENSION_PREFIX):].split(CELL_SEPARATOR))
+
+def is_result_image(image):
+    return bool(image) and all(field in image for field in ('ComplianceType', 'Regulation', 'ResourceType', 'timestamp'))
+
+def compliance_field(compliance_type):
+    # Matches aggregate_results: anything other than COMPLIANT counts as non-compliant
+    return 'compliant' if compliance_type == 'COMPLIANT' else 'non_compliant'
+
+def result_counter_keys(result):
+    moment = datetime.fromisoformat(result['timestamp'])
+    dimensions = [
+        TOTAL_DIMENSION,
+        REGULATION_DIMENSION_PREFIX + result['Regulation'],
+        RESOURCE_TYPE_DIMENSION_PREFIX + result['ResourceType'],
+        cell_dimension(result)
+    ]
+    return [(period_key(granularity, moment), dimension) for granularity in GRANULARITIES for dimension in dimensions]
+
+def deserialize_image(image):
+    return {name: _deserializer.deserialize(value) for name, value in (image or {}).items()}
+
+def compute_deltas(records):
+    # Nets the counter changes of a batch of stream records: the old image of a
+    # modified or removed result is subtracted and the new image is added, so
+    # overwriting a result moves it between counters instead of double counting.
+    deltas = {}
+    for record in records:
+        images = record.get('dynamodb', {})
+        for image, delta in ((images.get('OldImage'), -1), (images.get('NewImage'), 1)):
+            result = deserialize_image(image)
+            if not is_result_image(result):
+                continue
+            field = compliance_field(result['ComplianceType'])
+            for key in result_counter_keys(result):
+                counters = deltas.setdefault(key, {'compliant': 0, 'non_compliant': 0})
+                counters[field] += delta
+    return {key: counters for key, counters in deltas.items() if any(counters.values())}
+
+def batch_token(records):
+    # The same batch retried by Lambda produces the same token
+    event_ids = ','.join(sorted(record.get('eventID', '') for record in records))
+    return hashlib.sha256(event_ids.encode()).hexdigest()[:32]
+
+def batch_marker(token):
+    return f"Batch{int(token, 16) % BATCH_MARKER_SLOTS:03d}"
+
+def apply_deltas(client, table_name, deltas, token):
+    # Every counter is a separate UpdateItem ADD rather than part of a
+    # transaction, so batches of parallel stream shards updating the same hot
+    # counters never conflict, and a failed batch is retried counter by counter
+    executor = ConcurrentExecutor(APPLY_CONCURRENCY)
+    updated = executor.map(lambda key: apply_delta(client, table_name, key, deltas[key], token), sorted(deltas), 'counter updates')
+    return updated.count(True)
+
+def apply_delta(client, table_name, key, counters, token):
+    period, dimension = key
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key={'Period': {'S': period}, 'Dimension': {'S': dimension}},
+            UpdateExpression='ADD compliant :compliant, non_compliant :non_compliant SET #batch = :token',
+            ConditionExpression='attribute_not_exists(#batch) OR #batch <> :token',
+            ExpressionAttributeNames={'#batch': batch_marker(token)},
+            ExpressionAttributeValues={
+                ':compliant': {'N': str(counters['compliant'])},
+                ':non_compliant': {'N': str(counters['non_compliant'])},
+                ':token': {'S': token}
+            }
+        )
+        return True
+    except ClientError as e:
+        # Already applied by an earlier attempt of the same batch
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def cover_periods(start_time, end_time):
+    # Splits [start_time, end_time), rounded down to whole hours, into the
+    # fewest whole months, weeks, days and hours, coarsest first. Every result
+    # is counted in each granularity, so summing the covering periods is exact.
+    # A 24 hour window therefore yields the 24 complete hours before end_time.
+    cursor = period_start('hour', start_time)
+    end = period_start('hour', end_time)
+    periods = []
+    while cursor < end:
+        for granularity in reversed(GRANULARITIES):
+            if period_start(granularity, cursor) == cursor and next_period_start(granularity, cursor) <= end:
+                periods.append(period_key(granularity, cursor))
+                cursor = next_period_start(granularity, cursor)
+                break
+    return periods
+
+def query_rollup(table, start_time, end_time, regulation=None, group_by=CELL_FIELDS):
+    # Sums cube cells over an arbitrary range, grouped by any subset of
+    # CELL_FIELDS. Passing a regulation limits each query to its cells.
+    prefix = CELL_DIMENSION_PREFIX + (regulation + CELL_SEPARATOR if regulation else '')
+    positions = [CELL_FIELDS.index(field) for field in group_by]
+    rollup = {}
+    for period in cover_periods(start_time, end_time):
+        cells = query_table(table, KeyConditionExpression=Key('Period').eq(period) & Key('Dimension').begins_with(prefix))
+        for item in cells:
+            cell = parse_cell_dimension(item['Dimension'])
+            counters = rollup.setdefault(tuple(cell[position] for position in positions), {'compliant': 0, 'non_compliant': 0})
+            counters['compliant'] += int(item.get('compliant', 0))
+            counters['non_compliant'] += int(item.get('non_compliant', 0))
+    return {key: counters for key, counters in rollup.items() if any(counters.values())}
+
+def query_rollup_series(table, start_time, end_time, granularity, regulation=None, group_by=CELL_FIELDS):
+    # Trend over the range with one entry per hour, day, week or month; the
+    # first and last buckets only cover the part inside the range
+    series = []
+    bucket_start = start_time
+    while bucket_start < end_time:
+        bucket_end = min(next_period_start(granularity, bucket_start), end_time)
+        series.append((period_key(granularity, bucket_start), query_rollup(table, bucket_start, bucket_end, regulation, group_by)))
+        bucket_start = bucket_end
+    return series
+
+def read_rolling_aggregate(table, start_time, end_time):
+    # Returns the same structure as the aggregator's aggregate_results
+    aggregated_data = {
+        'total_resources_scanned': 0,
+        'compliant_resources': 0,
+        'non_compliant_resources': 0,
+        'compliance_by_regulation': {},
+        'compliance_by_resource_type': {}
+    }
+    for period in cover_periods(start_time, end_time):
+        key_condition = Key('Period').eq(period) & Key('Dimension').lt(CELL_DIMENSION_PREFIX)
+        for item in query_table(table, KeyConditionExpression=key_condition):
+            add_counter_item(aggregated_data, item['Dimension'], int(item.get('compliant', 0)), int(item.get('non_compliant', 0)))
+    return aggregated_data
+
+def add_counter_item(aggregated_data, dimension, compliant, non_compliant):
+    if dimension == TOTAL_DIMENSION:
+        aggregated_data['total_resources_scanned'] += compliant + non_compliant
+        aggregated_data['compliant_resources'] += compliant
+        aggregated_data['non_compliant_resources'] += non_compliant
+        return
+    if dimension.startswith(REGULATION_DIMENSION_PREFIX):
+        category_dict = aggregated_data['compliance_by_regulation']
+        key = dimension[len(REGULATION_DIMENSION_PREFIX):]
+    elif dimension.startswith(RESOURCE_TYPE_DIMENSION_PREFIX):
+        category_dict = aggregated_data['compliance_by_resource_type']
+        key = dimension[len(RESOURCE_TYPE_DIMENSION_PREFIX):]
+    else:
+        return
+    # Counters that netted out to zero are left out, as aggregate_results would
+    if not compliant and not non_compliant:
+        return
+    if key not in category_dict:
+        category_dict[key] = {'compliant': 0, 'non_compliant': 0}
+    category_dict[key]['compliant'] += compliant
+    category_dict[key]['non_compliant'] += non_compliant
@@ -0,0 +1,103 @@
+import json
+import logging
+import time
+from compliance_common.pagination import scan_table
+
+logger = logging.getLogger()
+
+# Marker item the regulation parser rewrites whenever it changes the rules
+# table. Scanners compare its Version with their cached registry.
+RULESET_VERSION_KEY = {'RuleId': '__ruleset__', 'Regulation': '__version__'}
+
+# Per-regulation manifest items, keyed by this RuleId and the regulation name,
+# record the file version and a hash over the regulation's rules
+REGULATION_MANIFEST_RULE_ID = '__manifest__'
+
+MARKER_RULE_IDS = {RULESET_VERSION_KEY['RuleId'], REGULATION_MANIFEST_RULE_ID}
+
+# Fallback refresh interval when no version marker has been written yet
+RULES_CACHE_TTL_SECONDS = 300
+
+REQUIRED_CHECK_FIELDS = {
+    'AWSConfig': 'configRuleName',
+    'CustomCheck': 'checkFunction'
+}
+
+def is_rule_item(item):
+    return item['RuleId'] not in MARKER_RULE_IDS
+
+def regulation_manifest_key(regulation):
+    return {'RuleId': REGULATION_MANIFEST_RULE_ID, 'Regulation': regulation}
+
+class CompiledRule:
+    # A rules table item with its ComplianceCheck parsed and validated once
+    # and bound to the scanner's check handler (None when it has none).
+    # Item attributes stay readable as compiled_rule['RuleId'].
+    def __init__(self, rule, compliance_check, handler):
+        self.rule = rule
+        self.compliance_check = compliance_check
+        self.check_type = compliance_check.get('type')
+        self.handler = handler
+
+    def __getitem__(self, key):
+        return self.rule[key]
+
+    def get(self, key, default=None):
+        return self.rule.get(key, default)
+
+class RuleRegistry:
+    def __init__(self, rules, bind, version=None):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.rules = []
+        # Rules bound to a check handler; the others are left out of scans
+        self.evaluable = []
+        self.by_resource_type = {}
+        self.by_regulation = {}
+        self.by_check_type = {}
+        for rule in rules:
+            compiled_rule = compile_rule(rule, bind)
+            if compiled_rule is None:
+                continue
+            self.rules.append(compiled_rule)
+            if compiled_rule.handler is not None:
+                self.evaluable.append(compiled_rule)
+            self.by_resource_type.setdefault(compiled_rule['ResourceType'], []).append(compiled_rule)
+            self.by_regulation.setdefault(compiled_rule['Regulation'], []).append(compiled_rule)
+            self.by_check_type.setdefault(compiled_rule.check_type, []).append(compiled_rule)
+
+    def is_current(self, version):
+        if version is not None or self.version is not None:
+            return version == self.version
+        return time.monotonic() - self.loaded_at < RULES_CACHE_TTL_SECONDS
+
+def compile_rule(rule, bind):
+    try:
+        compliance_check = json.loads(rule['ComplianceCheck'])
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning(f"Skipping rule {rule.get('RuleId')}: invalid ComplianceCheck ({str(e)})")
+        return None
+    required_field = REQUIRED_CHECK_FIELDS.get(compliance_check.get('type'))
+    if required_field and required_field not in compliance_check:
+        logger.warning(f"Skipping rule {rule['RuleId']}: {compliance_check['type']} check without {required_field}")
+        return None
+    return CompiledRule(rule, compliance_check, bind(rule, compliance_check))
+
+def get_ruleset_version(table):
+    response = table.get_item(Key=RULESET_VERSION_KEY, ConsistentRead=True)
+    return response.get('Item', {}).get('Version')
+
+# Registries survive between invocations of a warm Lambda container
+_registries = {}
+
+def load_rule_registry(table, bind):
+    version = get_ruleset_version(table)
+    registry = _registries.get(table.name)
+    if registry and registry.is_current(version):
+        return registry
+    rules = [rule for rule in scan_table(table, prefetch=True) if is_rule_item(rule)]
+    registry = RuleRegistry(rules, bind, version)
+    _registries[table.name] = registry
+    logger.info(f"Compiled {len(registry.rules)} rules (ruleset version {version}), "
+                f"{len(registry.rules) - len(registry.evaluable)} without a check")
+    return registry
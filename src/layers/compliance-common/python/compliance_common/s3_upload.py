@@ -0,0 +1,133 @@
+# S3 requires every part but the last to be at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+class PartReader:
+    # Read-only file-like view of a slice of written data, so a whole part is
+    # uploaded straight from the caller's buffer; botocore reads it in chunks
+    # and seeks back to retry
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        chunk = bytes(self._view[self._position:end])
+        self._position = end
+        return chunk
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        base = {0: 0, 1: self._position, 2: len(self._view)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+class MultipartUploadSink:
+    # File-like object that uploads what is written to it as S3 multipart upload
+    # parts as soon as a part fills up. Whole parts are uploaded from the written
+    # data itself and only a partial part is copied into the buffer, so even a
+    # single large write costs at most one part of extra memory. Output smaller
+    # than one part is sent with a single PutObject on close. Leaving a with
+    # block through an exception aborts the upload; nothing is uploaded unless
+    # close() is called.
+    def __init__(self, s3, bucket, key, part_size=DEFAULT_PART_SIZE, **upload_args):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.upload_args = upload_args
+        self.upload_id = None
+        self.parts = []
+        self._buffer = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed upload")
+        view = memoryview(data).cast('B')
+        size = len(view)
+        self._position += size
+        start = 0
+        if self._buffer:
+            # Top up the buffered part first
+            start = min(self.part_size - len(self._buffer), size)
+            self._buffer += view[:start]
+            if len(self._buffer) < self.part_size:
+                return size
+            self._upload_part(self._buffer)
+            self._buffer = bytearray()
+        while size - start >= self.part_size:
+            self._upload_part(PartReader(view[start:start + self.part_size]))
+            start += self.part_size
+        self._buffer += view[start:]
+        return size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=self._buffer, **self.upload_args)
+            else:
+                if self._buffer:
+                    self._upload_part(self._buffer)
+                self.s3.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={'Parts': self.parts}
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self.closed = True
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+        self._buffer = bytearray()
+        self.closed = True
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def _upload_part(self, body):
+        if self.upload_id is None:
+            response = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, **self.upload_args)
+            self.upload_id = response['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
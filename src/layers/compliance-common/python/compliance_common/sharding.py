@@ -0,0 +1,155 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import boto3
+from botocore.config import Config
+from compliance_common.clients import ServiceClients, assume_role_session
+from compliance_common.results_writer import build_result_id
+
+logger = logging.getLogger()
+
+DEFAULT_MAX_PARALLEL_SHARDS = 10
+DEFAULT_MAX_RULES_PER_SHARD = 25
+
+def plan_work_units(accounts, regions, rules, max_rules_per_unit=DEFAULT_MAX_RULES_PER_SHARD):
+    # Rules are grouped by ResourceType so rules sharing an inventory land in
+    # the same shard and the scanner's fetch plan can still dedupe them.
+    rule_groups = {}
+    for rule in rules:
+        rule_groups.setdefault(rule['ResourceType'], []).append(
+            {'RuleId': rule['RuleId'], 'Regulation': rule['Regulation']}
+        )
+
+    work_units = []
+    for account_id in accounts:
+        for region in regions:
+            for rule_group, rule_keys in sorted(rule_groups.items()):
+                for start in range(0, len(rule_keys), max_rules_per_unit):
+                    work_units.append({
+                        'account_id': account_id,
+                        'region': region,
+                        'rule_group': rule_group,
+                        'rules': rule_keys[start:start + max_rules_per_unit]
+                    })
+    return work_units
+
+def select_shard_rules(rules, work_unit):
+    if 'rules' not in work_unit:
+        return list(rules)
+    wanted = {(key['RuleId'], key['Regulation']) for key in work_unit['rules']}
+    return [rule for rule in rules if (rule['RuleId'], rule['Regulation']) in wanted]
+
+def create_shard_clients(work_unit, services, role_name=None, client_config=None):
+    account_id = work_unit.get('account_id')
+    if account_id and role_name:
+        session = assume_role_session(account_id, work_unit.get('region'), role_name)
+    else:
+        session = boto3.Session(region_name=work_unit.get('region'))
+    return ServiceClients(services, session=session, client_config=client_config)
+
+def tag_shard_result(result, work_unit):
+    if result and work_unit:
+        if work_unit.get('account_id'):
+            result['AccountId'] = work_unit['account_id']
+        if work_unit.get('region'):
+            result['Region'] = work_unit['region']
+    return result
+
+def summarize_shard_results(results, source):
+    # Shards write their results through ResultsWriter and report only counts
+    # and result keys, so shard outputs stay small however many resources an
+    # account has
+    return {
+        'rules_evaluated': len(results),
+        'non_compliant_rules': sum(1 for result in results if result['ComplianceType'] == 'NON_COMPLIANT'),
+        'result_ids': [build_result_id(result, source) for result in results]
+    }
+
+def _shard_output(work_unit, summary=None, error=None):
+    # summary is None while a dispatched shard is still running
+    return {'work_unit': work_unit, 'summary': summary, 'error': error}
+
+class LocalExecutor:
+    # Runs scan_shard(work_unit) -> shard summary in this process, on threads or
+    # on a process pool. scan_shard must be a module-level function for processes.
+    def __init__(self, scan_shard, max_workers=DEFAULT_MAX_PARALLEL_SHARDS, use_processes=False):
+        self.scan_shard = scan_shard
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+
+    def run(self, work_units):
+        if not work_units:
+            return []
+        pool_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        with pool_class(max_workers=min(self.max_workers, len(work_units))) as pool:
+            futures = [pool.submit(self.scan_shard, work_unit) for work_unit in work_units]
+            outputs = []
+            for work_unit, future in zip(work_units, futures):
+                try:
+                    outputs.append(_shard_output(work_unit, summary=future.result()))
+                except Exception as e:
+                    logger.error(f"Shard {work_unit.get('account_id')}/{work_unit.get('region')} failed: {str(e)}")
+                    outputs.append(_shard_output(work_unit, error=str(e)))
+            return outputs
+
+class LambdaExecutor:
+    # Dispatches {'shard': work_unit} to a scanner function as an asynchronous
+    # Event invocation per work unit and returns once every shard is queued,
+    # so the caller never waits for a shard to finish. Shards write their
+    # results to the results table; Lambda retries failed shards and hands
+    # them to the function's on-failure destination.
+    def __init__(self, function_name, max_workers=DEFAULT_MAX_PARALLEL_SHARDS, lambda_client=None):
+        self.function_name = function_name
+        self.max_workers = max_workers
+        self.lambda_client = lambda_client or boto3.client('lambda', config=Config(max_pool_connections=max_workers))
+
+    def run(self, work_units):
+        if not work_units:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(work_units))) as pool:
+            return list(pool.map(self._invoke, work_units))
+
+    def _invoke(self, work_unit):
+        try:
+            response = self.lambda_client.invoke(
+                FunctionName=self.function_name,
+                InvocationType='Event',
+                Payload=json.dumps({'shard': work_unit})
+            )
+            if response['StatusCode'] != 202:
+                raise RuntimeError(f"Unexpected status {response['StatusCode']} dispatching shard")
+            return _shard_output(work_unit)
+        except Exception as e:
+            logger.error(f"Shard {work_unit.get('account_id')}/{work_unit.get('region')} failed: {str(e)}")
+            return _shard_output(work_unit, error=str(e))
+
+def merge_shard_outputs(shard_outputs):
+    # Result ids are unique per account, region, regulation and rule, so the
+    # merged set is the union of the ids the shards wrote
+    merged = {'rules_evaluated': 0, 'non_compliant_rules': 0}
+    result_ids = set()
+    failed_shards = []
+    pending_shards = 0
+    for output in shard_outputs:
+        if output['error']:
+            failed_shards.append({'work_unit': output['work_unit'], 'error': output['error']})
+        elif output['summary'] is None:
+            pending_shards += 1
+        else:
+            merged['rules_evaluated'] += output['summary']['rules_evaluated']
+            merged['non_compliant_rules'] += output['summary']['non_compliant_rules']
+            result_ids.update(output['summary']['result_ids'])
+    merged.update({
+        'shard_count': len(shard_outputs),
+        'failed_shards': failed_shards,
+        'pending_shards': pending_shards,
+        'result_ids': sorted(result_ids)
+    })
+    return merged
+
+def run_sharded_scan(executor, work_units):
+    logger.info(f"Dispatching {len(work_units)} scan shards")
+    merged = merge_shard_outputs(executor.run(work_units))
+    logger.info(f"Merged {len(merged['result_ids'])} results from {merged['shard_count']} shards, "
+                f"{merged['pending_shards']} still running, {len(merged['failed_shards'])} failed")
+    return merged
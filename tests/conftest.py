@@ -0,0 +1,32 @@
+import importlib.util
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_PATH = os.path.join(ROOT, 'src', 'layers', 'compliance-common', 'python')
+LAMBDA_ROOT = os.path.join(ROOT, 'src', 'lambda')
+
+if LAYER_PATH not in sys.path:
+    sys.path.insert(0, LAYER_PATH)
+
+def _load_lambda(name):
+    path = os.path.join(LAMBDA_ROOT, name, f"{name}-function-lambda.py")
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture
+def load_lambda():
+    # Lambda files are named '<name>-function-lambda.py', so they are loaded by path
+    return _load_lambda
+
+@pytest.fixture
+def no_aws_settings(monkeypatch, tmp_path):
+    # No region, credentials or config files, as on a developer machine without AWS set up
+    for name in list(os.environ):
+        if name.startswith('AWS_'):
+            monkeypatch.delenv(name)
+    monkeypatch.setenv('AWS_CONFIG_FILE', str(tmp_path / 'missing-config'))
+    monkeypatch.setenv('AWS_SHARED_CREDENTIALS_FILE', str(tmp_path / 'missing-credentials'))
@@ -0,0 +1,68 @@
+import json
+from boto3.dynamodb.types import TypeSerializer
+
+serializer = TypeSerializer()
+
+def stream_record(event_id, new_result=None, old_result=None):
+    images = {}
+    if new_result:
+        images['NewImage'] = {name: serializer.serialize(value) for name, value in new_result.items()}
+    if old_result:
+        images['OldImage'] = {name: serializer.serialize(value) for name, value in old_result.items()}
+    return {'eventID': event_id, 'dynamodb': images}
+
+def result(compliance_type, timestamp='2026-10-18T10:15:00'):
+    return {'ComplianceType': compliance_type, 'Regulation': 'GDPR', 'ResourceType': 'AWS::S3::Bucket', 'timestamp': timestamp}
+
+def test_replay_runs_without_aws_settings(load_lambda, no_aws_settings, tmp_path):
+    stream = load_lambda('compliance-aggregates-stream')
+    batch = {'Records': [
+        stream_record('1', result('COMPLIANT')),
+        stream_record('2', result('NON_COMPLIANT')),
+        stream_record('3', result('COMPLIANT'), old_result=result('NON_COMPLIANT'))
+    ]}
+    path = tmp_path / 'batch.json'
+    path.write_text(json.dumps(batch))
+
+    client = stream.LocalAggregatesClient()
+    # The same batch recorded twice is applied once, as with a retried Lambda batch
+    stream.replay_batches([str(path), str(path)], client, None)
+
+    assert client.counters[('H#2026-10-18T10', 'ALL')] == {'compliant': 2, 'non_compliant': 0}
+    assert client.counters[('D#2026-10-18', 'Regulation#GDPR')] == {'compliant': 2, 'non_compliant': 0}
+
+def test_a_batch_retried_after_a_conflict_counts_each_result_once(load_lambda, no_aws_settings):
+    from botocore.exceptions import ClientError
+    from compliance_common.rolling_aggregates import apply_deltas, batch_marker, batch_token, compute_deltas
+    stream = load_lambda('compliance-aggregates-stream')
+
+    class ConflictOnce(stream.LocalAggregatesClient):
+        # The first update of the hourly total fails, as when the item is busy in a transaction
+        def __init__(self):
+            super().__init__()
+            self.conflicted = False
+
+        def update_item(self, **kwargs):
+            if not self.conflicted and kwargs['Key']['Dimension']['S'] == 'ALL' and kwargs['Key']['Period']['S'].startswith('H#'):
+                self.conflicted = True
+                raise ClientError({'Error': {'Code': 'TransactionConflictException', 'Message': 'conflict'}}, 'UpdateItem')
+            return super().update_item(**kwargs)
+
+    first = [stream_record('a1', result('COMPLIANT')), stream_record('a2', result('NON_COMPLIANT'))]
+    other = [stream_record('b1', result('NON_COMPLIANT'))]
+    assert batch_marker(batch_token(first)) != batch_marker(batch_token(other))
+
+    client = ConflictOnce()
+    try:
+        apply_deltas(client, 'aggregates', compute_deltas(first), batch_token(first))
+        raise AssertionError('the conflict should fail the batch')
+    except ClientError:
+        pass
+    # A batch from another shard updates the same counters before Lambda retries the first one
+    apply_deltas(client, 'aggregates', compute_deltas(other), batch_token(other))
+    assert apply_deltas(client, 'aggregates', compute_deltas(first), batch_token(first)) >= 1
+    assert apply_deltas(client, 'aggregates', compute_deltas(first), batch_token(first)) == 0
+
+    for period in ('H#2026-10-18T10', 'D#2026-10-18', 'W#2026-W42', 'M#2026-10'):
+        assert client.counters[(period, 'ALL')] == {'compliant': 1, 'non_compliant': 2}
+        assert client.counters[(period, 'Regulation#GDPR')] == {'compliant': 1, 'non_compliant': 2}
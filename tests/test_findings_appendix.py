@@ -0,0 +1,126 @@
+import io
+from datetime import datetime
+import pytest
+
+class StubResultsTable:
+    # Pages the non-compliant items of each scan date back one at a time, ordered
+    # by ResultId. The base table also holds the (ResultId, ScanDate) keys of
+    # compliant results, which the sparse index leaves out.
+    name = 'compliance-results'
+
+    def __init__(self, items_by_date, compliant_keys=()):
+        self.items_by_date = items_by_date
+        self.keys = {(item['ResultId'], item['ScanDate']) for items in items_by_date.values() for item in items}
+        self.keys.update(compliant_keys)
+        self.meta = self
+        self.client = self
+        self.deferred = set()
+
+    def batch_get_item(self, RequestItems):
+        request = RequestItems[self.name]
+        assert len(request['Keys']) <= 100
+        keys = [(key['ResultId'], key['ScanDate']) for key in request['Keys']]
+        # DynamoDB may leave keys unprocessed; the first key of a request is, once
+        deferred = [key for key in keys[:1] if key not in self.deferred]
+        self.deferred.update(deferred)
+        response = {'Responses': {self.name: [
+            {'ResultId': result_id} for result_id, scan_date in keys
+            if (result_id, scan_date) in self.keys and (result_id, scan_date) not in deferred
+        ]}}
+        if deferred:
+            response['UnprocessedKeys'] = {self.name: dict(request, Keys=[{'ResultId': result_id, 'ScanDate': scan_date} for result_id, scan_date in deferred])}
+        return response
+
+    def query(self, IndexName, KeyConditionExpression, ExclusiveStartKey=None, **kwargs):
+        assert IndexName == 'non-compliant-index'
+        scan_date = KeyConditionExpression.get_expression()['values'][1]
+        items = sorted(self.items_by_date.get(scan_date, []), key=lambda item: item['ResultId'])
+        position = ExclusiveStartKey['position'] if ExclusiveStartKey else 0
+        response = {'Items': items[position:position + 1]}
+        if position + 1 < len(items):
+            response['LastEvaluatedKey'] = {'position': position + 1}
+        return response
+
+def result(account, rule, scan_date, resources):
+    return {
+        'ResultId': f"primary-scanner#{account}#eu-west-1#GDPR#{rule}",
+        'ScanDate': scan_date,
+        'AccountId': account,
+        'Region': 'eu-west-1',
+        'Regulation': 'GDPR',
+        'RuleId': rule,
+        'ResourceType': 'AWS::S3::Bucket',
+        'NonCompliantResources': resources
+    }
+
+@pytest.fixture
+def report_lambda(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    return load_lambda('pdf-compliance-report-generation')
+
+def test_findings_in_both_scan_dates_are_listed_once_from_the_latest_result(report_lambda):
+    table = StubResultsTable({
+        '2024-03-01': [
+            result('111111111111', 'GDPR-1', '2024-03-01', ['bucket-a', 'bucket-b']),
+            result('222222222222', 'GDPR-1', '2024-03-01', ['bucket-c'])
+        ],
+        '2024-03-02': [
+            result('111111111111', 'GDPR-1', '2024-03-02', ['bucket-b', 'bucket-b']),
+            result('111111111111', 'GDPR-2', '2024-03-02', ['bucket-a'])
+        ]
+    })
+    findings = list(report_lambda.load_findings(table, datetime(2024, 3, 1, 9), datetime(2024, 3, 2, 9)))
+    assert findings == [
+        ('111111111111', 'eu-west-1', 'GDPR', 'GDPR-1', 'AWS::S3::Bucket', 'bucket-b'),
+        ('111111111111', 'eu-west-1', 'GDPR', 'GDPR-2', 'AWS::S3::Bucket', 'bucket-a'),
+        ('222222222222', 'eu-west-1', 'GDPR', 'GDPR-1', 'AWS::S3::Bucket', 'bucket-c')
+    ]
+
+def test_appendix_tables_are_built_as_the_layout_reaches_them(report_lambda, monkeypatch):
+    monkeypatch.setattr(report_lambda, 'FINDINGS_ROWS_PER_TABLE', 50)
+    built = []
+    build_findings_tables = report_lambda.build_findings_tables
+    def tracked_tables(findings):
+        for table in build_findings_tables(findings):
+            built.append(table)
+            yield table
+    monkeypatch.setattr(report_lambda, 'build_findings_tables', tracked_tables)
+
+    consumed = []
+    def findings():
+        for index in range(500):
+            consumed.append(index)
+            yield ('111111111111', 'eu-west-1', 'GDPR', 'GDPR-1', 'AWS::S3::Bucket', f"bucket-{index:04d}")
+    doc_class = report_lambda.StreamingDocTemplate
+    class TrackedDocTemplate(doc_class):
+        def build(self, flowables, **kwargs):
+            # Only the first table exists before layout starts
+            assert len(built) == 1 and len(consumed) == 50
+            return super().build(flowables, **kwargs)
+    monkeypatch.setattr(report_lambda, 'StreamingDocTemplate', TrackedDocTemplate)
+
+    data = {
+        'total_resources_scanned': 500,
+        'compliant_resources': 0,
+        'non_compliant_resources': 500,
+        'compliance_by_regulation': {'GDPR': {'compliant': 0, 'non_compliant': 500}}
+    }
+    output = io.BytesIO()
+    report_lambda.generate_pdf_report(data, datetime(2024, 3, 2), output, findings())
+    assert len(built) == 10 and len(consumed) == 500
+    assert output.getvalue().startswith(b'%PDF')
+
+def test_results_that_became_compliant_in_a_later_scan_are_not_listed(report_lambda):
+    table = StubResultsTable({
+        '2024-03-01': [
+            result('111111111111', 'GDPR-1', '2024-03-01', ['bucket-a']),
+            result('111111111111', 'GDPR-2', '2024-03-01', ['bucket-b']),
+            result('111111111111', 'GDPR-3', '2024-03-01', ['bucket-c'])
+        ],
+        '2024-03-02': [
+            result('111111111111', 'GDPR-2', '2024-03-02', ['bucket-b'])
+        ]
+    }, compliant_keys=[('primary-scanner#111111111111#eu-west-1#GDPR#GDPR-1', '2024-03-02')])
+    findings = list(report_lambda.load_findings(table, datetime(2024, 3, 1, 9), datetime(2024, 3, 2, 9)))
+    # GDPR-1 was fixed by the second scan; GDPR-3 has not been scanned again yet
+    assert [finding[3] for finding in findings] == ['GDPR-2', 'GDPR-3']
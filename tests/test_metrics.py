@@ -0,0 +1,60 @@
+import threading
+from compliance_common.metrics import MAX_METRICS_PER_CALL, build_compliance_metrics, emit_embedded_metrics, publish_metric_batches
+
+class StubCloudWatch:
+    # Counts PutMetricData calls and the metrics each one carries
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def put_metric_data(self, Namespace, MetricData):
+        with self.lock:
+            self.calls.append(len(MetricData))
+        return {}
+
+def metrics(count):
+    return [{'MetricName': 'CompliantResources', 'Value': index, 'Unit': 'Count'} for index in range(count)]
+
+def test_1000_metrics_are_sent_in_one_call():
+    cloudwatch = StubCloudWatch()
+    assert publish_metric_batches(cloudwatch, 'Test', metrics(1000)) == 1
+    assert cloudwatch.calls == [1000]
+
+def test_1001_metrics_are_sent_in_two_calls():
+    cloudwatch = StubCloudWatch()
+    assert publish_metric_batches(cloudwatch, 'Test', metrics(MAX_METRICS_PER_CALL + 1)) == 2
+    assert sorted(cloudwatch.calls) == [1, 1000]
+
+def test_dimensioned_metrics_cover_every_regulation_and_resource_type():
+    data = {
+        'total_resources_scanned': 3,
+        'compliant_resources': 2,
+        'non_compliant_resources': 1,
+        'compliance_by_regulation': {'GDPR': {'compliant': 2, 'non_compliant': 0}, 'HIPAA': {'compliant': 0, 'non_compliant': 1}},
+        'compliance_by_resource_type': {'AWS::S3::Bucket': {'compliant': 2, 'non_compliant': 1}}
+    }
+    metric_data = build_compliance_metrics(data)
+    dimensions = {(d['Name'], d['Value']) for metric in metric_data for d in metric.get('Dimensions', [])}
+    assert dimensions == {('Regulation', 'GDPR'), ('Regulation', 'HIPAA'), ('ResourceType', 'AWS::S3::Bucket')}
+    assert len(metric_data) == 3 + 3 * 3
+
+def test_embedded_metric_format_makes_no_api_calls(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    aggregator = load_lambda('compliance-report-agregator')
+    cloudwatch = StubCloudWatch()
+    lines = []
+    monkeypatch.setattr(aggregator, 'cloudwatch', cloudwatch)
+    monkeypatch.setattr(aggregator, 'METRICS_MODE', 'emf')
+    monkeypatch.setattr(aggregator, 'emit_embedded_metrics', lambda namespace, metric_data: emit_embedded_metrics(namespace, metric_data, write=lines.append))
+
+    aggregator.publish_metrics({
+        'total_resources_scanned': 1,
+        'compliant_resources': 1,
+        'non_compliant_resources': 0,
+        'compliance_by_regulation': {'GDPR': {'compliant': 1, 'non_compliant': 0}},
+        'compliance_by_resource_type': {}
+    })
+
+    assert cloudwatch.calls == []
+    # One line for the undimensioned metrics and one for the GDPR dimension
+    assert len(lines) == 2
@@ -0,0 +1,135 @@
+import io
+import json
+from botocore.exceptions import ClientError
+import pytest
+
+REGULATION = {
+    'regulation': 'GDPR',
+    'version': '2024.1',
+    'lastUpdated': '2024-03-01',
+    'rules': [
+        {
+            'ruleId': f"GDPR-{index}",
+            'description': f"Rule {index}",
+            'resourceType': 'AWS::S3::Bucket',
+            'complianceCheck': {'type': 'AWSConfig', 'configRuleName': f"rule-{index}"},
+            'remediationAction': 'EnableBucketEncryption'
+        }
+        for index in range(30)
+    ]
+}
+
+class StubS3:
+    def get_object(self, Bucket, Key):
+        return {'Body': io.BytesIO(json.dumps(REGULATION).encode('utf-8'))}
+
+class StubBatchWriter:
+    # Sends buffered writes 25 at a time like boto3's batch writer and resends
+    # the items a request left unprocessed
+    def __init__(self, table):
+        self.table = table
+        self.buffer = []
+
+    def put_item(self, Item):
+        self.buffer.append(('put', Item))
+        if len(self.buffer) >= 25:
+            self.flush()
+
+    def delete_item(self, Key):
+        self.buffer.append(('delete', Key))
+        if len(self.buffer) >= 25:
+            self.flush()
+
+    def flush(self):
+        requests, self.buffer = self.buffer[:25], self.buffer[25:]
+        self.buffer.extend(self.table.batch_write(requests))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        while self.buffer:
+            self.flush()
+        return False
+
+class StubRulesTable:
+    # Leaves the first write of a throttled rule unprocessed and rejects its resend
+    def __init__(self, throttled_rule_ids=()):
+        self.items = {}
+        self.throttled_rule_ids = set(throttled_rule_ids)
+        self.unprocessed_rule_ids = set()
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return StubBatchWriter(self)
+
+    def batch_write(self, requests):
+        unprocessed = []
+        for action, value in requests:
+            rule_id = value['RuleId']
+            if rule_id in self.unprocessed_rule_ids:
+                raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException', 'Message': 'throttled'}}, 'BatchWriteItem')
+            if rule_id in self.throttled_rule_ids:
+                self.unprocessed_rule_ids.add(rule_id)
+                unprocessed.append((action, value))
+            else:
+                self.apply(action, value)
+        return unprocessed
+
+    def apply(self, action, value):
+        if action == 'put':
+            self.put_item(Item=value)
+        else:
+            self.items.pop((value['RuleId'], value['Regulation']), None)
+
+    def put_item(self, Item):
+        self.items[(Item['RuleId'], Item['Regulation'])] = Item
+
+    def get_item(self, Key):
+        item = self.items.get((Key['RuleId'], Key['Regulation']))
+        return {'Item': item} if item else {}
+
+    def query(self, IndexName, KeyConditionExpression):
+        regulation = KeyConditionExpression.get_expression()['values'][1]
+        return {'Items': [item for (_, item_regulation), item in self.items.items() if item_regulation == regulation]}
+
+@pytest.fixture
+def parser(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('DYNAMODB_TABLE', 'rules')
+    module = load_lambda('regulation-parser')
+    monkeypatch.setattr(module, 's3', StubS3())
+    return module
+
+def upload_event():
+    return {'Records': [{'s3': {'bucket': {'name': 'regulations'}, 'object': {'key': 'gdpr-regulations.json'}}}]}
+
+def rule_ids(table):
+    return {rule_id for rule_id, _ in table.items if rule_id.startswith('GDPR-')}
+
+def test_a_failed_rule_flush_leaves_no_manifest_so_the_upload_is_retried(parser, monkeypatch):
+    # The last rule goes out in the same request as the regulation's manifest
+    # would, is left unprocessed and its resend fails
+    table = StubRulesTable(throttled_rule_ids={'GDPR-29'})
+    monkeypatch.setattr(parser.dynamodb, 'Table', lambda name: table)
+    with pytest.raises(ClientError):
+        parser.lambda_handler(upload_event(), None)
+    assert ('__manifest__', 'GDPR') not in table.items
+    assert 'GDPR-29' not in rule_ids(table)
+
+    # Re-delivering the same upload writes the missing rule instead of skipping it
+    table.throttled_rule_ids.clear()
+    table.unprocessed_rule_ids.clear()
+    response = parser.lambda_handler(upload_event(), None)
+    assert '1 written' in json.loads(response['body'])
+    assert rule_ids(table) == {rule['ruleId'] for rule in REGULATION['rules']}
+    assert ('__manifest__', 'GDPR') in table.items
+    assert ('__ruleset__', '__version__') in table.items
+
+def test_an_unchanged_upload_is_skipped_once_its_manifest_is_written(parser, monkeypatch):
+    table = StubRulesTable()
+    monkeypatch.setattr(parser.dynamodb, 'Table', lambda name: table)
+    parser.lambda_handler(upload_event(), None)
+    version = table.items[('__ruleset__', '__version__')]['Version']
+    response = parser.lambda_handler(upload_event(), None)
+    assert '0 written' in json.loads(response['body'])
+    assert table.items[('__ruleset__', '__version__')]['Version'] == version
@@ -0,0 +1,116 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+import pytest
+from compliance_common.idempotency import IdempotencyStore
+from compliance_common.rate_limit import TokenBucket
+
+def client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+class StubIdempotencyTable:
+    # Applies the claim condition (key absent or expired) atomically, like DynamoDB
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def put_item(self, Item, ConditionExpression):
+        with self.lock:
+            existing = self.items.get(Item['IdempotencyKey'])
+            if existing and existing['ExpiresAt'] >= Item['ClaimedAt']:
+                raise client_error('ConditionalCheckFailedException', 'PutItem')
+            self.items[Item['IdempotencyKey']] = Item
+        return {}
+
+    def delete_item(self, Key):
+        with self.lock:
+            self.items.pop(Key['IdempotencyKey'], None)
+        return {}
+
+class StubStepFunctions:
+    # Express workflows accept any number of executions with the same name
+    def __init__(self, errors=()):
+        self.started = []
+        self.errors = list(errors)
+        self.lock = threading.Lock()
+
+    def start_execution(self, stateMachineArn, name, input):
+        with self.lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.started.append(name)
+        return {'executionArn': f"{stateMachineArn}:{name}"}
+
+@pytest.fixture
+def orchestrator(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('INVENTORY_CACHE_TABLE', raising=False)
+    return load_lambda('remediation-orchestrator')
+
+def batch(orchestrator, resource_ids=('bucket-a', 'bucket-b')):
+    batch = orchestrator.new_batch(('S3-ENC', 'AWS::S3::Bucket', 'GDPR', '111111111111', 'eu-west-1'), list(resource_ids))
+    batch['executionName'] = orchestrator.execution_name(batch, '2024-03-02')
+    return batch
+
+def test_token_bucket_rejects_a_rate_that_never_refills():
+    for rate in (0, -1):
+        with pytest.raises(ValueError):
+            TokenBucket(rate)
+
+def test_expired_claims_can_be_claimed_again():
+    now = [1000]
+    store = IdempotencyStore(StubIdempotencyTable(), ttl_seconds=60, clock=lambda: now[0])
+    assert store.claim('key')
+    assert not store.claim('key')
+    now[0] += 61
+    assert store.claim('key')
+
+def test_concurrent_starts_of_an_express_batch_start_one_execution(orchestrator, monkeypatch):
+    stepfunctions = StubStepFunctions()
+    monkeypatch.setattr(orchestrator, 'stepfunctions', stepfunctions)
+    idempotency = IdempotencyStore(StubIdempotencyTable())
+    work = batch(orchestrator)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(lambda _: orchestrator.start_remediation(work, 'arn:express', idempotency), range(8)))
+    assert sorted(outcomes) == ['skipped'] * 7 + ['started']
+    assert stepfunctions.started == [work['executionName']]
+
+def test_an_existing_standard_execution_is_skipped_not_started(orchestrator, monkeypatch):
+    monkeypatch.setattr(orchestrator, 'stepfunctions', StubStepFunctions([client_error('ExecutionAlreadyExists', 'StartExecution')]))
+    table = StubIdempotencyTable()
+    work = batch(orchestrator)
+    assert orchestrator.start_remediation(work, 'arn:standard', IdempotencyStore(table)) == 'skipped'
+    assert work['executionName'] in table.items
+
+def test_a_batch_that_failed_to_start_is_released(orchestrator, monkeypatch):
+    stepfunctions = StubStepFunctions([
+        client_error('ThrottlingException', 'StartExecution'),
+        client_error('InvalidExecutionInput', 'StartExecution')
+    ])
+    monkeypatch.setattr(orchestrator, 'stepfunctions', stepfunctions)
+    idempotency = IdempotencyStore(StubIdempotencyTable())
+    work = batch(orchestrator)
+    with pytest.raises(ClientError):
+        orchestrator.start_remediation(work, 'arn:standard', idempotency)
+    assert orchestrator.start_remediation(work, 'arn:standard', idempotency) == 'failed'
+    assert orchestrator.start_remediation(work, 'arn:standard', idempotency) == 'started'
+
+def test_in_process_groups_are_remediated_by_one_run(orchestrator, monkeypatch):
+    calls = []
+    def remediate_resources(clients, action, resource_ids, concurrency):
+        calls.append(resource_ids)
+        return resource_ids[:1], resource_ids[1:]
+    monkeypatch.setattr(orchestrator, 'remediate_resources', remediate_resources)
+    monkeypatch.setattr(orchestrator, 'create_shard_clients', lambda work_unit, services, role_name: object())
+    idempotency = IdempotencyStore(StubIdempotencyTable())
+    key = ('S3-ENC', 'AWS::S3::Bucket', 'GDPR', '111111111111', 'eu-west-1')
+    actions = {('S3-ENC', 'GDPR'): 'EnableS3BucketEncryption'}
+
+    first = {key: {'bucket-a', 'bucket-b'}}
+    assert orchestrator.remediate_in_process(first, actions, idempotency, '2024-03-02') == 1
+    assert first == {key: {'bucket-b'}}
+
+    second = {key: {'bucket-a', 'bucket-b'}}
+    assert orchestrator.remediate_in_process(second, actions, idempotency, '2024-03-02') == 0
+    assert second == {key: set()}
+    assert calls == [['bucket-a', 'bucket-b']]
@@ -0,0 +1,137 @@
+import threading
+import pytest
+from compliance_common.idempotency import IdempotencyStore
+from compliance_common.remediation_queue import LocalPriorityQueue, SqsPriorityQueue
+from test_remediation_dedupe import StubIdempotencyTable, client_error
+
+STATE_MACHINE_ARN = 'arn:aws:states:us-east-1:111111111111:stateMachine:RemediationWorkflow'
+EXPRESS_STATE_MACHINE_ARN = 'arn:aws:states:us-east-1:111111111111:stateMachine:AutomaticRemediationExpressWorkflow'
+
+class StubStepFunctions:
+    # Started executions stay RUNNING until a test sets their status
+    def __init__(self, start_errors=()):
+        self.started = []
+        self.statuses = {}
+        self.start_errors = list(start_errors)
+        self.lock = threading.Lock()
+
+    def start_execution(self, stateMachineArn, name, input):
+        with self.lock:
+            if self.start_errors:
+                raise self.start_errors.pop(0)
+            self.started.append(name)
+            self.statuses[name] = 'RUNNING'
+        return {'executionArn': f"{stateMachineArn}:{name}"}
+
+    def describe_execution(self, executionArn):
+        name = executionArn.rsplit(':', 1)[1]
+        with self.lock:
+            if name not in self.statuses:
+                raise client_error('ExecutionDoesNotExist', 'DescribeExecution')
+            return {'status': self.statuses[name]}
+
+class StubSqs:
+    # Every queue is empty; records how each was polled
+    def __init__(self):
+        self.polls = []
+
+    def receive_message(self, QueueUrl, WaitTimeSeconds, **kwargs):
+        self.polls.append((QueueUrl, WaitTimeSeconds))
+        return {}
+
+@pytest.fixture
+def dispatcher(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('MAX_REMEDIATION_ATTEMPTS', raising=False)
+    return load_lambda('remediation-dispatcher')
+
+@pytest.fixture
+def clock():
+    return [0]
+
+@pytest.fixture
+def queue(clock):
+    return LocalPriorityQueue(clock=lambda: clock[0])
+
+def queued(name, priority=0, express=False):
+    return ({
+        'input': {'resourceType': 'AWS::S3::Bucket', 'resourceIds': [name]},
+        'executionName': name,
+        'stateMachineArn': EXPRESS_STATE_MACHINE_ARN if express else STATE_MACHINE_ARN,
+        'express': express,
+        'scanDate': '2024-03-02',
+        'attempt': 0,
+        'priority': priority
+    }, priority)
+
+def test_more_urgent_batches_are_received_first(queue):
+    queue.send([queued('low', 30), queued('critical', 0), queued('high', 11), queued('critical-2', 0)])
+    assert [message.body['executionName'] for message in queue.receive(10, 300)] == ['critical', 'critical-2', 'high', 'low']
+
+def test_higher_tiers_are_long_polled_before_lower_ones():
+    sqs = StubSqs()
+    SqsPriorityQueue(sqs, ['high', 'medium', 'low'], 'dlq').receive(10, 300)
+    assert sqs.polls == [('high', 1), ('medium', 1), ('low', 0)]
+
+def test_in_flight_batches_hold_their_slots(dispatcher, monkeypatch, queue, clock):
+    stepfunctions = StubStepFunctions()
+    monkeypatch.setattr(dispatcher, 'stepfunctions', stepfunctions)
+    idempotency = IdempotencyStore(StubIdempotencyTable())
+    queue.send([queued(f"batch-{index}") for index in range(5)])
+
+    assert dispatcher.dispatch(queue, idempotency, max_in_flight=3) == {'started': 3}
+    assert dispatcher.dispatch(queue, idempotency, max_in_flight=3) == {}
+    assert sorted(stepfunctions.started) == ['batch-0', 'batch-1', 'batch-2']
+
+    # Running executions are checked again and keep their slots
+    clock[0] += dispatcher.EXECUTION_CHECK_SECONDS
+    assert dispatcher.dispatch(queue, idempotency, max_in_flight=3) == {'running': 3}
+    assert queue.ready_count() == 2
+
+def test_failed_executions_are_retried_then_dead_lettered(dispatcher, monkeypatch, queue, clock):
+    stepfunctions = StubStepFunctions()
+    monkeypatch.setattr(dispatcher, 'stepfunctions', stepfunctions)
+    idempotency = IdempotencyStore(StubIdempotencyTable())
+    queue.send([queued('batch')])
+
+    for attempt in range(dispatcher.MAX_ATTEMPTS):
+        assert dispatcher.dispatch(queue, idempotency) == {'started': 1}
+        stepfunctions.statuses[stepfunctions.started[-1]] = 'FAILED'
+        clock[0] += dispatcher.EXECUTION_CHECK_SECONDS
+        expected = 'retried' if attempt + 1 < dispatcher.MAX_ATTEMPTS else 'dead_lettered'
+        assert dispatcher.dispatch(queue, idempotency) == {expected: 1}
+
+    assert stepfunctions.started == ['batch', 'batch-retry1', 'batch-retry2']
+    assert [message['deadLetterReason'] for message in queue.dead_letters] == ['FAILED after 3 attempts']
+    assert queue.in_flight_count() == 0 and queue.ready_count() == 0
+
+def test_a_throttled_express_start_is_deferred_and_its_claim_released(dispatcher, monkeypatch, queue, clock):
+    stepfunctions = StubStepFunctions([client_error('ThrottlingException', 'StartExecution')])
+    monkeypatch.setattr(dispatcher, 'stepfunctions', stepfunctions)
+    table = StubIdempotencyTable()
+    queue.send([queued('batch', express=True)])
+
+    assert dispatcher.dispatch(queue, IdempotencyStore(table)) == {'deferred': 1}
+    assert table.items == {}
+    assert queue.ready_count() == 0 and queue.in_flight_count() == 1
+
+    clock[0] += 2 * dispatcher.DEFER_SECONDS
+    assert dispatcher.dispatch(queue, IdempotencyStore(table)) == {'started': 1}
+    assert stepfunctions.started == ['batch'] and 'batch' in table.items
+
+def test_duplicate_express_batches_start_one_execution(dispatcher, monkeypatch, queue):
+    stepfunctions = StubStepFunctions()
+    monkeypatch.setattr(dispatcher, 'stepfunctions', stepfunctions)
+    queue.send([queued('batch', express=True), queued('batch', express=True)])
+
+    assert dispatcher.dispatch(queue, IdempotencyStore(StubIdempotencyTable())) == {'started': 1, 'skipped': 1}
+    assert stepfunctions.started == ['batch']
+    assert queue.in_flight_count() == 0
+
+def test_the_dispatcher_requires_a_dead_letter_queue(dispatcher, monkeypatch):
+    monkeypatch.setattr(dispatcher, 'REMEDIATION_QUEUE_URLS', ['high', 'medium', 'low'])
+    monkeypatch.setattr(dispatcher, 'REMEDIATION_DLQ_URL', None)
+    monkeypatch.setattr(dispatcher, 'sqs', StubSqs())
+    with pytest.raises(ValueError, match='REMEDIATION_DLQ_URL'):
+        dispatcher.lambda_handler({}, None)
+    assert dispatcher.sqs.polls == []
@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+import pytest
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2024, 3, 2, 0, 15)
+
+class StubResultsTable:
+    # The non-compliant index, holding results only for the given scan dates
+    def __init__(self, items_by_date):
+        self.items_by_date = items_by_date
+        self.queried = []
+
+    def query(self, IndexName, KeyConditionExpression, Limit=None, **kwargs):
+        scan_date = KeyConditionExpression.get_expression()['values'][1]
+        self.queried.append(scan_date)
+        items = self.items_by_date.get(scan_date, [])
+        return {'Items': items[:Limit] if Limit else items}
+
+class StubSns:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, **kwargs):
+        self.published.append(kwargs)
+
+@pytest.fixture
+def orchestrator(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('INVENTORY_CACHE_TABLE', raising=False)
+    monkeypatch.setenv('COMPLIANCE_RESULTS_TABLE', 'results')
+    monkeypatch.setenv('REMEDIATION_STATE_MACHINE_ARN', 'arn:standard')
+    monkeypatch.setenv('SNS_TOPIC_ARN', 'arn:topic')
+    module = load_lambda('remediation-orchestrator')
+    monkeypatch.setattr(module, 'datetime', FixedDatetime)
+    monkeypatch.setattr(module, 'sns', StubSns())
+    return module
+
+def finding(resource_id):
+    return {'RuleId': 'S3-ENC', 'ResourceType': 'AWS::S3::Bucket', 'Regulation': 'GDPR', 'NonCompliantResources': [resource_id]}
+
+def test_the_latest_scan_of_the_lookback_is_used(orchestrator):
+    table = StubResultsTable({'2024-03-01': [finding('bucket-a')], '2024-02-29': [finding('bucket-b')]})
+    assert orchestrator.latest_scan_date(table) == '2024-03-01'
+    assert table.queried == ['2024-03-02', '2024-03-01']
+
+    table = StubResultsTable({'2024-03-02': [finding('bucket-a')], '2024-03-01': [finding('bucket-b')]})
+    assert orchestrator.latest_scan_date(table) == '2024-03-02'
+
+def test_a_run_without_results_warns_and_does_not_report_success(orchestrator, monkeypatch, caplog):
+    table = StubResultsTable({'2024-02-29': [finding('bucket-a')]})
+    monkeypatch.setattr(orchestrator.dynamodb, 'Table', lambda name: table)
+    response = orchestrator.lambda_handler({}, None)
+    assert response['statusCode'] == 404
+    assert '2024-03-02' in json.loads(response['body'])
+    assert any(record.levelname == 'WARNING' for record in caplog.records)
+    assert orchestrator.sns.published == []
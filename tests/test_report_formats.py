@@ -0,0 +1,65 @@
+import io
+import json
+import threading
+from botocore.exceptions import ClientError
+import pytest
+
+class StubS3:
+    # Keeps objects in memory; only the calls the report generator makes
+    def __init__(self):
+        self.objects = {}
+        self.puts = []
+        self.put_threads = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = bytes(Body)
+        self.puts.append(Key)
+        self.put_threads[Key] = threading.current_thread()
+        return {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': 'missing'}}, 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+@pytest.fixture
+def report_lambda(load_lambda, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('REPORT_BUCKET', 'reports-bucket')
+    monkeypatch.delenv('COMPLIANCE_RESULTS_TABLE', raising=False)
+    module = load_lambda('pdf-compliance-report-generation')
+    monkeypatch.setattr(module, 's3', StubS3())
+    monkeypatch.setattr(module, 'get_latest_compliance_data', lambda: {
+        'total_resources_scanned': 3,
+        'compliant_resources': 2,
+        'non_compliant_resources': 1,
+        'compliance_by_regulation': {'GDPR': {'compliant': 2, 'non_compliant': 1}},
+        'compliance_by_resource_type': {'AWS::S3::Bucket': {'compliant': 2, 'non_compliant': 1}}
+    })
+    return module
+
+def test_unchanged_reports_are_skipped_without_a_pdf(report_lambda, monkeypatch):
+    monkeypatch.setattr(report_lambda, 'REPORT_FORMATS', ['csv', 'json'])
+    report_lambda.lambda_handler({}, None)
+    stored = list(report_lambda.s3.puts)
+    assert stored[-1].endswith('/manifest.json')
+    assert sorted(key.rsplit('.', 1)[1] for key in stored[:-1]) == ['csv', 'json']
+    assert set(json.loads(report_lambda.s3.objects[stored[-1]])['reports']) == {'csv', 'json'}
+
+    response = report_lambda.lambda_handler({}, None)
+    assert 'unchanged' in response['body']
+    assert report_lambda.s3.puts == stored
+
+def test_a_newly_requested_format_renders_every_format_concurrently(report_lambda, monkeypatch):
+    monkeypatch.setattr(report_lambda, 'REPORT_FORMATS', ['csv'])
+    report_lambda.lambda_handler({}, None)
+    monkeypatch.setattr(report_lambda, 'REPORT_FORMATS', ['pdf', 'csv'])
+    report_lambda.s3.puts.clear()
+
+    report_lambda.lambda_handler({}, None)
+    pdf_key = next(key for key in report_lambda.s3.puts if key.endswith('.pdf'))
+    assert report_lambda.s3.objects[pdf_key].startswith(b'%PDF')
+    assert report_lambda.s3.put_threads[pdf_key] is not threading.main_thread()
+    assert report_lambda.s3.puts[-1].endswith('/manifest.json')
+    manifest = json.loads(report_lambda.s3.objects[report_lambda.s3.puts[-1]])
+    assert set(manifest['reports']) == {'pdf', 'csv'}
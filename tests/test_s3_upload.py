@@ -0,0 +1,126 @@
+import hashlib
+import os
+import tracemalloc
+import pytest
+from compliance_common.s3_upload import MIN_PART_SIZE, MultipartUploadSink
+
+CHUNK_SIZE = 1024 * 1024
+
+def read_body(body):
+    # Hashes a request body the way botocore handles it: byte strings as they
+    # are, file-like bodies in chunks, read twice as a checksum pass and a retry
+    if isinstance(body, (bytes, bytearray)):
+        return hashlib.sha256(body).digest(), len(body)
+    digests = []
+    for _ in range(2):
+        body.seek(0)
+        digest, size = hashlib.sha256(), 0
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+        digests.append((digest.digest(), size))
+    assert digests[0] == digests[1]
+    return digests[0]
+
+class LocalS3:
+    # Stand-in for the S3 calls of MultipartUploadSink. Only the hash and size of
+    # each body are kept, so a test can measure the sink's own memory use.
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.calls.append('put_object')
+        digest, size = read_body(Body)
+        self.objects[(Bucket, Key)] = {'parts': [digest], 'size': size, 'args': kwargs}
+        return {'ETag': digest.hex()}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self.calls.append('create_multipart_upload')
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {'key': (Bucket, Key), 'parts': {}, 'args': kwargs}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append('upload_part')
+        digest, size = read_body(Body)
+        self.uploads[UploadId]['parts'][PartNumber] = (digest, size)
+        return {'ETag': digest.hex()}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append('complete_multipart_upload')
+        upload = self.uploads.pop(UploadId)
+        parts = [upload['parts'][part['PartNumber']] for part in MultipartUpload['Parts']]
+        assert [part['ETag'] for part in MultipartUpload['Parts']] == [digest.hex() for digest, _ in parts]
+        for _, size in parts[:-1]:
+            assert size >= MIN_PART_SIZE
+        self.objects[upload['key']] = {
+            'parts': [digest for digest, _ in parts],
+            'size': sum(size for _, size in parts),
+            'args': upload['args']
+        }
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+        del self.uploads[UploadId]
+        return {}
+
+def part_digests(data, part_size):
+    return [hashlib.sha256(data[start:start + part_size]).digest() for start in range(0, len(data), part_size)]
+
+def test_output_smaller_than_a_part_is_sent_with_one_put():
+    s3 = LocalS3()
+    with MultipartUploadSink(s3, 'bucket', 'report.pdf', ContentType='application/pdf') as sink:
+        sink.write(b'%PDF-')
+        sink.write(b'1.4')
+    assert s3.calls == ['put_object']
+    assert s3.objects[('bucket', 'report.pdf')] == {
+        'parts': [hashlib.sha256(b'%PDF-1.4').digest()],
+        'size': 8,
+        'args': {'ContentType': 'application/pdf'}
+    }
+
+def test_small_and_large_writes_are_uploaded_in_order():
+    s3 = LocalS3()
+    head, body = os.urandom(1000), bytearray(os.urandom(3 * MIN_PART_SIZE + 500))
+    data = head + bytes(body)
+    with MultipartUploadSink(s3, 'bucket', 'report.pdf', part_size=MIN_PART_SIZE) as sink:
+        sink.write(head)
+        sink.write(body)
+        # The buffered tail is a copy, so the caller can reuse its buffer
+        body[-500:] = bytes(500)
+        assert sink.tell() == len(head) + len(body)
+    stored = s3.objects[('bucket', 'report.pdf')]
+    assert stored['size'] == len(data)
+    assert stored['parts'] == part_digests(data, MIN_PART_SIZE)
+    assert s3.calls.count('upload_part') == 4
+    assert s3.uploads == {}
+
+def test_large_write_uses_at_most_one_part_of_extra_memory():
+    s3 = LocalS3()
+    part_size = MIN_PART_SIZE
+    data = os.urandom(8 * part_size + 123)
+    tracemalloc.start()
+    try:
+        with MultipartUploadSink(s3, 'bucket', 'report.pdf', part_size=part_size) as sink:
+            sink.write(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    stored = s3.objects[('bucket', 'report.pdf')]
+    assert stored['parts'] == part_digests(data, part_size)
+    assert stored['size'] == len(data)
+    assert peak < part_size
+
+def test_error_inside_the_with_block_aborts_the_upload():
+    s3 = LocalS3()
+    with pytest.raises(RuntimeError):
+        with MultipartUploadSink(s3, 'bucket', 'report.pdf', part_size=MIN_PART_SIZE) as sink:
+            sink.write(os.urandom(MIN_PART_SIZE + 1))
+            raise RuntimeError('render failed')
+    assert s3.calls == ['create_multipart_upload', 'upload_part', 'abort_multipart_upload']
+    assert s3.objects == {} and s3.uploads == {}
+    with pytest.raises(ValueError):
+        sink.write(b'late')